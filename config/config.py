@@ -0,0 +1,29 @@
+
+
+# Base config
+base_url = "http://127.0.0.1:18765/"
+username = "u"
+password = "password"
+
+# name of a calendar the user already has
+calendar_name = "Personal"
+
+# a file that already exists on the server in the base directory of this user, including some text
+textfile_name = "test-textfile.txt"
+textfile_contains = "This is a textfile."
+
+# a file that will be created and deleted during the tests, make sure the file is not there before the tests
+testfile_name = "test_upload.txt"
+testfile_contains = "I am also a test."
+
+# HTTP connection settings shared by all dav_functions (optional, defaults are used if missing)
+http_pool_size = 10  # connections kept open per host
+http_retries = 3  # retries of failed requests (connection errors, 429/502/503/504)
+http_backoff_factor = 0.5  # seconds, doubled after every retry
+http_timeout = 30  # seconds for connecting and reading
+
+# Advanced variables, these should not change as long as the test is used on Nextcloud (or nextcloud changes something)
+webdav_url = base_url + "remote.php/dav/files/" + username
+caldav_url = "http://127.0.0.1:18767/cal/"
+carddav_url = "http://127.0.0.1:18766/remote.php/dav/addressbooks/users/u/contacts"
+uploads_url = base_url + "remote.php/dav/uploads/" + username
@@ -16,7 +16,17 @@ textfile_contains = "This is a textfile."
 testfile_name = "test_upload.txt"
 testfile_contains = "I am also a test."
 
+# HTTP connection settings shared by all dav_functions (optional, defaults are used if missing)
+http_pool_size = 10  # connections kept open per host
+http_retries = 3  # retries of failed requests (connection errors, 429/502/503/504)
+http_backoff_factor = 0.5  # seconds, doubled after every retry
+http_timeout = 30  # seconds for connecting and reading
+
+# optional JSON file in which the load mode keeps the discovered calendars across runs (None: only during a run)
+caldav_discovery_cache = None
+
 # Advanced variables, these should not change as long as the test is used on Nextcloud (or nextcloud changes something)
 webdav_url = base_url + "remote.php/dav/files/" + username
 caldav_url = base_url + "remote.php/dav/calendars/" + username
 carddav_url = base_url + "remote.php/dav/addressbooks/users/" + username + "/contacts"
+uploads_url = base_url + "remote.php/dav/uploads/" + username
@@ -0,0 +1,167 @@
+import asyncio
+import inspect
+import time
+
+import caldav
+import pytest
+
+from dav_functions.baseline import DEFAULT_ALPHA, DEFAULT_THRESHOLD, compare_to_baseline, create_baseline, \
+    format_comparison, load_baseline, save_baseline
+from dav_functions.metrics import MetricsCollector
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("dav", "DAV request metrics")
+    group.addoption(
+        "--dav-metrics-json",
+        default="dav_metrics.json",
+        help="write the latency report of all DAV requests to this file (default: %(default)s, empty to disable)"
+    )
+    group.addoption(
+        "--dav-baseline-save",
+        metavar="PATH",
+        help="store the latencies of this run as performance baseline, e.g. before an upgrade"
+    )
+    group.addoption(
+        "--dav-baseline-compare",
+        metavar="PATH",
+        help="compare the latencies of this run with a baseline and fail the run on regressions"
+    )
+    group.addoption(
+        "--dav-regression-threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="relative increase of the median latency that counts as regression (default: %(default)s)"
+    )
+    group.addoption(
+        "--dav-significance",
+        type=float,
+        default=DEFAULT_ALPHA,
+        help="significance level of the regression test (default: %(default)s)"
+    )
+
+
+def pytest_configure(config):
+    config.dav_metrics = MetricsCollector()
+    config.dav_comparison = None
+    # one event loop for all async tests, so the async session can be shared like dav_session
+    config.dav_event_loop = asyncio.new_event_loop()
+
+
+def pytest_unconfigure(config):
+    config.dav_event_loop.close()
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """ Runs async def tests on the shared event loop. """
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    arguments = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+    pyfuncitem.config.dav_event_loop.run_until_complete(pyfuncitem.obj(**arguments))
+    return True
+
+
+def pytest_sessionstart(session):
+    session.config.dav_started = time.monotonic()
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    if hasattr(config, "workeroutput"):
+        # pytest-xdist worker: the controller merges the records of all workers and reports them
+        config.workeroutput["dav_metrics"] = config.dav_metrics.dump()
+        config.workeroutput["dav_delays"] = dict(config.dav_metrics.delays)
+        return
+    if not config.dav_metrics.records:
+        return
+    current = create_baseline(config.dav_metrics, time.monotonic() - config.dav_started)
+
+    if config.getoption("--dav-baseline-save"):
+        save_baseline(config.getoption("--dav-baseline-save"), current)
+
+    if config.getoption("--dav-baseline-compare"):
+        config.dav_comparison = compare_to_baseline(
+            load_baseline(config.getoption("--dav-baseline-compare")),
+            current,
+            threshold=config.getoption("--dav-regression-threshold"),
+            alpha=config.getoption("--dav-significance")
+        )
+        if any(result["regressed"] for result in config.dav_comparison):
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    """ Collects the request records and propagation delays of a pytest-xdist worker. """
+    # a crashed worker has no workeroutput
+    workeroutput = getattr(node, "workeroutput", {})
+    node.config.dav_metrics.merge(workeroutput.get("dav_metrics", []))
+    node.config.dav_metrics.merge_delays(workeroutput.get("dav_delays", {}))
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    metrics = config.dav_metrics
+    if not metrics.records or hasattr(config, "workeroutput"):
+        return
+    terminalreporter.section("DAV request latency (ms)")
+    terminalreporter.write_line(metrics.format_summary())
+    path = config.getoption("--dav-metrics-json")
+    if path:
+        metrics.write_json(path)
+        terminalreporter.write_line(f"Latency report written to {path}")
+    if config.getoption("--dav-baseline-save"):
+        terminalreporter.write_line(f"Performance baseline written to {config.getoption('--dav-baseline-save')}")
+
+    if config.dav_comparison is not None:
+        terminalreporter.section("DAV performance compared to baseline (median ms)")
+        terminalreporter.write_line(format_comparison(config.dav_comparison))
+        regressions = [result["key"] for result in config.dav_comparison if result["regressed"]]
+        if regressions:
+            terminalreporter.write_line(f"{len(regressions)} performance regression(s) found", red=True)
+
+
+@pytest.fixture(scope="session")
+def dav_metrics(pytestconfig):
+    """ Records every request sent through dav_session. """
+    return pytestconfig.dav_metrics
+
+
+@pytest.fixture(scope="session")
+def dav_session(dav_metrics):
+    """ One pooled HTTP session shared by all WebDAV, CardDAV and CalDAV tests. """
+    from config import config
+    from dav_functions.session import create_session
+
+    session = create_session(config, metrics=dav_metrics)
+    yield session
+    session.close()
+
+
+@pytest.fixture(scope="session")
+def async_dav_session(pytestconfig, dav_metrics):
+    """ The asyncio counterpart of dav_session, for async def tests. """
+    from config import config
+    from dav_functions.async_session import create_async_session
+
+    async def create():
+        return create_async_session(config, metrics=dav_metrics)
+
+    loop = pytestconfig.dav_event_loop
+    session = loop.run_until_complete(create())
+    yield session
+    loop.run_until_complete(session.close())
+
+
+@pytest.fixture(scope="session")
+def caldav_client(dav_session):
+    """ The CalDAV client, sending its requests through the shared session. """
+    from config import config
+
+    client = caldav.DAVClient(
+        url=config.caldav_url,
+        username=config.username,
+        password=config.password
+    )
+    client.session = dav_session
+    yield client
@@ -0,0 +1,232 @@
+"""
+asyncio path for the CalDAV operations of dav_functions.caldav, see dav_functions.async_session.
+
+The caldav library is synchronous, so these functions talk to the calendar directly: the calendar is addressed by
+its URL (find_calendar_url) and events are returned as LazyRecord (href, etag, data; properties are scanned and the
+event parsed only on demand) instead of caldav.Event objects. Errors are reported like in dav_functions.caldav
+(None / False).
+"""
+from urllib.parse import unquote, urljoin, urlparse
+from xml.etree import ElementTree as ET
+
+from dav_functions.caldav import calendar_multiget_body, calendar_query_body, first_exact_match
+from dav_functions.caldav_bulk import event_filename, event_uid
+from dav_functions.caldav_discovery import LIST_CALENDARS_BODY
+from dav_functions.lazy_record import LazyRecord
+from dav_functions.metrics import label_operation
+from dav_functions.multistatus import aiter_multistatus
+
+CURRENT_USER_PRINCIPAL_BODY = """<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="DAV:"><d:prop><d:current-user-principal /></d:prop></d:propfind>
+"""
+
+CALENDAR_HOME_SET_BODY = """<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="DAV:" xmlns:c="urn:ietf:params:xml:ns:caldav">
+    <d:prop><c:calendar-home-set /></d:prop>
+</d:propfind>
+"""
+
+
+async def _propfind(session, url, auth, body, depth):
+    """ Sends a PROPFIND and returns the parsed multistatus, raises aiohttp.ClientResponseError on errors. """
+    response = await session.request(
+        "PROPFIND", url, auth=auth, data=body, headers={"content-type": "application/xml", "depth": str(depth)})
+    response.raise_for_status()
+    return ET.fromstring(await response.read())
+
+
+async def find_calendar_url(caldav_url, username, password, calendar_name, session):
+    """
+    Finds the URL of a calendar by its name: current user principal, calendar-home-set, then the calendars in it.
+
+    :param caldav_url: the CalDAV URL of the server, as for caldav.DAVClient
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param calendar_name: the display name of the calendar
+    :param session: AsyncDAVSession
+    :return: URL of the calendar or None if not found
+    """
+    auth = (username, password)
+    try:
+        with label_operation("caldav_calendars"):
+            root = await _propfind(session, caldav_url, auth, CURRENT_USER_PRINCIPAL_BODY, 0)
+            principal = urljoin(caldav_url, root.find(".//{DAV:}current-user-principal/{DAV:}href").text)
+            root = await _propfind(session, principal, auth, CALENDAR_HOME_SET_BODY, 0)
+            home_set = urljoin(principal, root.find(
+                ".//{urn:ietf:params:xml:ns:caldav}calendar-home-set/{DAV:}href").text)
+            root = await _propfind(session, home_set, auth, LIST_CALENDARS_BODY, 1)
+    except Exception as e:
+        print(f"Error finding the calendar: {e}")
+        return None
+    for response in root.iter("{DAV:}response"):
+        if response.find(".//{DAV:}resourcetype/{urn:ietf:params:xml:ns:caldav}calendar") is None:
+            continue
+        url = urljoin(home_set, response.find("{DAV:}href").text)
+        name = response.find(".//{DAV:}displayname")
+        if (name.text if name is not None and name.text else url.rstrip("/").split("/")[-1]) == calendar_name:
+            return url
+    return None
+
+
+async def _report(calendar_url, username, password, body, session):
+    """ Sends a REPORT to the calendar and returns the entries with calendar-data, parsed while downloading. """
+    async with session.stream(
+            "REPORT",
+            calendar_url.rstrip("/") + "/",
+            auth=(username, password),
+            data=body.encode("utf-8"),
+            headers={
+                "content-type": "application/xml; charset=utf-8",
+                "depth": "1"
+            }) as response:
+        response.raise_for_status()
+        return [LazyRecord.from_entry(entry) async for entry in aiter_multistatus(response) if entry.data]
+
+
+async def query_caldav_events(calendar_url, username, password, name, value, session, start_date=None, end_date=None):
+    """
+    Finds events whose property contains a value with a calendar-query, see dav_functions.caldav.query_caldav_events.
+
+    :return: list of LazyRecord, None on error
+    """
+    try:
+        with label_operation("caldav_query"):
+            return await _report(
+                calendar_url, username, password, calendar_query_body(name, value, start_date, end_date), session)
+    except Exception as e:
+        print(f"Error querying events: {e}")
+        return None
+
+
+async def get_calendar_event_by_uid(calendar_url, username, password, event_uid, session):
+    """
+    Retrieves a calendar event by its UID with a single calendar-query.
+
+    :return: LazyRecord or None if not found
+    """
+    events = await query_caldav_events(calendar_url, username, password, "UID", event_uid, session)
+    return first_exact_match(events, "UID", event_uid)
+
+
+async def get_calendar_event_by_name_range(
+        calendar_url, username, password, event_name, start_date, end_date, session):
+    """
+    Retrieves a calendar event by its summary within a date range.
+
+    :return: LazyRecord or None if not found
+    """
+    events = await query_caldav_events(
+        calendar_url, username, password, "SUMMARY", event_name, session, start_date, end_date)
+    return first_exact_match(events, "SUMMARY", event_name)
+
+
+async def get_calendar_events_by_href(calendar_url, username, password, hrefs, session):
+    """
+    Retrieves calendar events by their hrefs with a single calendar-multiget.
+
+    :return: list of LazyRecord of the events that exist, None on error
+    """
+    paths = [urlparse(urljoin(calendar_url, href)).path for href in hrefs]
+    try:
+        with label_operation("caldav_multiget"):
+            return await _report(calendar_url, username, password, calendar_multiget_body(paths), session)
+    except Exception as e:
+        print(f"Error fetching events: {e}")
+        return None
+
+
+async def create_caldav_event(calendar_url, username, password, event_data, session):
+    """
+    Saves a new event in a CalDAV calendar as <UID>.ics, failing if an event with that name exists already.
+
+    :param calendar_url: URL of the CalDAV calendar
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param event_data: the event in iCalendar format, e.g. from create_event_data
+    :param session: AsyncDAVSession
+    :return: True if the event was created successfully, False otherwise
+    """
+    if isinstance(event_data, bytes):
+        event_data = event_data.decode("utf-8")
+    try:
+        with label_operation("caldav_save_event"):
+            response = await session.request(
+                "PUT",
+                f"{calendar_url.rstrip('/')}/{event_filename(event_uid(event_data))}",
+                data=event_data.encode("utf-8"),
+                auth=(username, password),
+                headers={
+                    "content-type": "text/calendar; charset=utf-8",
+                    "If-None-Match": "*"
+                }
+            )
+        response.raise_for_status()
+        return True
+    except Exception as e:
+        print(f"Error creating event: {e}")
+        return False
+
+
+async def update_caldav_event_by_href(calendar_url, username, password, href, event_data, session, etag=None):
+    """
+    Replaces an event with a PUT to its href.
+
+    :param etag: if given, the update only succeeds if the event still has this ETag (If-Match)
+    :return: True if the event was updated successfully, False otherwise
+    """
+    headers = {"content-type": "text/calendar; charset=utf-8"}
+    if etag:
+        headers["If-Match"] = etag
+    if isinstance(event_data, str):
+        event_data = event_data.encode("utf-8")
+    try:
+        with label_operation("caldav_update"):
+            response = await session.request(
+                "PUT", urljoin(calendar_url, href), data=event_data, auth=(username, password),
+                headers=headers)
+        if response.status == 412:
+            print(f"Error updating the event: {unquote(href)} was changed on the server")
+            return False
+        if response.status not in (200, 201, 204):
+            print(f"Error updating the event: status {response.status}")
+            return False
+        return True
+    except Exception as e:
+        print(f"Error updating the event: {e}")
+        return False
+
+
+async def delete_caldav_event_by_href(calendar_url, username, password, href, session, etag=None):
+    """
+    Deletes an event with a DELETE to its href.
+
+    :param etag: if given, the event is only deleted if it still has this ETag (If-Match)
+    :return: True if the event was deleted successfully, False otherwise
+    """
+    headers = {"If-Match": etag} if etag else {}
+    try:
+        with label_operation("caldav_delete"):
+            response = await session.request(
+                "DELETE", urljoin(calendar_url, href), auth=(username, password), headers=headers)
+        if response.status == 412:
+            print(f"Error deleting the event: {unquote(href)} was changed on the server")
+            return False
+        if response.status not in (200, 204):
+            print(f"Error deleting the event: status {response.status}")
+            return False
+        return True
+    except Exception as e:
+        print(f"Error deleting the event: {e}")
+        return False
+
+
+async def delete_caldav_event(calendar_url, username, password, event_uid, session):
+    """
+    Deletes an event based on its UID: looked up with a UID calendar-query, deleted with its ETag as precondition.
+
+    :return: True if the event was deleted successfully, False otherwise
+    """
+    event = await get_calendar_event_by_uid(calendar_url, username, password, event_uid, session)
+    if event is None:
+        return False  # Event not found
+    return await delete_caldav_event_by_href(calendar_url, username, password, event.href, session, event.etag)
@@ -0,0 +1,146 @@
+"""
+asyncio variants of the CardDAV helpers in dav_functions.carddav, see dav_functions.async_session.
+
+They take the same arguments, but the session is required, and report errors the same way (None / False).
+"""
+import uuid
+
+import vobject
+
+from dav_functions.carddav import addressbook_query_body, contacts_from_entries, matches_exactly
+from dav_functions.multistatus import aiter_multistatus
+
+
+async def create_carddav_contact(carddav_url, username, password, contact_info, session):
+    """
+    Creates a new contact in the CardDAV server.
+
+    :param carddav_url: URL to the CardDAV server address book
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param contact_info: Dictionary with contact information (e.g., name, email)
+    :param session: AsyncDAVSession
+    :return: True if contact is created successfully, False otherwise
+    """
+    card = vobject.vCard()
+    card.add('fn').value = contact_info.get('fullname', 'Unknown')
+    card.add('email').value = contact_info.get('email', '')
+    return await _put_card(carddav_url, username, password, card, f"{uuid.uuid4()}.vcf", session)
+
+
+async def update_carddav_contact(carddav_url, username, password, card, href, session):
+    """
+    Updates a contact in the CardDAV server.
+
+    :param carddav_url: URL to the CardDAV server address book
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param card: a vobject.vCard containing updated information
+    :param href: the current path or only the filename including extension, e.g. <uuid>.vcf
+    :param session: AsyncDAVSession
+    :return: True if contact is updated successfully, False otherwise
+    """
+    return await _put_card(carddav_url, username, password, card, href.split("/")[-1], session)
+
+
+async def _put_card(carddav_url, username, password, card, contact_filename, session):
+    try:
+        response = await session.request(
+            "PUT",
+            f"{carddav_url}/{contact_filename}",
+            data=card.serialize(),
+            auth=(username, password),
+            headers={
+                'content-type': 'text/vcard'
+            }
+        )
+        if response.status >= 400:
+            print(f"HTTP Error: {response.status} {response.reason}")
+            print("Response content:", await response.text())
+            return False
+        return True
+    except Exception as e:
+        print(f"Error saving contact: {e}")
+        return False
+
+
+async def find_carddav_contacts(
+        carddav_url,
+        username,
+        password,
+        session,
+        fn=None,
+        uid=None,
+        email=None,
+        match_type="equals",
+        properties=None):
+    """
+    Finds contacts by full name, UID and/or email with an addressbook-query, see
+    dav_functions.carddav.find_carddav_contacts. The response is parsed while it is downloaded.
+
+    :return: list of LazyContact (readable as dictionary of {fn, href, etag, vcard}) or None if an error occurs
+    """
+    criteria = {"FN": fn, "UID": uid, "EMAIL": email}
+    criteria = {name: value for name, value in criteria.items() if value is not None}
+    if not criteria:
+        raise ValueError("At least one of fn, uid or email is needed")
+
+    try:
+        async with session.stream(
+                "REPORT",
+                carddav_url + "/",
+                auth=(username, password),
+                data=addressbook_query_body(criteria, match_type, properties).encode("utf-8"),
+                headers={
+                    "content-type": "application/xml; charset=utf-8",
+                    "depth": "1"
+                }) as response:
+            response.raise_for_status()
+            entries = [entry async for entry in aiter_multistatus(response)]
+        return [
+            contact for contact in contacts_from_entries(entries)
+            if match_type != "equals" or matches_exactly(contact, criteria)
+        ]
+    except Exception as e:
+        print(f"Error fetching contacts: {e}")
+        return None
+
+
+async def fetch_carddav_contact(carddav_url, username, password, fn, session):
+    """
+    Fetches a single contact from the CardDAV server by its full name.
+
+    :return: LazyContact (readable as dictionary of {fn, href, etag, vcard})
+    """
+    contacts = await find_carddav_contacts(carddav_url, username, password, session, fn=fn)
+    if contacts is None:
+        raise Exception("No contacts found")
+
+    if not contacts:
+        raise Exception("Contact not found")
+
+    return contacts[-1]
+
+
+async def delete_carddav_contact(carddav_url, username, password, href, session):
+    """
+    Deletes a contact from the CardDAV server.
+
+    :param carddav_url: URL to the CardDAV server address book
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param href: the current path or only the filename including extension, e.g. <uuid>.vcf
+    :param session: AsyncDAVSession
+    :return: True if contact is deleted successfully, False otherwise
+    """
+    try:
+        response = await session.request(
+            "DELETE",
+            f"{carddav_url}/{href.split('/')[-1]}",
+            auth=(username, password)
+        )
+        response.raise_for_status()
+        return True
+    except Exception as e:
+        print(f"Error deleting contact: {e}")
+        return False
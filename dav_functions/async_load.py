@@ -0,0 +1,218 @@
+"""
+Load mode on the asyncio backend: every virtual user is a task instead of a thread, so a single process can keep
+thousands of DAV requests in flight. Runs the same scenarios and reports the same way as dav_functions.load.
+
+Usage (reads config/config.py):
+
+    python -m dav_functions.load --async --users 1000 --duration 60
+"""
+import asyncio
+import time
+import uuid
+from datetime import timedelta
+
+import vobject
+
+from dav_functions import async_caldav, async_carddav, async_webdav
+from dav_functions.async_session import create_async_session
+from dav_functions.caldav import create_event_data, ical_values
+from dav_functions.load import LOAD_EVENT_DAY, LOAD_FILE_PATH, SCENARIOS, RateLimiter, Recorder
+
+
+class AsyncVirtualUser:
+    """ State of one virtual user of an async load run, see dav_functions.load.VirtualUser. """
+
+    def __init__(self, number, run_id, config, session, recorder, calendar_url):
+        self.number = number
+        self.run_id = run_id
+        self.config = config
+        self.session = session
+        self.recorder = recorder
+        self.calendar_url = calendar_url
+
+    def resource_name(self, iteration):
+        """ A name no other virtual user or run will use. """
+        return f"load-{self.run_id}-u{self.number}-i{iteration}"
+
+    async def measure(self, operation, function, *args, **kwargs):
+        """
+        Awaits an async dav_function and records how long it took, see dav_functions.load.Recorder.measure.
+
+        :return: the return value of the function, None if it raised an exception
+        """
+        delay = self.recorder.rate_limiter.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        start = time.perf_counter()
+        try:
+            result = await function(*args, **kwargs)
+            failed = result is None or result is False
+        except Exception as e:
+            print(f"Error in {operation}: {e}")
+            result = None
+            failed = True
+        self.recorder.record(operation, time.perf_counter() - start, failed)
+        return result
+
+
+async def _clean_up(resource, function, *args):
+    """ Removes a resource that a failed scenario left behind, see dav_functions.load._clean_up. """
+    try:
+        if not await function(*args):
+            print(f"Could not clean up {resource}")
+    except Exception as e:
+        print(f"Error cleaning up {resource}: {e}")
+
+
+async def webdav_scenario(user, iteration):
+    """ Uploads, reads and deletes a file. """
+    config = user.config
+    file_name = user.resource_name(iteration) + ".txt"
+    file_url = config.webdav_url + "/" + file_name
+    credentials = (config.username, config.password)
+
+    if not await user.measure("webdav_upload", async_webdav.upload_file_to_webdav, config.webdav_url, *credentials,
+                              LOAD_FILE_PATH, file_name, user.session):
+        return
+    deleted = False
+    try:
+        await user.measure("webdav_read", async_webdav.get_webdav_file_content, file_url, *credentials, user.session)
+        deleted = await user.measure("webdav_delete", async_webdav.delete_webdav_file, file_url, *credentials,
+                                     user.session)
+    finally:
+        if not deleted:
+            await _clean_up(file_name, async_webdav.delete_webdav_file, file_url, *credentials, user.session)
+
+
+async def carddav_scenario(user, iteration):
+    """ Creates, reads, updates and deletes a contact. """
+    config = user.config
+    name = user.resource_name(iteration)
+    credentials = (config.carddav_url, config.username, config.password)
+
+    async def delete_by_name():
+        contact = await async_carddav.fetch_carddav_contact(*credentials, name, user.session)
+        return contact is not None and await async_carddav.delete_carddav_contact(
+            *credentials, contact["href"], user.session)
+
+    if not await user.measure("carddav_create", async_carddav.create_carddav_contact, *credentials,
+                              {"fullname": name, "email": name + "@example.com"}, user.session):
+        return
+    deleted = False
+    try:
+        contact = await user.measure("carddav_read", async_carddav.fetch_carddav_contact, *credentials, name,
+                                     user.session)
+        if contact is None:
+            return
+        vcard = vobject.readOne(contact["vcard"].serialize())
+        vcard.add("note").value = "Updated by the load test."
+        await user.measure("carddav_update", async_carddav.update_carddav_contact, *credentials, vcard,
+                           contact["href"], user.session)
+        deleted = await user.measure("carddav_delete", async_carddav.delete_carddav_contact, *credentials,
+                                     contact["href"], user.session)
+    finally:
+        if not deleted:
+            await _clean_up(name, delete_by_name)
+
+
+async def caldav_scenario(user, iteration):
+    """ Creates, reads, updates and deletes an event. """
+    config = user.config
+    summary = user.resource_name(iteration)
+    credentials = (user.calendar_url, config.username, config.password)
+    start = LOAD_EVENT_DAY + timedelta(minutes=user.number % 1440)
+    range_start = LOAD_EVENT_DAY - timedelta(days=1)
+    range_end = LOAD_EVENT_DAY + timedelta(days=2)
+
+    event_data = create_event_data(summary, start, start + timedelta(minutes=30), "Created by the load test.")
+    uid = ical_values(event_data, "UID")[0]
+    if not await user.measure("caldav_create", async_caldav.create_caldav_event, *credentials, event_data,
+                              user.session):
+        return
+    deleted = False
+    try:
+        event = await user.measure("caldav_read", async_caldav.get_calendar_event_by_name_range, *credentials,
+                                   summary, range_start, range_end, user.session)
+        if event is None:
+            return
+        updated = event.data.replace("Created by the load test.", "Updated by the load test.")
+        await user.measure("caldav_update", async_caldav.update_caldav_event_by_href, *credentials, event.href,
+                           updated, user.session, event.etag)
+        deleted = await user.measure("caldav_delete", async_caldav.delete_caldav_event, *credentials, uid,
+                                     user.session)
+    finally:
+        if not deleted:
+            await _clean_up(summary, async_caldav.delete_caldav_event, *credentials, uid, user.session)
+
+
+ASYNC_SCENARIOS = {
+    "webdav": webdav_scenario,
+    "carddav": carddav_scenario,
+    "caldav": caldav_scenario
+}
+
+
+async def run_load_async(
+        config,
+        scenarios=("webdav", "carddav", "caldav"),
+        users=10,
+        duration=60,
+        rate=None,
+        session=None,
+        metrics=None):
+    """
+    Runs the scenarios with concurrent virtual users on the running event loop, see dav_functions.load.run_load.
+
+    :param config: the config module (config.config)
+    :param scenarios: names of the scenarios to run, see SCENARIOS
+    :param users: number of concurrent virtual users
+    :param duration: how long new iterations are started, in seconds
+    :param rate: maximum number of DAV operations per second over all users, None for no limit
+    :param session: optional AsyncDAVSession, by default one with a connection per virtual user is created
+    :param metrics: optional MetricsCollector for the per-request measurements of the created session
+    :return: dictionary of {run_id, users, duration, operations: {operation: {count, errors, throughput, ...}}}
+    """
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    own_session = session is None
+    if own_session:
+        session = create_async_session(config, pool_size=users, metrics=metrics)
+
+    try:
+        calendar_url = None
+        if "caldav" in scenarios:
+            # all virtual users share one calendar, it is only looked up once
+            calendar_url = await async_caldav.find_calendar_url(
+                config.caldav_url, config.username, config.password, config.calendar_name, session)
+            if calendar_url is None:
+                raise Exception("Calendar " + config.calendar_name + " not found")
+
+        run_id = uuid.uuid4().hex[:8]
+        recorder = Recorder(RateLimiter(rate))
+        deadline = time.monotonic() + duration
+
+        async def run_user(number):
+            user = AsyncVirtualUser(number, run_id, config, session, recorder, calendar_url)
+            iteration = 0
+            while time.monotonic() < deadline:
+                for name in scenarios:
+                    try:
+                        await ASYNC_SCENARIOS[name](user, iteration)
+                    except Exception as e:
+                        print(f"Error in scenario {name} of user {number}: {e}")
+                iteration += 1
+
+        start = time.monotonic()
+        await asyncio.gather(*(run_user(number) for number in range(users)))
+        elapsed = time.monotonic() - start
+    finally:
+        if own_session:
+            await session.close()
+
+    return {
+        "run_id": run_id,
+        "users": users,
+        "duration": elapsed,
+        "operations": recorder.report(elapsed)
+    }
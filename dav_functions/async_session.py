@@ -0,0 +1,207 @@
+"""
+asyncio counterpart of DAVSession, built on aiohttp.
+
+One event loop can keep thousands of DAV requests in flight at the same time, without a thread per request. The
+session pools connections, retries like DAVSession and records every request in a MetricsCollector if one is given.
+It has to be created and used inside a running event loop:
+
+async with create_async_session(config) as session:
+    content = await get_webdav_file_content(url, username, password, session)
+"""
+import asyncio
+import base64
+import inspect
+import time
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import aiohttp
+
+from dav_functions.metrics import RequestRecord, current_operation, url_template
+from dav_functions.session import DEFAULT_BACKOFF_FACTOR, DEFAULT_POOL_SIZE, DEFAULT_RETRIES, DEFAULT_TIMEOUT, \
+    RETRY_METHODS, RETRY_STATUS_CODES
+
+
+class AsyncDAVSession:
+    """
+    An aiohttp session for talking to the DAV endpoints of one server.
+
+    Requests return aiohttp.ClientResponse objects. request() reads the body before it returns (await
+    response.read() / response.text() give it without further I/O), stream() leaves it to the caller, e.g. to parse a
+    multistatus response while it is downloaded.
+    """
+
+    def __init__(
+            self,
+            username=None,
+            password=None,
+            pool_size=DEFAULT_POOL_SIZE,
+            retries=DEFAULT_RETRIES,
+            backoff_factor=DEFAULT_BACKOFF_FACTOR,
+            timeout=DEFAULT_TIMEOUT,
+            metrics=None):
+        """
+        :param username: Username for authentication, sent with every request if given
+        :param password: Password for authentication
+        :param pool_size: Maximum number of open connections, requests beyond that wait for a free connection
+        :param retries: How often a failed request is retried
+        :param backoff_factor: Backoff factor between retries in seconds (0.5 -> 0.5s, 1s, 2s, ...)
+        :param timeout: Timeout in seconds for connecting and for every read
+        :param metrics: optional MetricsCollector that records every request
+        """
+        self.auth = (username, password) if username is not None else None
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.metrics = metrics
+        trace_configs = []
+        if metrics is not None:
+            trace_configs.append(self._trace_config())
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size, limit_per_host=pool_size),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout),
+            trace_configs=trace_configs
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self._session.close()
+
+    async def request(self, method, url, **kwargs):
+        """
+        Sends a request and reads the response body.
+
+        :param method: HTTP method, e.g. PROPFIND
+        :param url: the URL
+        :param kwargs: passed on to aiohttp, e.g. data, headers; auth can be a tuple (username, password) as for
+            requests
+        :return: aiohttp.ClientResponse with the body read
+        """
+        response = await self._send(method, url, kwargs)
+        body = b""
+        try:
+            body = await response.read()
+        finally:
+            if self.metrics is not None:
+                self._record(response, len(body))
+        return response
+
+    @asynccontextmanager
+    async def stream(self, method, url, **kwargs):
+        """
+        Sends a request and yields the response without reading its body.
+
+        :return: async context manager of an aiohttp.ClientResponse
+        """
+        response = await self._send(method, url, kwargs)
+        try:
+            yield response
+        finally:
+            if self.metrics is not None:
+                # the bytes received so far, also for chunked responses without Content-Length
+                self._record(response, response.content.total_bytes)
+            response.release()
+
+    async def _send(self, method, url, kwargs):
+        """
+        Sends a request and returns the response once its headers arrived. Failed idempotent requests are retried
+        (connection errors and the RETRY_STATUS_CODES), with the backoff doubling every time.
+        """
+        auth = kwargs.pop("auth", None) or self.auth
+        if auth is not None:
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), "Authorization": _basic_auth(*auth)}
+        retries = self.retries if method.upper() in RETRY_METHODS else 0
+        if inspect.isasyncgen(kwargs.get("data")):
+            retries = 0  # a streamed body is consumed by the first attempt, only bytes can be sent again
+        for attempt in range(retries + 1):
+            timings = SimpleNamespace(started=time.perf_counter(), dns=0.0, connect=0.0, tls=0.0, ttfb=0.0)
+            try:
+                response = await self._session.request(method, url, trace_request_ctx=timings, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == retries:
+                    raise
+            else:
+                if response.status not in RETRY_STATUS_CODES or attempt == retries:
+                    response.timings = timings
+                    return response
+                delay = response.headers.get("Retry-After")
+                response.release()
+                if delay and delay.isdigit():
+                    await asyncio.sleep(int(delay))
+                    continue
+            await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+
+    def _record(self, response, bytes_received):
+        """ Records a response in the MetricsCollector, see dav_functions.metrics.finish_request. """
+        timings = response.timings
+        request = response.request_info
+        self.metrics.add(RequestRecord(
+            operation=current_operation(),
+            method=request.method,
+            url_template=url_template(str(request.url)),
+            status=response.status,
+            bytes_sent=int(request.headers.get("Content-Length") or 0),
+            bytes_received=bytes_received,
+            dns=timings.dns,
+            connect=timings.connect,
+            tls=timings.tls,
+            ttfb=timings.ttfb,
+            total=time.perf_counter() - timings.started
+        ))
+
+    @staticmethod
+    def _trace_config():
+        """ Measures DNS lookup, connection setup and time to the response headers of every request. """
+        trace_config = aiohttp.TraceConfig()
+
+        def started(name):
+            async def callback(session, context, params):
+                setattr(context.trace_request_ctx, name + "_started", time.perf_counter())
+            return callback
+
+        def ended(name):
+            async def callback(session, context, params):
+                timings = context.trace_request_ctx
+                setattr(timings, name, time.perf_counter() - getattr(timings, name + "_started"))
+            return callback
+
+        async def headers_received(session, context, params):
+            timings = context.trace_request_ctx
+            timings.ttfb = time.perf_counter() - timings.started
+
+        trace_config.on_dns_resolvehost_start.append(started("dns"))
+        trace_config.on_dns_resolvehost_end.append(ended("dns"))
+        # aiohttp reports TCP connect and TLS handshake together
+        trace_config.on_connection_create_start.append(started("connect"))
+        trace_config.on_connection_create_end.append(ended("connect"))
+        trace_config.on_request_end.append(headers_received)
+        return trace_config
+
+
+def _basic_auth(username, password):
+    credentials = base64.b64encode(f"{username}:{password}".encode("utf-8")).decode("ascii")
+    return f"Basic {credentials}"
+
+
+def create_async_session(config, pool_size=None, metrics=None):
+    """
+    Creates an AsyncDAVSession from the config module, like create_session. Has to be called in a running event loop.
+
+    :param config: the config module (config.config)
+    :param pool_size: optional maximum number of connections that overrides the config
+    :param metrics: optional MetricsCollector that records every request
+    :return: an AsyncDAVSession
+    """
+    return AsyncDAVSession(
+        username=config.username,
+        password=config.password,
+        pool_size=pool_size or getattr(config, "http_pool_size", DEFAULT_POOL_SIZE),
+        retries=getattr(config, "http_retries", DEFAULT_RETRIES),
+        backoff_factor=getattr(config, "http_backoff_factor", DEFAULT_BACKOFF_FACTOR),
+        timeout=getattr(config, "http_timeout", DEFAULT_TIMEOUT),
+        metrics=metrics
+    )
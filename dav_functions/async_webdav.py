@@ -0,0 +1,159 @@
+"""
+asyncio variants of the WebDAV helpers in dav_functions.webdav, see dav_functions.async_session.
+
+They take the same arguments, but the session is required, and report errors the same way (None / False).
+"""
+import asyncio
+import hashlib
+import os
+
+import aiohttp
+
+from dav_functions.webdav import DEFAULT_CHUNK_SIZE
+
+
+async def get_webdav_file_content(webdav_url, username, password, session):
+    """
+    Retrieves the content of a file from a WebDAV server.
+
+    :param webdav_url: URL of the file on the WebDAV server
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param session: AsyncDAVSession
+    :return: Content of the file or None if an error occurs
+    """
+    try:
+        response = await session.request("GET", webdav_url, auth=(username, password))
+        response.raise_for_status()
+        return await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Error retrieving the file: {e}")
+        return None
+
+
+async def iter_webdav_file_content(webdav_url, username, password, session, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams the content of a file from a WebDAV server in chunks, without loading the whole file into memory.
+
+    :param webdav_url: URL of the file on the WebDAV server
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param session: AsyncDAVSession
+    :param chunk_size: Size of the chunks in bytes
+    :return: async generator of byte chunks, raises aiohttp.ClientError if the download fails
+    """
+    async with session.stream("GET", webdav_url, auth=(username, password)) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(chunk_size):
+            yield chunk
+
+
+async def verify_webdav_file_stream(
+        webdav_url,
+        username,
+        password,
+        session,
+        expected_content=None,
+        hash_algorithm="sha256",
+        chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Reads a file from a WebDAV server chunk by chunk and verifies it on the fly, see
+    dav_functions.webdav.verify_webdav_file_stream.
+
+    :return: dictionary of {size, hash, contains} or None if an error occurs;
+        contains is None if no expected_content was given
+    """
+    if isinstance(expected_content, str):
+        expected_content = expected_content.encode("utf-8")
+
+    file_hash = hashlib.new(hash_algorithm)
+    size = 0
+    found = not expected_content
+    tail = b""
+
+    try:
+        async for chunk in iter_webdav_file_content(webdav_url, username, password, session, chunk_size):
+            file_hash.update(chunk)
+            size += len(chunk)
+            if expected_content and not found:
+                window = tail + chunk
+                found = expected_content in window
+                tail = window[-(len(expected_content) - 1):] if len(expected_content) > 1 else b""
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Error retrieving the file: {e}")
+        return None
+
+    return {
+        "size": size,
+        "hash": file_hash.hexdigest(),
+        "contains": found if expected_content is not None else None
+    }
+
+
+async def upload_file_to_webdav(webdav_url, username, password, local_file_path, remote_file_name, session):
+    """
+    Uploads a file to a WebDAV server.
+
+    The file is streamed in chunks read in the event loop's default executor, so memory doesn't grow with the file
+    size. A streamed body can't be sent twice, so the upload is not retried.
+
+    :param webdav_url: URL of the WebDAV server (directory where the file will be stored)
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param local_file_path: Path to the local file to be uploaded
+    :param remote_file_name: The name of the file on the server after upload
+    :param session: AsyncDAVSession
+    :return: True if upload was successful, False otherwise
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        file = await loop.run_in_executor(None, open, local_file_path, "rb")
+    except OSError as e:
+        print(f"Error uploading the file: {e}")
+        return False
+    try:
+        size = os.fstat(file.fileno()).st_size
+        response = await session.request(
+            "PUT",
+            f'{webdav_url.rstrip("/")}/{remote_file_name}',
+            data=_iter_file(file, DEFAULT_CHUNK_SIZE),
+            # a known length instead of chunked transfer encoding, which not every server setup accepts
+            headers={"Content-Length": str(size)},
+            auth=(username, password)
+        )
+        response.raise_for_status()
+        return True
+    except (OSError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Error uploading the file: {e}")
+        return False
+    finally:
+        file.close()
+
+
+async def _iter_file(file, chunk_size):
+    """ Reads an open file in chunks in the default executor. """
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, file.read, chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def delete_webdav_file(webdav_url, username, password, session):
+    """
+    Deletes a file from a WebDAV server.
+
+    :param webdav_url: The full URL to the file on the WebDAV server
+    :param username: The username for WebDAV server authentication
+    :param password: The password for WebDAV server authentication
+    :param session: AsyncDAVSession
+    :return: True if deletion was successful, False otherwise
+    """
+    try:
+        response = await session.request("DELETE", webdav_url, auth=(username, password))
+        response.raise_for_status()
+        return True
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Error occurred: {e}")
+        return False
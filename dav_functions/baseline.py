@@ -0,0 +1,130 @@
+"""
+Performance baselines: store the latencies of a run on disk and compare a later run against them.
+
+A baseline is recorded on the test instance before an upgrade. After the upgrade the same run is compared against
+it, and every request type whose latency got significantly worse (one-sided Mann-Whitney U test) by more than a
+threshold counts as a regression.
+"""
+import json
+import random
+from datetime import datetime
+
+from dav_functions.stats import mann_whitney_u, percentile
+
+# more samples per request type are reduced to a random subset of this size, keeping the file compact
+MAX_SAMPLES = 2000
+
+DEFAULT_THRESHOLD = 0.2  # 20% slower median
+DEFAULT_ALPHA = 0.05
+# fewer samples than this on either side are reported, but never count as a regression
+DEFAULT_MIN_SAMPLES = 8
+
+
+def create_baseline(collector, duration, max_samples=MAX_SAMPLES):
+    """
+    Creates a baseline from the records of a MetricsCollector.
+
+    :param collector: the MetricsCollector of the run
+    :param duration: wall-clock duration of the run in seconds, used for the throughput
+    :param max_samples: maximum number of latencies stored per request type
+    :return: dictionary of {created, duration, operations: {key: {count, throughput, samples}}}
+    """
+    latencies = {}
+    for record in list(collector.records):
+        latencies.setdefault(record.key(), []).append(record.total)
+
+    sampler = random.Random(0)
+    operations = {}
+    for key, values in sorted(latencies.items()):
+        samples = values if len(values) <= max_samples else sampler.sample(values, max_samples)
+        operations[key] = {
+            "count": len(values),
+            "throughput": len(values) / duration if duration else None,
+            "samples": sorted(samples)
+        }
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "duration": duration,
+        "operations": operations
+    }
+
+
+def save_baseline(path, baseline):
+    with open(path, "w") as file:
+        json.dump(baseline, file)
+
+
+def load_baseline(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare_to_baseline(
+        baseline,
+        current,
+        threshold=DEFAULT_THRESHOLD,
+        alpha=DEFAULT_ALPHA,
+        min_samples=DEFAULT_MIN_SAMPLES):
+    """
+    Compares the latencies of the current run with a baseline.
+
+    A request type regressed if its median latency grew by more than the threshold and the increase is significant
+    at the given level. Request types that only exist in one of the runs are listed without a verdict.
+
+    :param baseline: baseline as returned by create_baseline or load_baseline
+    :param current: baseline of the current run
+    :param threshold: allowed relative increase of the median, e.g. 0.2 for 20%
+    :param alpha: significance level of the Mann-Whitney U test
+    :param min_samples: minimum number of latencies per side for a verdict
+    :return: list of dictionaries of {key, baseline_p50, current_p50, change, baseline_throughput,
+        current_throughput, p_value, regressed}; values that can't be computed are None
+    """
+    results = []
+    for key in sorted(set(baseline["operations"]) | set(current["operations"])):
+        before = baseline["operations"].get(key)
+        after = current["operations"].get(key)
+        result = {
+            "key": key,
+            "baseline_p50": percentile(before["samples"], 50) if before else None,
+            "current_p50": percentile(after["samples"], 50) if after else None,
+            "baseline_throughput": before["throughput"] if before else None,
+            "current_throughput": after["throughput"] if after else None,
+            "change": None,
+            "p_value": None,
+            "regressed": False
+        }
+        if before and after:
+            if result["baseline_p50"]:
+                result["change"] = result["current_p50"] / result["baseline_p50"] - 1
+            if len(before["samples"]) >= min_samples and len(after["samples"]) >= min_samples:
+                result["p_value"] = mann_whitney_u(before["samples"], after["samples"])
+                result["regressed"] = (
+                    result["p_value"] < alpha
+                    and result["change"] is not None
+                    and result["change"] > threshold
+                )
+        results.append(result)
+    return results
+
+
+def format_comparison(results):
+    """ Formats the result of compare_to_baseline as a table with latencies in milliseconds. """
+
+    def milliseconds(value):
+        return f"{value * 1000:.1f}" if value is not None else "-"
+
+    lines = [f"{'request':<70}{'before':>9}{'after':>9}{'change':>9}{'p-value':>9}  verdict"]
+    for result in results:
+        change = f"{result['change'] * 100:+.0f}%" if result["change"] is not None else "-"
+        p_value = f"{result['p_value']:.3f}" if result["p_value"] is not None else "-"
+        if result["regressed"]:
+            verdict = "REGRESSION"
+        elif result["p_value"] is None:
+            verdict = "not enough data"
+        else:
+            verdict = "ok"
+        lines.append(
+            f"{result['key'][:69]:<70}{milliseconds(result['baseline_p50']):>9}{milliseconds(result['current_p50']):>9}"
+            f"{change:>9}{p_value:>9}  {verdict}"
+        )
+    return "\n".join(lines)
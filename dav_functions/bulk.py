@@ -0,0 +1,53 @@
+"""
+Helpers shared by the bulk importers and exporters (carddav_bulk, caldav_bulk).
+"""
+import re
+import time
+import uuid
+
+# progress is reported every this many items
+PROGRESS_INTERVAL = 1000
+
+SAFE_FILENAME = re.compile(r"^[A-Za-z0-9._-]{1,200}$")
+
+
+def print_progress(stats):
+    """ Default progress reporter. """
+    print(f"{stats['action']}: {stats['done']} done, {stats['failed']} failed, {stats['per_second']:.1f}/s")
+
+
+def resource_filename(uid, extension):
+    """ The file name a resource is stored under: the UID if it is safe to use in a URL, otherwise derived from it. """
+    if SAFE_FILENAME.match(uid):
+        return f"{uid}.{extension}"
+    return f"{uuid.uuid5(uuid.NAMESPACE_URL, uid)}.{extension}"
+
+
+class Progress:
+    """ Counts the outcomes of a bulk operation and reports them every PROGRESS_INTERVAL items. """
+
+    def __init__(self, action, progress, outcomes=("done", "failed")):
+        """
+        :param action: name of the operation, e.g. "import"
+        :param progress: function called with the intermediate statistics, None for quiet
+        :param outcomes: the outcomes that are counted
+        """
+        self.action = action
+        self.progress = progress
+        self.started = time.perf_counter()
+        self.stats = dict({"action": action}, **{outcome: 0 for outcome in outcomes})
+        self.processed = 0
+
+    def count(self, key):
+        self.stats[key] += 1
+        self.processed += 1
+        if self.progress and self.processed % PROGRESS_INTERVAL == 0:
+            self.progress(self.result())
+
+    def result(self):
+        duration = time.perf_counter() - self.started
+        return dict(
+            self.stats,
+            duration=duration,
+            per_second=self.processed / duration if duration else 0.0
+        )
@@ -1,10 +1,30 @@
 from datetime import datetime
 import uuid
+from xml.sax.saxutils import escape
 
+from caldav import Event
+from caldav.elements import cdav, dav
 
-def get_calendar_by_name(principal, calendar_name):
-    """ Get a calendar by its name. """
-    calendars = principal.calendars()
+from dav_functions.lazy_record import property_values
+from dav_functions.metrics import label_operation
+from dav_functions.multistatus import iter_multistatus
+from dav_functions.session import requester
+
+
+def get_calendar_by_name(principal, calendar_name, cache=None):
+    """
+    Get a calendar by its name.
+
+    :param principal: The CalDAV principal
+    :param calendar_name: the display name of the calendar
+    :param cache: optional CalendarDiscoveryCache, repeated lookups then skip the discovery requests
+    :return: The CalDAV calendar object or None if not found
+    """
+    if cache is not None:
+        with label_operation("caldav_calendars"):
+            return cache.calendar(principal, calendar_name)
+    with label_operation("caldav_calendars"):
+        calendars = principal.calendars()
     for calendar in calendars:
         if calendar.name == calendar_name:
             return calendar
@@ -36,7 +56,8 @@ def read_caldav_events(calendar):
     :return:
     """
     try:
-        events = calendar.events()
+        with label_operation("caldav_events"):
+            events = calendar.events()
         return events
     except Exception as e:
         print(f"Error reading events: {e}")
@@ -52,34 +73,209 @@ def read_caldav_events_range(calendar, start_date, end_date):
     :return: A list of CalDAV event objects
     """
     try:
-        return calendar.date_search(start=start_date, end=end_date)
+        with label_operation("caldav_date_search"):
+            return calendar.date_search(start=start_date, end=end_date)
     except Exception as e:
         print(f"Error reading events: {e}")
         return []
 
 
-def get_calendar_event_by_name(calendar, event_name):
+def ical_values(event_data, name):
+    """ The values of a property in iCalendar text, e.g. all UIDs. Folded lines are joined first. """
+    return property_values(event_data, name)
+
+
+def _events_from_report(calendar, body):
     """
-    Retrieves a calendar event by its name (summary) without limiting the date range.
-    
-    This is problematic without a date range, will not get all the results!
+    Sends a REPORT to the calendar and turns the returned calendar-data into events.
+
+    The ETag of every event is kept in its props, see caldav_event_etag.
+    """
+    response = calendar.client.report(str(calendar.url), body, depth=1)
+    results = response.expand_simple_props([dav.GetEtag(), cdav.CalendarData()])
+    return [
+        Event(
+            calendar.client,
+            url=calendar.url.join(href),
+            data=props[cdav.CalendarData.tag],
+            parent=calendar,
+            props={dav.GetEtag.tag: props.get(dav.GetEtag.tag)}
+        )
+        for href, props in results.items()
+        if props.get(cdav.CalendarData.tag)
+    ]
+
+
+def calendar_query_body(name, value, start_date=None, end_date=None):
+    """ The calendar-query for the events whose property contains a value, see query_caldav_events. """
+    time_range = ""
+    if start_date is not None and end_date is not None:
+        time_range = (
+            f'<c:time-range start="{start_date.strftime("%Y%m%dT%H%M%SZ")}" '
+            f'end="{end_date.strftime("%Y%m%dT%H%M%SZ")}"/>'
+        )
+    return f"""
+    <c:calendar-query xmlns:d="DAV:" xmlns:c="urn:ietf:params:xml:ns:caldav">
+        <d:prop>
+            <d:getetag />
+            <c:calendar-data />
+        </d:prop>
+        <c:filter>
+            <c:comp-filter name="VCALENDAR">
+                <c:comp-filter name="VEVENT">
+                    {time_range}
+                    <c:prop-filter name="{escape(name)}">
+                        <c:text-match collation="i;octet">{escape(value)}</c:text-match>
+                    </c:prop-filter>
+                </c:comp-filter>
+            </c:comp-filter>
+        </c:filter>
+    </c:calendar-query>
+    """
+
+
+def calendar_multiget_body(hrefs):
+    """ The calendar-multiget for the events with the given hrefs (paths). """
+    href_elements = "".join(f"<d:href>{escape(href)}</d:href>" for href in hrefs)
+    return f"""
+    <c:calendar-multiget xmlns:d="DAV:" xmlns:c="urn:ietf:params:xml:ns:caldav">
+        <d:prop>
+            <d:getetag />
+            <c:calendar-data />
+        </d:prop>
+        {href_elements}
+    </c:calendar-multiget>
+    """
+
+
+def query_caldav_events(calendar, name, value, start_date=None, end_date=None):
+    """
+    Finds events whose property contains a value with a calendar-query, so the server does the filtering.
+
+    The text-match is a substring match (RFC 4791), callers that need exact matches have to check the results.
 
     :param calendar: The CalDAV calendar object
-    :param event_name: The name (summary) of the event to retrieve
-    :return: The first matching CalDAV event object or None if not found
+    :param name: the property to filter on, e.g. "UID" or "SUMMARY"
+    :param value: the text the property has to contain
+    :param start_date: optional start of a time-range filter
+    :param end_date: optional end of a time-range filter
+    :return: A list of CalDAV event objects, None on error
     """
+    query = calendar_query_body(name, value, start_date, end_date)
     try:
-        # Fetch all events from the calendar
-        events = read_caldav_events(calendar)
-        for event in events:
-            if event.instance.vevent.summary.value == event_name:
-                return event
-        return None  # Event not found
+        with label_operation("caldav_query"):
+            return _events_from_report(calendar, query)
     except Exception as e:
-        print(f"Error occurred while searching for the event: {e}")
+        print(f"Error querying events: {e}")
         return None
 
 
+def first_exact_match(events, name, value):
+    """
+    The first event with a property of exactly this value, e.g. to drop the partial matches of a calendar-query.
+
+    :param events: caldav.Event or LazyRecord objects (anything with the iCalendar text in data), or None
+    :param name: the property name, e.g. "UID"
+    :param value: the value
+    :return: the event or None
+    """
+    for event in events or []:
+        if value in ical_values(event.data, name):
+            return event
+    return None
+
+
+def get_calendar_event_by_uid(calendar, event_uid):
+    """
+    Retrieves a calendar event by its UID with a single calendar-query, independent of the size of the calendar.
+
+    :param calendar: The CalDAV calendar object
+    :param event_uid: The unique identifier of the event
+    :return: The CalDAV event object (with its ETag, see caldav_event_etag) or None if not found
+    """
+    return first_exact_match(query_caldav_events(calendar, "UID", event_uid), "UID", event_uid)
+
+
+def get_calendar_events_by_href(calendar, hrefs):
+    """
+    Retrieves calendar events by their hrefs with a single calendar-multiget.
+
+    :param calendar: The CalDAV calendar object
+    :param hrefs: hrefs or URLs of the events
+    :return: A list of the CalDAV event objects that exist (with their ETags), None on error
+    """
+    query = calendar_multiget_body(calendar.url.join(str(href)).path for href in hrefs)
+    try:
+        with label_operation("caldav_multiget"):
+            return _events_from_report(calendar, query)
+    except Exception as e:
+        print(f"Error fetching events: {e}")
+        return None
+
+
+def iter_caldav_multiget(calendar_url, username, password, hrefs, session=None):
+    """
+    Fetches the given events with a single streamed calendar-multiget REPORT, without a caldav client.
+
+    :param calendar_url: URL of the CalDAV calendar
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param hrefs: hrefs of the events, as returned by the server
+    :param session: optional DAVSession to reuse pooled connections
+    :return: generator of MultistatusEntry (href, etag, data, status), raises an exception if an error occurs
+    """
+    with requester(session).request(
+            method="REPORT",
+            url=calendar_url.rstrip("/") + "/",
+            auth=(username, password),
+            data=calendar_multiget_body(hrefs).encode("utf-8"),
+            headers={
+                "content-type": "application/xml; charset=utf-8",
+                "depth": "1"
+            },
+            stream=True) as response:
+        response.raise_for_status()
+        yield from iter_multistatus(response)
+
+
+def caldav_event_etag(event):
+    """ The ETag of an event fetched with one of the functions above, None if unknown. """
+    return event.props.get(dav.GetEtag.tag)
+
+
+def get_calendar_event_by_name(calendar, event_name, store=None):
+    """
+    Retrieves a calendar event by its name (summary) without limiting the date range.
+
+    Without a store, the server filters the events by summary, so only candidates are transferred and parsed. With a
+    store, it is synced first (which only transfers what changed since the last sync) and the event is looked up in
+    its summary index.
+
+    :param calendar: The CalDAV calendar object
+    :param event_name: The name (summary) of the event to retrieve
+    :param store: optional CalDAVSyncClient of this calendar
+    :return: The first matching CalDAV event object or None if not found
+    """
+    if store is not None:
+        try:
+            with label_operation("caldav_sync"):
+                store.sync()
+        except Exception as e:
+            print(f"Error syncing the calendar: {e}")
+            return None
+        found = store.find(summary=event_name)
+        if not found:
+            return None
+        return Event(
+            calendar.client,
+            url=calendar.url.join(found[0]["href"]),
+            data=found[0]["data"],
+            parent=calendar,
+            props={dav.GetEtag.tag: found[0]["etag"]}
+        )
+    return first_exact_match(query_caldav_events(calendar, "SUMMARY", event_name), "SUMMARY", event_name)
+
+
 def get_calendar_event_by_name_range(calendar, event_name, start_date, end_date):
     """
     Retrieves a calendar event by its name (summary) within the given date range.
@@ -90,41 +286,96 @@ def get_calendar_event_by_name_range(calendar, event_name, start_date, end_date)
     :param end_date: The end date for fetching events
     :return: The first matching CalDAV event object or None if not found
     """
-    try:
-        events = read_caldav_events_range(calendar, start_date, end_date)
-        for event in events:
-            if event.instance.vevent.summary.value == event_name:
-                return event
-        return None  # Event not found
-    except Exception as e:
-        print(f"Error occurred while searching for the event: {e}")
-        return None
+    events = query_caldav_events(calendar, "SUMMARY", event_name, start_date, end_date)
+    return first_exact_match(events, "SUMMARY", event_name)
 
 
 def create_caldav_event(calendar, event_data):
+    """
+    Saves a new event in a CalDAV calendar.
+
+    :param calendar: The CalDAV calendar object
+    :param event_data: the event in iCalendar format, e.g. from create_event_data
+    :return: True if the event was created successfully, False otherwise
+    """
     try:
-        calendar.save_event(event_data)
+        with label_operation("caldav_save_event"):
+            calendar.save_event(event_data)
+        return True
     except Exception as e:
         print(f"Error creating event: {e}")
+        return False
 
 
-def delete_caldav_event(calendar, event_uid, start_date, end_date):
+def update_caldav_event_by_href(calendar, href, event_data, etag=None):
     """
-    Deletes an event from a CalDAV calendar based on its UID.
+    Replaces an event with a PUT to its href.
 
-    :param calendar: The calendar from which to delete the event
-    :param event_uid: The unique identifier of the event to be deleted
+    :param calendar: The CalDAV calendar object
+    :param href: href or URL of the event
+    :param event_data: the new event in iCalendar format
+    :param etag: if given, the update only succeeds if the event still has this ETag (If-Match)
+    :return: True if the event was updated successfully, False otherwise
+    """
+    headers = {"Content-Type": "text/calendar; charset=utf-8"}
+    if etag:
+        headers["If-Match"] = etag
+    if isinstance(event_data, str):
+        event_data = event_data.encode("utf-8")
+    try:
+        with label_operation("caldav_update"):
+            response = calendar.client.request(str(calendar.url.join(str(href))), "PUT", event_data, headers)
+        if response.status == 412:
+            print(f"Error updating the event: {href} was changed on the server")
+            return False
+        if response.status not in (200, 201, 204):
+            print(f"Error updating the event: status {response.status}")
+            return False
+        return True
+    except Exception as e:
+        print(f"Error updating the event: {e}")
+        return False
+
+
+def delete_caldav_event_by_href(calendar, href, etag=None):
+    """
+    Deletes an event with a DELETE to its href.
+
+    :param calendar: The CalDAV calendar object
+    :param href: href or URL of the event
+    :param etag: if given, the event is only deleted if it still has this ETag (If-Match)
     :return: True if the event was deleted successfully, False otherwise
     """
+    headers = {"If-Match": etag} if etag else {}
     try:
-        events = read_caldav_events_range(calendar, start_date, end_date)
-        for event in events:
-            if event.instance.vevent.uid.value == event_uid:
-                event.delete()
-                return True
-        return False  # Event not found
+        with label_operation("caldav_delete"):
+            response = calendar.client.request(str(calendar.url.join(str(href))), "DELETE", "", headers)
+        if response.status == 412:
+            print(f"Error deleting the event: {href} was changed on the server")
+            return False
+        if response.status not in (200, 204):
+            print(f"Error deleting the event: status {response.status}")
+            return False
+        return True
     except Exception as e:
         print(f"Error deleting the event: {e}")
         return False
 
 
+def delete_caldav_event(calendar, event_uid, start_date=None, end_date=None):
+    """
+    Deletes an event from a CalDAV calendar based on its UID.
+
+    The event is looked up with a UID calendar-query and deleted with its ETag as precondition, so this takes two
+    small requests regardless of the size of the calendar.
+
+    :param calendar: The calendar from which to delete the event
+    :param event_uid: The unique identifier of the event to be deleted
+    :param start_date: not needed anymore, kept for compatibility
+    :param end_date: not needed anymore, kept for compatibility
+    :return: True if the event was deleted successfully, False otherwise
+    """
+    event = get_calendar_event_by_uid(calendar, event_uid)
+    if event is None:
+        return False  # Event not found
+    return delete_caldav_event_by_href(calendar, event.url, caldav_event_etag(event))
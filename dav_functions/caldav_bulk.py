@@ -0,0 +1,240 @@
+"""
+Bulk import of iCalendar events, e.g. to reproduce a production-sized calendar on a test instance.
+
+The events are streamed from an .ics file (or any generator of calendar objects) and uploaded with a bounded number
+of concurrent PUTs. Afterwards the same events can be verified with calendar-multiget in batches.
+"""
+import re
+import uuid
+from urllib.parse import unquote, urlparse
+
+from dav_functions.bulk import Progress, print_progress, resource_filename
+from dav_functions.caldav import ical_values, iter_caldav_multiget
+from dav_functions.concurrency import bounded_map
+from dav_functions.session import requester
+
+DEFAULT_WORKERS = 8
+DEFAULT_BATCH_SIZE = 100
+
+PRODID = "PRODID:-//nextcloud-tests//bulk import//EN"
+
+TZID_PARAMETER = re.compile(r';TZID=("?)([^";:]+)\1')
+
+
+def _unfolded_lines(file):
+    """ Yields the logical lines of an iCalendar file, with folded continuation lines joined. """
+    current = None
+    for line in file:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def _calendar_object(events, timezones):
+    """ Wraps the VEVENTs of one UID into a VCALENDAR, together with the VTIMEZONEs they reference. """
+    tzids = []
+    for line in (line for event in events for line in event):
+        for match in TZID_PARAMETER.finditer(line.split(":", 1)[0]):
+            if match.group(2) not in tzids:
+                tzids.append(match.group(2))
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", PRODID]
+    for tzid in tzids:
+        lines.extend(timezones.get(tzid, []))
+    for event in events:
+        lines.extend(event)
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def iter_ics_events(ics_path):
+    """
+    Reads the events of an .ics file one by one, without loading the whole file.
+
+    Every yielded calendar object holds the VEVENTs of one UID (a recurring event and its changed occurrences, which
+    have to follow each other in the file, as exporters write them) and the VTIMEZONEs they reference. Events without
+    UID get one derived from their content.
+
+    :param ics_path: path to an iCalendar file with one or more VCALENDARs
+    :return: generator of iCalendar texts with CRLF line endings
+    """
+    timezones = {}  # TZID -> lines of the VTIMEZONE
+    group_uid, group = None, []
+    component, depth = None, 0
+    with open(ics_path, encoding="utf-8") as file:
+        for line in _unfolded_lines(file):
+            upper = line.upper()
+            if component is None:
+                if upper in ("BEGIN:VEVENT", "BEGIN:VTIMEZONE"):
+                    component, depth = [line], 1
+                continue
+            component.append(line)
+            if upper.startswith("BEGIN:"):
+                depth += 1
+            elif upper.startswith("END:"):
+                depth -= 1
+            if depth:
+                continue
+
+            if upper == "END:VTIMEZONE":
+                tzids = ical_values("\n".join(component), "TZID")
+                if tzids:
+                    timezones[tzids[0]] = component
+            else:
+                uids = ical_values("\n".join(component), "UID")
+                if uids:
+                    uid = uids[0]
+                else:
+                    # derived from the content, so reading the file again for verify_events gives the same UID
+                    uid = str(uuid.uuid5(uuid.NAMESPACE_URL, "\n".join(component)))
+                    component.insert(1, f"UID:{uid}")
+                if group and uid != group_uid:
+                    yield _calendar_object(group, timezones)
+                    group = []
+                group_uid = uid
+                group.append(component)
+            component = None
+    if group:
+        yield _calendar_object(group, timezones)
+
+
+def event_uid(event_data):
+    """ The UID of a calendar object, or None if it has none. """
+    uids = ical_values(event_data, "UID")
+    return uids[0] if uids else None
+
+
+def event_filename(uid):
+    """ The file name an event is stored under: the UID if it is safe to use in a URL, otherwise derived from it. """
+    return resource_filename(uid, "ics")
+
+
+def import_events(
+        calendar_url,
+        username,
+        password,
+        events,
+        workers=DEFAULT_WORKERS,
+        progress=print_progress,
+        session=None):
+    """
+    Uploads calendar objects to a calendar.
+
+    Every object is stored as <UID>.ics. Events are only created, never overwritten (If-None-Match: *); events that
+    already exist are counted as existing.
+
+    :param calendar_url: URL of the CalDAV calendar
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param events: iterable of iCalendar texts with a UID each, e.g. from iter_ics_events or a generator
+    :param workers: number of concurrent PUTs
+    :param progress: function called with the intermediate statistics every PROGRESS_INTERVAL events, None for quiet
+    :param session: optional DAVSession to reuse pooled connections, should have a pool size of at least workers
+    :return: dictionary of {action, done, existing, failed, duration, per_second}
+    """
+    http = requester(session)
+    tracker = Progress("import", progress, ("done", "existing", "failed"))
+    calendar_url = calendar_url.rstrip("/")
+
+    def put_event(event_data):
+        response = http.put(
+            f"{calendar_url}/{event_filename(event_uid(event_data))}",
+            data=event_data.encode("utf-8"),
+            auth=(username, password),
+            headers={
+                'content-type': 'text/calendar; charset=utf-8',
+                'If-None-Match': '*'
+            }
+        )
+        if response.status_code == 412:
+            return "existing"
+        response.raise_for_status()
+        return "done"
+
+    for event_data, outcome, error in bounded_map(put_event, events, workers):
+        if error is not None:
+            print(f"Error importing event {event_uid(event_data)}: {error}")
+            tracker.count("failed")
+        else:
+            tracker.count(outcome)
+    return tracker.result()
+
+
+def import_ics(
+        calendar_url,
+        username,
+        password,
+        ics_path,
+        workers=DEFAULT_WORKERS,
+        progress=print_progress,
+        session=None):
+    """
+    Uploads all events of an .ics file to a calendar, see import_events.
+
+    :return: dictionary of {action, done, existing, failed, duration, per_second}
+    """
+    return import_events(
+        calendar_url, username, password, iter_ics_events(ics_path), workers, progress, session)
+
+
+def verify_events(
+        calendar_url,
+        username,
+        password,
+        events,
+        batch_size=DEFAULT_BATCH_SIZE,
+        progress=print_progress,
+        session=None):
+    """
+    Checks that imported calendar objects exist on the server, batch_size events per calendar-multiget.
+
+    :param calendar_url: URL of the CalDAV calendar
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param events: the imported iCalendar texts, e.g. iter_ics_events again or a new generator with the same seed
+    :param batch_size: number of events per calendar-multiget
+    :param progress: function called with the intermediate statistics every PROGRESS_INTERVAL events, None for quiet
+    :param session: optional DAVSession to reuse pooled connections
+    :return: dictionary of {action, done, missing, failed, duration, per_second}
+    """
+    tracker = Progress("verify", progress, ("done", "missing", "failed"))
+    calendar_path = urlparse(calendar_url).path.rstrip("/")
+
+    def verify_batch(uids):
+        hrefs = {f"{calendar_path}/{event_filename(uid)}": uid for uid in uids}
+        requested = list(hrefs)
+        hrefs = {unquote(href): uid for href, uid in hrefs.items()}
+        try:
+            for entry in iter_caldav_multiget(calendar_url, username, password, requested, session=session):
+                uid = hrefs.pop(unquote(entry.href), None)
+                if uid is None:
+                    continue
+                if entry.data and uid in ical_values(entry.data, "UID"):
+                    tracker.count("done")
+                else:
+                    print(f"Event {uid} missing: status {entry.status}")
+                    tracker.count("missing")
+        except Exception as e:
+            print(f"Error verifying events: {e}")
+            for _ in hrefs:
+                tracker.count("failed")
+            return
+        # hrefs the server did not answer for at all
+        for uid in hrefs.values():
+            print(f"Event {uid} missing")
+            tracker.count("missing")
+
+    batch = []
+    for event_data in events:
+        batch.append(event_uid(event_data))
+        if len(batch) >= batch_size:
+            verify_batch(batch)
+            batch = []
+    if batch:
+        verify_batch(batch)
+    return tracker.result()
@@ -0,0 +1,215 @@
+"""
+Cache for CalDAV calendar discovery.
+
+Finding a calendar by name normally takes a PROPFIND for the current user principal, one for the calendar-home-set
+and one listing all calendars. The cache remembers the principal URL, the calendar-home-set and the name -> URL
+mapping, so lookups within the TTL do not send any request. After the TTL only the calendar-home-set is listed
+again (one PROPFIND); the full discovery is only repeated if that fails.
+
+The CTag and sync-token of every calendar are kept as well, changed() tells with a single small PROPFIND whether the
+content of a calendar changed since it was cached. They describe the events, not the name -> URL mapping, so
+calendar() does not check them (that would cost the request the cache saves); callers that cache events call changed()
+before using them.
+"""
+import json
+import os
+import threading
+import time
+
+from caldav import Calendar, Principal
+from caldav.elements import cdav, dav
+
+# seconds a discovered calendar-home-set listing is used without asking the server
+DEFAULT_TTL = 300
+
+CTAG_TAG = "{http://calendarserver.org/ns/}getctag"
+
+LIST_CALENDARS_BODY = """<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="DAV:" xmlns:cs="http://calendarserver.org/ns/">
+    <d:prop>
+        <d:resourcetype />
+        <d:displayname />
+        <cs:getctag />
+        <d:sync-token />
+    </d:prop>
+</d:propfind>
+"""
+
+CALENDAR_TAGS_BODY = """<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="DAV:" xmlns:cs="http://calendarserver.org/ns/">
+    <d:prop>
+        <cs:getctag />
+        <d:sync-token />
+    </d:prop>
+</d:propfind>
+"""
+
+
+def _text(props, tag):
+    element = props.get(tag)
+    return element.text if element is not None else None
+
+
+class CalendarDiscoveryCache:
+    """
+    Memoizes the calendar-home-set and the calendars of principals, keyed by principal URL.
+
+    The cache can be shared by threads (e.g. the virtual users of a load run) and stored as JSON, so later runs skip
+    the discovery as well.
+    """
+
+    def __init__(self, cache_path=None, ttl=DEFAULT_TTL):
+        """
+        :param cache_path: optional JSON file the cache is loaded from and saved to
+        :param ttl: seconds a calendar listing is used before it is refreshed
+        """
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.principals = {}  # "<client url> <username>" -> principal URL
+        self.entries = {}  # principal URL -> {"home_set": URL, "fetched": timestamp, "calendars": {name: {...}}}
+        self._lock = threading.RLock()
+        if cache_path and os.path.exists(cache_path):
+            self.load()
+
+    def load(self):
+        with open(self.cache_path) as file:
+            cache = json.load(file)
+        self.principals = cache["principals"]
+        self.entries = cache["entries"]
+
+    def save(self):
+        with self._lock:
+            with open(self.cache_path, "w") as file:
+                json.dump({"principals": self.principals, "entries": self.entries}, file)
+
+    def _changed(self):
+        if self.cache_path:
+            self.save()
+
+    def principal(self, client):
+        """
+        The principal of the client's user, without a request if it was discovered before.
+
+        :param client: a caldav.DAVClient
+        :return: caldav.Principal
+        """
+        key = f"{client.url} {client.username}"
+        with self._lock:
+            url = self.principals.get(key)
+        if url is not None:
+            return Principal(client, url=url)
+        principal = client.principal()
+        with self._lock:
+            self.principals[key] = str(principal.url)
+            self._changed()
+        return principal
+
+    def calendar(self, principal, calendar_name):
+        """
+        Looks up a calendar by its name.
+
+        Within the TTL this does not send a request. An unknown name or an expired entry lead to a new listing of
+        the calendar-home-set, as the calendar might have been created or renamed in the meantime. Changes of the
+        events are not checked here, see changed().
+
+        :param principal: caldav.Principal
+        :param calendar_name: the display name of the calendar
+        :return: caldav.Calendar or None if the principal has no calendar of that name
+        """
+        key = str(principal.url)
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None or time.time() - entry["fetched"] > self.ttl or calendar_name not in entry["calendars"]:
+            entry = self.refresh(principal)
+        found = entry["calendars"].get(calendar_name)
+        if found is None:
+            return None
+        return Calendar(principal.client, url=found["url"], name=calendar_name, parent=principal)
+
+    def refresh(self, principal):
+        """
+        Lists the calendars of the principal again. Uses the cached calendar-home-set if there is one and only falls
+        back to discovering it if listing the cached one fails.
+
+        :return: the new cache entry
+        """
+        key = str(principal.url)
+        with self._lock:
+            entry = self.entries.get(key)
+        calendars = None
+        if entry is not None:
+            try:
+                calendars = self._list_calendars(principal.client, entry["home_set"])
+            except Exception as e:
+                print(f"Cached calendar home of {key} not usable anymore, discovering it again: {e}")
+        if calendars is None:
+            home_set = str(principal.calendar_home_set.url)
+            calendars = self._list_calendars(principal.client, home_set)
+        else:
+            home_set = entry["home_set"]
+
+        entry = {"home_set": home_set, "fetched": time.time(), "calendars": calendars}
+        with self._lock:
+            self.entries[key] = entry
+            self._changed()
+        return entry
+
+    @staticmethod
+    def _list_calendars(client, home_set):
+        """
+        Lists the calendars in a calendar-home-set with one PROPFIND.
+
+        :return: dictionary of {name: {url, ctag, sync_token}}
+        """
+        response = client.propfind(home_set, LIST_CALENDARS_BODY, depth=1)
+        if response.status >= 400:
+            raise Exception(f"PROPFIND of {home_set} failed with status {response.status}")
+        calendars = {}
+        for href, props in response.find_objects_and_props().items():
+            resource_type = props.get(dav.ResourceType.tag)
+            if resource_type is None or resource_type.find(cdav.Calendar.tag) is None:
+                continue
+            url = str(client.url.join(href))
+            name = _text(props, dav.DisplayName.tag) or url.rstrip("/").split("/")[-1]
+            calendars[name] = {
+                "url": url,
+                "ctag": _text(props, CTAG_TAG),
+                "sync_token": _text(props, dav.SyncToken.tag)
+            }
+        return calendars
+
+    def changed(self, calendar):
+        """
+        Checks with a Depth: 0 PROPFIND whether the CTag or sync-token of a calendar changed since it was cached, or
+        since the last call, and stores the new values. This is how callers invalidate what they derived from the
+        events of the calendar.
+
+        :param calendar: a caldav.Calendar returned by calendar()
+        :return: True if the content of the calendar changed (or it is not cached), False otherwise
+        """
+        response = calendar.client.propfind(str(calendar.url), CALENDAR_TAGS_BODY, depth=0)
+        if response.status >= 400:
+            raise Exception(f"PROPFIND of {calendar.url} failed with status {response.status}")
+        props = next(iter(response.find_objects_and_props().values()), {})
+        tags = {"ctag": _text(props, CTAG_TAG), "sync_token": _text(props, dav.SyncToken.tag)}
+
+        with self._lock:
+            for entry in self.entries.values():
+                for cached in entry["calendars"].values():
+                    if cached["url"] == str(calendar.url):
+                        changed = any(cached[name] != value for name, value in tags.items())
+                        if changed:
+                            cached.update(tags)
+                            self._changed()
+                        return changed
+        return True
+
+    def invalidate(self, principal=None):
+        """ Forgets the calendars of one principal, or everything. """
+        with self._lock:
+            if principal is None:
+                self.principals = {}
+                self.entries = {}
+            else:
+                self.entries.pop(str(principal.url), None)
+            self._changed()
@@ -0,0 +1,74 @@
+"""
+Incremental CalDAV sync (RFC 6578) with a local event store.
+
+The store keeps href, ETag and iCalendar text of every event together with its UID and summaries, and indexes the
+events by both, so looking up an event by name needs neither a date range nor downloading the calendar again.
+"""
+from dav_functions.caldav import ical_values, iter_caldav_multiget
+from dav_functions.dav_sync import CollectionSyncClient
+
+
+class CalDAVSyncClient(CollectionSyncClient):
+    """
+    Keeps a local copy of a calendar in sync with the server.
+
+    Every cached event is {"etag", "data", "uid", "summaries"}; recurring events with changed occurrences can have
+    several summaries. The cache can be stored as JSON, so later runs only fetch what changed in between.
+    """
+
+    resource_key = "events"
+
+    @property
+    def events(self):
+        """ The cached events: href -> {"etag", "data", "uid", "summaries"} """
+        return self.resources
+
+    def _store(self, href, etag, data):
+        uids = ical_values(data, "UID")
+        self.resources[href] = {
+            "etag": etag,
+            "data": data,
+            "uid": uids[0] if uids else None,
+            "summaries": sorted(set(ical_values(data, "SUMMARY")))
+        }
+        self._index(href)
+
+    def _forget(self, href):
+        event = self.resources.pop(href)
+        self._by_uid.get(event["uid"], set()).discard(href)
+        for summary in event["summaries"]:
+            self._by_summary.get(summary, set()).discard(href)
+
+    def _reindex(self):
+        self._by_uid = {}  # UID -> set of hrefs
+        self._by_summary = {}  # summary -> set of hrefs
+        for href in self.resources:
+            self._index(href)
+
+    def _index(self, href):
+        event = self.resources[href]
+        self._by_uid.setdefault(event["uid"], set()).add(href)
+        for summary in event["summaries"]:
+            self._by_summary.setdefault(summary, set()).add(href)
+
+    def _multiget(self, hrefs):
+        return [
+            (entry.href, entry.etag, entry.data)
+            for entry in iter_caldav_multiget(self.collection_url, *self.auth, hrefs, session=self.session)
+            if entry.data
+        ]
+
+    def find(self, uid=None, summary=None):
+        """
+        Finds cached events by exact UID and/or summary. Does not contact the server.
+
+        :return: list of dictionary of {href, etag, data, uid, summaries}, ordered by href
+        """
+        candidates = None
+        for index, value in ((self._by_uid, uid), (self._by_summary, summary)):
+            if value is not None:
+                hrefs = index.get(value, set())
+                candidates = hrefs if candidates is None else candidates & hrefs
+        if candidates is None:
+            candidates = self.resources
+        return [dict(self.resources[href], href=href) for href in sorted(candidates)]
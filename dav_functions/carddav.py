@@ -1,14 +1,19 @@
 import requests
 import vobject
 import uuid
-from xml.etree import ElementTree as ET
+from urllib.parse import unquote, urlparse
+from xml.sax.saxutils import escape
+
+from dav_functions.lazy_record import LazyContact
+from dav_functions.multistatus import iter_multistatus
+from dav_functions.session import requester
 
 
 # relevant docs:
 # https://eventable.github.io/vobject/
 # https://sabre.io/xml/
 
-def create_carddav_contact(carddav_url, username, password, contact_info):
+def create_carddav_contact(carddav_url, username, password, contact_info, session=None):
     """
     Creates a new contact in the CardDAV server.
 
@@ -16,6 +21,7 @@ def create_carddav_contact(carddav_url, username, password, contact_info):
     :param username: Username for authentication
     :param password: Password for authentication
     :param contact_info: Dictionary with contact information (e.g., name, email)
+    :param session: optional DAVSession to reuse pooled connections
     :return: True if contact is created successfully, False otherwise
     """
     # Create a vCard
@@ -30,7 +36,7 @@ def create_carddav_contact(carddav_url, username, password, contact_info):
     print("Serialized vCard:", card_string)  # Debug print
     
     try:
-        response = requests.put(
+        response = requester(session).put(
             f"{carddav_url}/{contact_filename}",
             data=card_string,
             auth=(username, password),
@@ -54,7 +60,8 @@ def update_carddav_contact(
         username: str,
         password: str,
         card: vobject,
-        href: str):
+        href: str,
+        session=None):
     """
     Updates a contact in the CardDAV server.
 
@@ -63,6 +70,7 @@ def update_carddav_contact(
     :param password: Password for authentication
     :param card: a vobject.vCard containing updated information
     :param href: the current path or only the filename including extension, e.g. <uuid>.vcf
+    :param session: optional DAVSession to reuse pooled connections
     :return: True if contact is created successfully, False otherwise
     """
     contact_filename = href.split("/")[-1]
@@ -72,7 +80,7 @@ def update_carddav_contact(
     print("Serialized vCard:", card_string)  # Debug print
     
     try:
-        response = requests.put(
+        response = requester(session).put(
             f"{carddav_url}/{contact_filename}",
             data=card_string,
             auth=(username, password),
@@ -91,14 +99,19 @@ def update_carddav_contact(
         return False
 
 
-def fetch_carddav_contacts(carddav_url, username, password):
+def iter_carddav_contacts(carddav_url, username, password, session=None):
     """
-    Fetches contacts from the CardDAV server using PROPFIND.
+    Streams all contacts of the CardDAV server address book.
+
+    The response is parsed while it is downloaded, so memory doesn't grow with the size of the address book (as long
+    as the caller doesn't keep all contacts). The cards are only parsed by vobject when their vcard is used.
 
     :param carddav_url: URL to the CardDAV server address book
     :param username: Username for authentication
     :param password: Password for authentication
-    :return: list of dictionary of {fn, href, vcard}
+    :param session: optional DAVSession to reuse pooled connections
+    :return: generator of LazyContact (readable as dictionary of {fn, href, etag, vcard}), raises an exception if an
+        error occurs
     """
     # Define the headers
     headers = {
@@ -106,7 +119,7 @@ def fetch_carddav_contacts(carddav_url, username, password):
         "depth": "1"
     }
 
-    # Define the body for the PROPFIND request
+    # Define the body for the REPORT request
     report_request_body = """
     <card:addressbook-query xmlns:d="DAV:" xmlns:card="urn:ietf:params:xml:ns:carddav">
         <d:prop>
@@ -117,74 +130,235 @@ def fetch_carddav_contacts(carddav_url, username, password):
     </card:addressbook-query>
     """
 
-    try:
-        response = requests.request(
+    with requester(session).request(
             method="REPORT",
             url=carddav_url + "/",
             auth=(username, password),
             data=report_request_body,
-            headers=headers
-        )
+            headers=headers,
+            stream=True) as response:
         response.raise_for_status()
+        yield from contacts_from_entries(iter_multistatus(response))
+
+
+def fetch_carddav_contacts(carddav_url, username, password, session=None):
+    """
+    Fetches contacts from the CardDAV server using REPORT.
+
+    :param carddav_url: URL to the CardDAV server address book
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param session: optional DAVSession to reuse pooled connections
+    :return: list of LazyContact (readable as dictionary of {fn, href, etag, vcard})
+    """
+    try:
+        return list(iter_carddav_contacts(carddav_url, username, password, session=session))
+    except Exception as e:
+        print(f"Error fetching contacts: {e}")
+        return None
+
+
+def addressbook_query_body(criteria, match_type="equals", properties=None):
+    """ The addressbook-query for the cards matching all criteria ({property: value}), see find_carddav_contacts. """
+    prop_filters = "".join(
+        f"""
+            <card:prop-filter name="{name}">
+                <card:text-match collation="i;unicode-casemap" match-type="{match_type}">{escape(value)}</card:text-match>
+            </card:prop-filter>"""
+        for name, value in criteria.items()
+    )
+    if properties:
+        # the filtered properties are always requested, so the results can be compared exactly on the client
+        properties = list(properties) + [name for name in criteria if name not in properties]
+    requested_properties = "".join(f'<card:prop name="{name}" />' for name in properties or [])
+    return f"""
+    <card:addressbook-query xmlns:d="DAV:" xmlns:card="urn:ietf:params:xml:ns:carddav">
+        <d:prop>
+            <d:getetag />
+            <card:address-data>{requested_properties}</card:address-data>
+        </d:prop>
+        <card:filter test="allof">{prop_filters}
+        </card:filter>
+    </card:addressbook-query>
+    """
+
+
+def find_carddav_contacts(
+        carddav_url: str,
+        username: str,
+        password: str,
+        fn: str = None,
+        uid: str = None,
+        email: str = None,
+        match_type: str = "equals",
+        properties=None,
+        session=None):
+    """
+    Finds contacts by full name, UID and/or email, letting the server do the filtering.
 
-        # Parse the XML response if needed
-        tree = ET.fromstring(response.content)
-        contacts = []
-        for response_element in tree.findall('.//{DAV:}response'):
-            href = response_element.find('{DAV:}href').text
-            address_data_element = response_element.find('.//{urn:ietf:params:xml:ns:carddav}address-data')
-            if address_data_element is not None:
-                vcard = vobject.readOne(address_data_element.text)
-                fn = vcard.fn.value if hasattr(vcard, 'fn') else "Unknown"
-                contacts.append({
-                    "fn": fn,
-                    "href": href,
-                    "vcard": vcard})
-        return contacts
+    Sends an addressbook-query REPORT with a prop-filter per given criterion (all of them have to match), so only the
+    matching cards are transferred and parsed. The server compares case-insensitively, so with match_type "equals"
+    the results are compared exactly again on the client.
 
+    :param carddav_url: URL to the CardDAV server address book
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param fn: full name of the contact
+    :param uid: UID of the contact
+    :param email: one of the email addresses of the contact
+    :param match_type: equals, contains, starts-with or ends-with
+    :param properties: optional list of vCard properties to request (e.g. ["FN", "UID"]) instead of the whole card;
+        the searched properties are always requested as well. Servers that don't support this return the whole card.
+        Don't update cards that were fetched this way.
+    :param session: optional DAVSession to reuse pooled connections
+    :return: list of LazyContact (readable as dictionary of {fn, href, etag, vcard}) or None if an error occurs
+    """
+    criteria = {"FN": fn, "UID": uid, "EMAIL": email}
+    criteria = {name: value for name, value in criteria.items() if value is not None}
+    if not criteria:
+        raise ValueError("At least one of fn, uid or email is needed")
+
+    report_request_body = addressbook_query_body(criteria, match_type, properties)
+
+    try:
+        with requester(session).request(
+                method="REPORT",
+                url=carddav_url + "/",
+                auth=(username, password),
+                data=report_request_body.encode("utf-8"),
+                headers={
+                    "content-type": "application/xml; charset=utf-8",
+                    "depth": "1"
+                },
+                stream=True) as response:
+            response.raise_for_status()
+            return [
+                contact for contact in contacts_from_entries(iter_multistatus(response))
+                if match_type != "equals" or matches_exactly(contact, criteria)
+            ]
     except Exception as e:
         print(f"Error fetching contacts: {e}")
         return None
 
 
+def iter_carddav_hrefs(carddav_url, username, password, session=None):
+    """
+    Lists the cards of the address book without their content (PROPFIND with Depth: 1).
+
+    :param carddav_url: URL to the CardDAV server address book
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param session: optional DAVSession to reuse pooled connections
+    :return: generator of tuples (href, etag), raises an exception if an error occurs
+    """
+    address_book_path = unquote(urlparse(carddav_url).path).rstrip("/")
+    with requester(session).request(
+            method="PROPFIND",
+            url=carddav_url + "/",
+            auth=(username, password),
+            data='<d:propfind xmlns:d="DAV:"><d:prop><d:getetag /></d:prop></d:propfind>',
+            headers={
+                "content-type": "application/xml",
+                "depth": "1"
+            },
+            stream=True) as response:
+        response.raise_for_status()
+        for entry in iter_multistatus(response):
+            if unquote(entry.href).rstrip("/") != address_book_path:
+                yield entry.href, entry.etag
+
+
+def iter_carddav_multiget(carddav_url, username, password, hrefs, session=None):
+    """
+    Fetches the given cards with a single addressbook-multiget REPORT.
+
+    :param carddav_url: URL to the CardDAV server address book
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param hrefs: hrefs of the cards, as returned by the server
+    :param session: optional DAVSession to reuse pooled connections
+    :return: generator of MultistatusEntry (href, etag, data, status), raises an exception if an error occurs
+    """
+    href_elements = "".join(f"<d:href>{escape(href)}</d:href>" for href in hrefs)
+    report_request_body = f"""
+    <card:addressbook-multiget xmlns:d="DAV:" xmlns:card="urn:ietf:params:xml:ns:carddav">
+        <d:prop>
+            <d:getetag />
+            <card:address-data />
+        </d:prop>
+        {href_elements}
+    </card:addressbook-multiget>
+    """
+    with requester(session).request(
+            method="REPORT",
+            url=carddav_url.rstrip("/") + "/",
+            auth=(username, password),
+            data=report_request_body.encode("utf-8"),
+            headers={
+                "content-type": "application/xml; charset=utf-8",
+                "depth": "1"
+            },
+            stream=True) as response:
+        response.raise_for_status()
+        yield from iter_multistatus(response)
+
+
+def matches_exactly(contact, criteria):
+    """ Checks that every criterion matches one of the values of its property exactly, without parsing the card. """
+    return all(value in contact.values(name) for name, value in criteria.items())
+
+
+def contacts_from_entries(entries):
+    """
+    Turns the entries of an addressbook-query or addressbook-multiget response into contacts.
+
+    :param entries: iterable of MultistatusEntry
+    :return: generator of LazyContact
+    """
+    for entry in entries:
+        if entry.data is not None:
+            yield LazyContact.from_entry(entry)
+
+
 def fetch_carddav_contact(
         carddav_url: str,
         username: str,
         password: str,
-        fn: str):
+        fn: str,
+        session=None):
     """
-    Fetches a single contact from the CardDAV server using PROPFIND.
+    Fetches a single contact from the CardDAV server by its full name.
+
+    Only the matching cards are fetched, see find_carddav_contacts.
 
     :param carddav_url: URL to the CardDAV server address book
     :param username: Username for authentication
     :param password: Password for authentication
     :param fn: full name of the contact
-    :return: dictionary of {fn, href, vcard}
+    :param session: optional DAVSession to reuse pooled connections
+    :return: LazyContact (readable as dictionary of {fn, href, etag, vcard})
     """
-    # Fetch contacts
-    contacts = fetch_carddav_contacts(
+    contacts = find_carddav_contacts(
         carddav_url,
         username,
-        password)
+        password,
+        fn=fn,
+        session=session)
     if contacts is None:
         raise Exception("No contacts found")
-    
-    retrieved_contact = ""
-    for contact in contacts:
-        if contact["fn"] == fn:
-            retrieved_contact = contact
-    
-    if retrieved_contact == "":
+
+    if not contacts:
         raise Exception("Contact not found")
-    
-    return retrieved_contact
+
+    return contacts[-1]
 
 
 def delete_carddav_contact(
         carddav_url: str,
         username: str,
         password: str,
-        href: str):
+        href: str,
+        session=None):
     """
     Deletes a contact from the CardDAV server.
 
@@ -192,12 +366,13 @@ def delete_carddav_contact(
     :param username: Username for authentication
     :param password: Password for authentication
     :param href: the current path or only the filename including extension, e.g. <uuid>.vcf
+    :param session: optional DAVSession to reuse pooled connections
     :return: True if contact is deleted successfully, False otherwise
     """
     contact_filename = href.split("/")[-1]
 
     try:
-        response = requests.delete(
+        response = requester(session).delete(
             f"{carddav_url}/{contact_filename}",
             auth=(username, password)
         )
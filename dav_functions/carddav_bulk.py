@@ -0,0 +1,182 @@
+"""
+Bulk import and export of CardDAV address books, e.g. to seed a test instance with a copy-sized dataset.
+
+The import streams a multi-contact .vcf file (or any generator of cards) and uploads the cards with a bounded number
+of concurrent PUTs, the export lists the address book and downloads the cards with addressbook-multiget in batches.
+"""
+import uuid
+
+from dav_functions.bulk import Progress, print_progress, resource_filename
+from dav_functions.carddav import iter_carddav_hrefs, iter_carddav_multiget
+from dav_functions.concurrency import bounded_map
+from dav_functions.lazy_record import property_values
+from dav_functions.session import requester
+
+DEFAULT_WORKERS = 8
+DEFAULT_BATCH_SIZE = 100
+
+
+def iter_vcards(vcf_path):
+    """
+    Reads the cards of a .vcf file one by one, without loading the whole file.
+
+    :param vcf_path: path to a file with one or more vCards
+    :return: generator of vCard texts with CRLF line endings
+    """
+    lines = []
+    with open(vcf_path, encoding="utf-8") as file:
+        for line in file:
+            line = line.rstrip("\r\n")
+            if line.upper() == "BEGIN:VCARD":
+                lines = [line]
+            elif lines:
+                lines.append(line)
+                if line.upper() == "END:VCARD":
+                    yield "\r\n".join(lines) + "\r\n"
+                    lines = []
+
+
+def card_uid(card):
+    """ The UID of a vCard text, or None if it has none. """
+    uids = property_values(card, "UID")
+    return uids[0].strip() if uids else None
+
+
+def card_filename(uid):
+    """ The file name a card is stored under: the UID if it is safe to use in a URL, otherwise derived from it. """
+    return resource_filename(uid, "vcf")
+
+
+def _with_uid(card):
+    """
+    Returns the UID of the card and the card, adding a new UID if it has none. The UID line is inserted before
+    END:VCARD (in any case) with the line ending of the card.
+    """
+    uid = card_uid(card)
+    if uid is not None:
+        return uid, card
+    uid = str(uuid.uuid4())
+    lines = card.splitlines(keepends=True)
+    for index in range(len(lines) - 1, 0, -1):
+        if lines[index].strip().upper() == "END:VCARD":
+            previous = lines[index - 1]
+            ending = previous[len(previous.rstrip("\r\n")):]
+            lines.insert(index, f"UID:{uid}{ending}")
+            return uid, "".join(lines)
+    raise ValueError("the card has no END:VCARD line")
+
+
+def import_cards(
+        carddav_url,
+        username,
+        password,
+        cards,
+        workers=DEFAULT_WORKERS,
+        progress=print_progress,
+        session=None):
+    """
+    Uploads cards to an address book.
+
+    Every card is stored as <UID>.vcf (cards without UID get one). Cards are only created, never overwritten
+    (If-None-Match: *); cards that already exist are counted as existing.
+
+    :param carddav_url: URL to the CardDAV server address book
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param cards: iterable of vCard texts, e.g. from iter_vcards or a generator
+    :param workers: number of concurrent PUTs
+    :param progress: function called with the intermediate statistics every PROGRESS_INTERVAL cards, None for quiet
+    :param session: optional DAVSession to reuse pooled connections, should have a pool size of at least workers
+    :return: dictionary of {action, done, existing, failed, duration, per_second}
+    """
+    http = requester(session)
+    tracker = Progress("import", progress, ("done", "existing", "failed"))
+
+    def put_card(card):
+        uid, card = _with_uid(card)
+        response = http.put(
+            f"{carddav_url}/{card_filename(uid)}",
+            data=card.encode("utf-8"),
+            auth=(username, password),
+            headers={
+                'content-type': 'text/vcard; charset=utf-8',
+                'If-None-Match': '*'
+            }
+        )
+        if response.status_code == 412:
+            return "existing"
+        response.raise_for_status()
+        return "done"
+
+    for card, outcome, error in bounded_map(put_card, cards, workers):
+        if error is not None:
+            print(f"Error importing card {card_uid(card)}: {error}")
+            tracker.count("failed")
+        else:
+            tracker.count(outcome)
+    return tracker.result()
+
+
+def import_vcf(
+        carddav_url,
+        username,
+        password,
+        vcf_path,
+        workers=DEFAULT_WORKERS,
+        progress=print_progress,
+        session=None):
+    """
+    Uploads all cards of a .vcf file to an address book, see import_cards.
+
+    :return: dictionary of {action, done, existing, failed, duration, per_second}
+    """
+    return import_cards(carddav_url, username, password, iter_vcards(vcf_path), workers, progress, session)
+
+
+def export_address_book(
+        carddav_url,
+        username,
+        password,
+        output_path,
+        batch_size=DEFAULT_BATCH_SIZE,
+        progress=print_progress,
+        session=None):
+    """
+    Downloads all cards of an address book into a .vcf file.
+
+    The cards are listed with PROPFIND and fetched with addressbook-multiget, batch_size cards per request. They are
+    written to the file as they arrive, so memory only depends on the batch size.
+
+    :param carddav_url: URL to the CardDAV server address book
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param output_path: the .vcf file to write
+    :param batch_size: number of cards per addressbook-multiget
+    :param progress: function called with the intermediate statistics every PROGRESS_INTERVAL cards, None for quiet
+    :param session: optional DAVSession to reuse pooled connections
+    :return: dictionary of {action, done, failed, bytes, duration, per_second}
+    """
+    tracker = Progress("export", progress)
+    tracker.stats["bytes"] = 0
+
+    def export_batch(hrefs, file):
+        for entry in iter_carddav_multiget(carddav_url, username, password, hrefs, session=session):
+            if entry.data:
+                text = entry.data.replace("\r\n", "\n").rstrip("\n") + "\n"
+                file.write(text)
+                tracker.stats["bytes"] += len(text.encode("utf-8")) + text.count("\n")  # written with CRLF
+                tracker.count("done")
+            else:
+                print(f"Error exporting card {entry.href}: status {entry.status}")
+                tracker.count("failed")
+
+    with open(output_path, "w", encoding="utf-8", newline="\r\n") as file:
+        batch = []
+        for href, etag in iter_carddav_hrefs(carddav_url, username, password, session=session):
+            batch.append(href)
+            if len(batch) >= batch_size:
+                export_batch(batch, file)
+                batch = []
+        if batch:
+            export_batch(batch, file)
+    return tracker.result()
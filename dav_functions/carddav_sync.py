@@ -0,0 +1,75 @@
+"""
+Incremental CardDAV sync (RFC 6578) with a local card cache.
+
+The first sync downloads the whole address book, every following sync only asks the server what changed since the
+last sync-token and downloads the changed cards with addressbook-multiget. Lookups are served from the cache.
+"""
+from dav_functions.carddav import iter_carddav_multiget
+from dav_functions.dav_sync import CollectionSyncClient, InvalidSyncToken  # noqa: F401 (re-exported for importers)
+from dav_functions.lazy_record import LazyContact
+
+
+class CardDAVSyncClient(CollectionSyncClient):
+    """
+    Keeps a local copy of an address book in sync with the server.
+
+    The cache holds the sync-token and for every card its href, ETag and vCard text. It can be stored as JSON, so
+    later runs only fetch what changed in between.
+    """
+
+    resource_key = "cards"
+
+    @property
+    def cards(self):
+        """ The cached cards: href -> {"etag": ..., "data": vCard text} """
+        return self.resources
+
+    def _store(self, href, etag, data):
+        super()._store(href, etag, data)
+        self._records.pop(href, None)
+
+    def _forget(self, href):
+        super()._forget(href)
+        self._records.pop(href, None)
+
+    def _reindex(self):
+        self._records = {}  # href -> LazyContact, created on demand
+
+    def _multiget(self, hrefs):
+        return [
+            (entry.href, entry.etag, entry.data)
+            for entry in iter_carddav_multiget(self.collection_url, *self.auth, hrefs, session=self.session)
+            if entry.data
+        ]
+
+    def _contact(self, href):
+        if href not in self._records:
+            card = self.cards[href]
+            self._records[href] = LazyContact(href, card["etag"], card["data"])
+        return self._records[href]
+
+    def vcard(self, href):
+        """ The parsed vCard of a cached card. """
+        return self._contact(href).vcard
+
+    def contacts(self):
+        """
+        All cached contacts.
+
+        :return: list of LazyContact (readable as dictionary of {fn, href, etag, vcard})
+        """
+        return [self._contact(href) for href in self.cards]
+
+    def find(self, fn=None, uid=None, email=None):
+        """
+        Finds cached contacts whose full name, UID and/or email match exactly. Does not contact the server, and only
+        scans the properties of the cards instead of parsing them.
+
+        :return: list of LazyContact (readable as dictionary of {fn, href, etag, vcard})
+        """
+        criteria = {"FN": fn, "UID": uid, "EMAIL": email}
+        criteria = {name: value for name, value in criteria.items() if value is not None}
+        return [
+            self._contact(href) for href in self.cards
+            if all(value in self._contact(href).values(name) for name, value in criteria.items())
+        ]
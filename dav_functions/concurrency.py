@@ -0,0 +1,30 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+
+def bounded_map(function, items, workers):
+    """
+    Calls a function for every item in a thread pool, without queueing more than a few items ahead.
+
+    Unlike ThreadPoolExecutor.map, the items are taken from the iterable only as fast as the workers process them,
+    so a generator over millions of items is never loaded into memory at once.
+
+    :param function: function taking one item
+    :param items: iterable of items, e.g. a generator
+    :param workers: number of threads
+    :return: generator of (item, result, exception) in the order of completion; exception is None on success
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for item in items:
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _result(pending.pop(future), future)
+            pending[executor.submit(function, item)] = item
+        for future in as_completed(list(pending)):
+            yield _result(pending.pop(future), future)
+
+
+def _result(item, future):
+    exception = future.exception()
+    return item, (future.result() if exception is None else None), exception
@@ -0,0 +1,506 @@
+"""
+Deterministic synthetic datasets for sizing tests: directory trees, contacts and events.
+
+Every item is generated by its own random generator, seeded with the dataset seed, the kind of item and its number.
+The same seed therefore always gives the same dataset, and nothing is kept in memory: generating a million contacts
+holds one contact at a time, and file contents are produced chunk by chunk while they are uploaded.
+
+The dataset can be written to local files (.vcf, .ics, directory tree) or uploaded to the configured server:
+
+python -m dav_functions.dataset populate --seed 1 --files 1000 --contacts 100000 --events 100000
+python -m dav_functions.dataset remove --seed 1 --files 1000 --contacts 100000 --events 100000
+"""
+import argparse
+import base64
+import math
+import os
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from dav_functions.bulk import Progress, print_progress
+from dav_functions.caldav_bulk import event_filename, import_events
+from dav_functions.carddav_bulk import card_filename, import_cards
+from dav_functions.concurrency import bounded_map
+from dav_functions.session import create_session, requester
+from dav_functions.webdav_bulk import collection_maker
+
+DEFAULT_WORKERS = 8
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# lines are folded after this many characters (RFC 5545 / RFC 6350 allow 75 octets, the content is ASCII)
+FOLD_LENGTH = 75
+
+FIRST_NAMES = ["Anna", "Ben", "Clara", "David", "Elena", "Felix", "Greta", "Hannah", "Ivan", "Julia", "Karl", "Lena",
+               "Maria", "Noah", "Olga", "Paul", "Quentin", "Rosa", "Simon", "Tara", "Uwe", "Vera", "Walter", "Yusuf"]
+LAST_NAMES = ["Bauer", "Fischer", "Gruber", "Huber", "Klein", "Koch", "Lang", "Mayer", "Novak", "Pichler", "Richter",
+              "Schmid", "Schneider", "Steiner", "Wagner", "Weber", "Winkler", "Wolf"]
+COMPANIES = ["Acme", "Globex", "Initech", "Umbrella", "Stark Industries", "Wayne Enterprises", "Hooli", "Vandelay"]
+TITLES = ["Engineer", "Manager", "Consultant", "Designer", "Accountant", "Director", "Assistant", "Technician"]
+CITIES = [("Vienna", "1010", "Austria"), ("Graz", "8010", "Austria"), ("Munich", "80331", "Germany"),
+          ("Berlin", "10115", "Germany"), ("Zurich", "8001", "Switzerland"), ("Prague", "11000", "Czechia")]
+STREETS = ["Hauptstrasse", "Bahnhofstrasse", "Gartenweg", "Kirchengasse", "Ringstrasse", "Schulweg"]
+WORDS = ["budget", "review", "planning", "sync", "lunch", "workshop", "release", "retro", "call", "training",
+         "interview", "demo", "onboarding", "roadmap", "offsite", "standup", "kickoff", "dentist", "gym", "dinner"]
+FILE_EXTENSIONS = [".txt", ".jpg", ".png", ".pdf", ".docx", ".xlsx", ".zip", ".mp4"]
+
+TIMEZONE = "Europe/Vienna"
+VTIMEZONE = [
+    "BEGIN:VTIMEZONE", f"TZID:{TIMEZONE}",
+    "BEGIN:DAYLIGHT", "TZOFFSETFROM:+0100", "TZOFFSETTO:+0200", "TZNAME:CEST", "DTSTART:19700329T020000",
+    "RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU", "END:DAYLIGHT",
+    "BEGIN:STANDARD", "TZOFFSETFROM:+0200", "TZOFFSETTO:+0100", "TZNAME:CET", "DTSTART:19701025T030000",
+    "RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU", "END:STANDARD",
+    "END:VTIMEZONE"
+]
+
+SyntheticFile = namedtuple("SyntheticFile", ["path", "size", "seed"])
+SyntheticFile.__doc__ = """
+A generated file; its content is produced by iter_file_content.
+
+path: path relative to the dataset root, with / as separator
+size: size in bytes
+seed: the dataset seed
+"""
+
+
+def _random(seed, kind, index):
+    # string seeds are hashed with SHA-512, so this is stable across runs and Python versions
+    return random.Random(f"{seed}:{kind}:{index}")
+
+
+def _random_bytes(rng, length):
+    """ Like Random.randbytes (Python 3.9+), which returns exactly these bytes. """
+    if length <= 0:
+        return b""
+    return rng.getrandbits(8 * length).to_bytes(length, "little")
+
+
+def _fold(line):
+    """ Folds a content line into lines of at most FOLD_LENGTH characters. """
+    lines = [line[:FOLD_LENGTH]]
+    for start in range(FOLD_LENGTH, len(line), FOLD_LENGTH - 1):
+        lines.append(" " + line[start:start + FOLD_LENGTH - 1])
+    return "\r\n".join(lines)
+
+
+def _ical_text(text):
+    return text.replace("\\", "\\\\").replace(",", "\\,").replace(";", "\\;").replace("\n", "\\n")
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def file_path(seed, index, depth=3, fanout=8):
+    """ The path of file number index: up to depth directories, each level with fanout possible directories. """
+    rng = _random(seed, "file", index)
+    directories = [f"dir-{rng.randrange(fanout)}" for _ in range(rng.randint(0, depth))]
+    return "/".join(directories + [f"file-{index:07d}{rng.choice(FILE_EXTENSIONS)}"])
+
+
+def iter_files(seed=0, count=1000, depth=3, fanout=8, median_size=32 * 1024, sigma=1.5, max_size=64 * 1024 * 1024):
+    """
+    Generates a directory tree. File sizes follow a log-normal distribution, so most files are small and a few are
+    large, like in real user directories.
+
+    :param seed: dataset seed
+    :param count: number of files
+    :param depth: maximum directory depth
+    :param fanout: number of possible subdirectories per directory
+    :param median_size: median file size in bytes
+    :param sigma: spread of the file sizes (standard deviation of the logarithm)
+    :param max_size: upper limit of the file size in bytes
+    :return: generator of SyntheticFile (path, size, seed)
+    """
+    for index in range(count):
+        rng = _random(seed, "file-size", index)
+        size = min(max_size, int(rng.lognormvariate(math.log(median_size), sigma)))
+        yield SyntheticFile(file_path(seed, index, depth, fanout), size, seed)
+
+
+def iter_file_content(file, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Produces the content of a generated file chunk by chunk.
+
+    :param file: SyntheticFile
+    :param chunk_size: size of the chunks in bytes
+    :return: generator of bytes
+    """
+    rng = _random(file.seed, "content", file.path)
+    remaining = file.size
+    while remaining > 0:
+        length = min(chunk_size, remaining)
+        yield _random_bytes(rng, length)
+        remaining -= length
+
+
+class FileContentReader:
+    """
+    File-like view of the content of a generated file, so requests can stream it with a Content-Length. Seeking
+    back to the start restarts the content, which lets urllib3 rewind the body when it retries a request.
+    """
+
+    def __init__(self, file, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.seek(0)
+
+    def __len__(self):
+        return self.file.size
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if offset != 0 or whence != os.SEEK_SET:
+            raise OSError("Generated content can only be rewound to the start")
+        self.chunks = iter_file_content(self.file, self.chunk_size)
+        self.chunk = b""
+        self.offset = 0  # read position in self.chunk
+        self.position = 0
+        return 0
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0:
+            if self.offset >= len(self.chunk):
+                self.chunk, self.offset = next(self.chunks, b""), 0
+                if not self.chunk:
+                    break
+            end = len(self.chunk) if size < 0 else min(len(self.chunk), self.offset + size)
+            parts.append(self.chunk[self.offset:end])
+            if size > 0:
+                size -= end - self.offset
+            self.offset = end
+        data = b"".join(parts)
+        self.position += len(data)
+        return data
+
+
+def synthetic_contact_uid(seed, index):
+    return f"synthetic-{seed}-contact-{index}"
+
+
+def iter_contacts(seed=0, count=1000, photo_ratio=0.2, photo_size=8 * 1024):
+    """
+    Generates vCards (3.0) with names, organisation, several emails and phone numbers, an address, birthday, note,
+    categories and, for some, a photo.
+
+    :param seed: dataset seed
+    :param count: number of contacts
+    :param photo_ratio: share of the contacts with a photo
+    :param photo_size: approximate size of a photo in bytes
+    :return: generator of vCard texts with CRLF line endings
+    """
+    for index in range(count):
+        rng = _random(seed, "contact", index)
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        city, postal_code, country = rng.choice(CITIES)
+        lines = [
+            "BEGIN:VCARD",
+            "VERSION:3.0",
+            f"UID:{synthetic_contact_uid(seed, index)}",
+            f"FN:{first} {last}",
+            f"N:{last};{first};;;",
+            f"ORG:{rng.choice(COMPANIES)}",
+            f"TITLE:{rng.choice(TITLES)}"
+        ]
+        for kind in rng.sample(["WORK", "HOME", "OTHER"], rng.randint(1, 3)):
+            address = f"{first.lower()}.{last.lower()}.{index}@{kind.lower()}.example.com"
+            lines.append(f"EMAIL;TYPE=INTERNET,{kind}:{address}")
+        for kind in rng.sample(["CELL", "WORK", "HOME"], rng.randint(1, 3)):
+            lines.append(f"TEL;TYPE={kind}:+43 {rng.randint(600, 699)} {rng.randint(1000000, 9999999)}")
+        lines += [
+            f"ADR;TYPE=HOME:;;{rng.choice(STREETS)} {rng.randint(1, 200)};{city};;{postal_code};{country}",
+            f"BDAY:{rng.randint(1940, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            f"URL:https://{last.lower()}.example.com/",
+            f"CATEGORIES:{','.join(rng.sample(['Friends', 'Family', 'Work', 'VIP', 'Sports'], 2))}",
+            _fold(f"NOTE:{_ical_text(_sentence(rng, rng.randint(3, 30)))}")
+        ]
+        if rng.random() < photo_ratio:
+            # JPEG markers around random data: right size and type, not meant to be displayed
+            photo = b"\xff\xd8\xff\xe0" + _random_bytes(rng, photo_size) + b"\xff\xd9"
+            lines.append(_fold(f"PHOTO;ENCODING=b;TYPE=JPEG:{base64.b64encode(photo).decode('ascii')}"))
+        lines.append("END:VCARD")
+        yield "\r\n".join(lines) + "\r\n"
+
+
+def synthetic_event_uid(seed, index):
+    return f"synthetic-{seed}-event-{index}"
+
+
+def _occurrence(start, frequency, number):
+    """ Start of occurrence number (0 = first) of a DAILY / WEEKLY / MONTHLY recurrence. """
+    if frequency == "DAILY":
+        return start + timedelta(days=number)
+    if frequency == "WEEKLY":
+        return start + timedelta(weeks=number)
+    month = start.month - 1 + number
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1)
+
+
+def iter_events(
+        seed=0,
+        count=1000,
+        start=datetime(2020, 1, 1),
+        years=5,
+        recurring_ratio=0.2,
+        exception_ratio=0.3,
+        timezone_ratio=0.5,
+        all_day_ratio=0.1):
+    """
+    Generates calendar objects: timed events in UTC or in a timezone, all-day events and recurring events, some of
+    them with an excluded and a moved occurrence.
+
+    :param seed: dataset seed
+    :param count: number of events (a recurring event with its exceptions counts as one)
+    :param start: start of the period the events are spread over
+    :param years: length of that period
+    :param recurring_ratio: share of recurring events
+    :param exception_ratio: share of the recurring events with an excluded and a moved occurrence
+    :param timezone_ratio: share of timed events with a timezone instead of UTC
+    :param all_day_ratio: share of all-day events among the non-recurring events
+    :return: generator of iCalendar texts with CRLF line endings
+    """
+    for index in range(count):
+        rng = _random(seed, "event", index)
+        uid = synthetic_event_uid(seed, index)
+        summary = f"{' '.join(rng.choice(WORDS) for _ in range(2)).capitalize()} #{index}"
+        day = start + timedelta(days=rng.randrange(365 * years))
+        event_start = day.replace(day=min(day.day, 28), hour=rng.randint(7, 19), minute=rng.choice([0, 15, 30, 45]))
+        duration = timedelta(minutes=rng.choice([15, 30, 45, 60, 90, 120, 240]))
+        stamp = start.strftime("%Y%m%dT%H%M%SZ")
+        recurring = rng.random() < recurring_ratio
+        all_day = not recurring and rng.random() < all_day_ratio
+        with_timezone = not all_day and rng.random() < timezone_ratio
+
+        def date_property(name, value):
+            if all_day:
+                return f"{name};VALUE=DATE:{value.strftime('%Y%m%d')}"
+            if with_timezone:
+                return f"{name};TZID={TIMEZONE}:{value.strftime('%Y%m%dT%H%M%S')}"
+            return f"{name}:{value.strftime('%Y%m%dT%H%M%SZ')}"
+
+        event = ["BEGIN:VEVENT", f"UID:{uid}", f"DTSTAMP:{stamp}", f"SUMMARY:{_ical_text(summary)}"]
+        if all_day:
+            event += [date_property("DTSTART", event_start), date_property("DTEND", event_start + timedelta(days=1))]
+        else:
+            event += [date_property("DTSTART", event_start), date_property("DTEND", event_start + duration)]
+        if rng.random() < 0.5:
+            event.append(_fold(f"DESCRIPTION:{_ical_text(_sentence(rng, rng.randint(5, 40)))}"))
+        if rng.random() < 0.3:
+            event.append(f"LOCATION:{_ical_text(rng.choice(CITIES)[0])}")
+
+        overrides = []
+        if recurring:
+            frequency = rng.choice(["DAILY", "WEEKLY", "WEEKLY", "MONTHLY"])
+            event.append(f"RRULE:FREQ={frequency};COUNT={rng.randint(5, 52)}")
+            if rng.random() < exception_ratio:
+                event.append(date_property("EXDATE", _occurrence(event_start, frequency, 1)))
+                moved = _occurrence(event_start, frequency, 2)
+                new_start = moved + timedelta(hours=rng.randint(1, 3))
+                overrides.append([
+                    "BEGIN:VEVENT", f"UID:{uid}", f"DTSTAMP:{stamp}", date_property("RECURRENCE-ID", moved),
+                    f"SUMMARY:{_ical_text(summary + ' (moved)')}",
+                    date_property("DTSTART", new_start), date_property("DTEND", new_start + duration),
+                    "END:VEVENT"
+                ])
+        event.append("END:VEVENT")
+
+        lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//nextcloud-tests//synthetic dataset//EN"]
+        if with_timezone:
+            lines += VTIMEZONE
+        lines += event
+        for override in overrides:
+            lines += override
+        lines.append("END:VCALENDAR")
+        yield "\r\n".join(lines) + "\r\n"
+
+
+def write_dataset(output_dir, seed=0, files=0, contacts=0, events=0):
+    """
+    Writes a dataset to local files: the directory tree to <output_dir>/files, the contacts to contacts.vcf and the
+    events to events.ics (one VCALENDAR per event).
+
+    :return: dictionary of {files, contacts, events, bytes}
+    """
+    written = 0
+    for file in iter_files(seed, files):
+        path = os.path.join(output_dir, "files", *file.path.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as output:
+            for chunk in iter_file_content(file):
+                output.write(chunk)
+        written += file.size
+    for name, items in (("contacts.vcf", iter_contacts(seed, contacts)), ("events.ics", iter_events(seed, events))):
+        with open(os.path.join(output_dir, name), "w", encoding="utf-8", newline="") as output:
+            for item in items:
+                output.write(item)
+                written += len(item)
+    return {"files": files, "contacts": contacts, "events": events, "bytes": written}
+
+
+def files_root_url(webdav_url, seed):
+    """ The directory the files of a dataset are uploaded to. """
+    return f"{webdav_url.rstrip('/')}/synthetic-{seed}"
+
+
+def upload_files(
+        webdav_url,
+        username,
+        password,
+        files,
+        workers=DEFAULT_WORKERS,
+        progress=print_progress,
+        session=None):
+    """
+    Uploads generated files below a WebDAV directory, creating the subdirectories as needed. The content is streamed,
+    so memory does not depend on the file sizes.
+
+    :param webdav_url: URL of the WebDAV directory the tree is created in (has to exist)
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param files: iterable of SyntheticFile, e.g. from iter_files
+    :param workers: number of concurrent uploads
+    :param progress: function called with the intermediate statistics every PROGRESS_INTERVAL files, None for quiet
+    :param session: optional DAVSession to reuse pooled connections, should have a pool size of at least workers
+    :return: dictionary of {action, done, failed, bytes, duration, per_second}
+    """
+    http = requester(session)
+    auth = (username, password)
+    webdav_url = webdav_url.rstrip("/")
+    tracker = Progress("upload", progress)
+    tracker.stats["bytes"] = 0
+    create_directories = collection_maker(webdav_url, username, password, session)
+
+    def upload(file):
+        create_directories(file.path)
+        response = http.put(f"{webdav_url}/{file.path}", data=FileContentReader(file), auth=auth)
+        response.raise_for_status()
+
+    for file, _, error in bounded_map(upload, files, workers):
+        if error is not None:
+            print(f"Error uploading {file.path}: {error}")
+            tracker.count("failed")
+        else:
+            tracker.stats["bytes"] += file.size
+            tracker.count("done")
+    return tracker.result()
+
+
+def delete_resources(urls, username, password, workers=DEFAULT_WORKERS, progress=print_progress, session=None):
+    """
+    Deletes resources, e.g. the contacts or events of a dataset. Resources that do not exist are counted as missing.
+
+    :return: dictionary of {action, done, missing, failed, duration, per_second}
+    """
+    http = requester(session)
+    tracker = Progress("delete", progress, ("done", "missing", "failed"))
+
+    def delete(url):
+        response = http.delete(url, auth=(username, password))
+        if response.status_code == 404:
+            return "missing"
+        response.raise_for_status()
+        return "done"
+
+    for url, outcome, error in bounded_map(delete, urls, workers):
+        if error is not None:
+            print(f"Error deleting {url}: {error}")
+            tracker.count("failed")
+        else:
+            tracker.count(outcome)
+    return tracker.result()
+
+
+def calendar_url(config):
+    """ URL of the configured calendar (config.calendar_name). """
+    import caldav
+
+    from dav_functions.caldav import get_calendar_by_name
+
+    client = caldav.DAVClient(url=config.caldav_url, username=config.username, password=config.password)
+    calendar = get_calendar_by_name(client.principal(), config.calendar_name)
+    if calendar is None:
+        raise Exception("Calendar " + config.calendar_name + " not found")
+    return str(calendar.url)
+
+
+def populate(config, seed=0, files=0, contacts=0, events=0, workers=DEFAULT_WORKERS, progress=print_progress,
+             session=None):
+    """
+    Uploads a dataset to the configured server: the files to <webdav_url>/synthetic-<seed>, the contacts to the
+    address book and the events to the configured calendar. Items that exist already are not overwritten.
+
+    :return: dictionary of {files, contacts, events} with the statistics of the uploads that were done
+    """
+    auth = (config.username, config.password)
+    results = {}
+    if files:
+        root = files_root_url(config.webdav_url, seed)
+        response = requester(session).request("MKCOL", root, auth=auth)
+        if response.status_code not in (201, 405):
+            response.raise_for_status()
+        results["files"] = upload_files(root, *auth, iter_files(seed, files), workers, progress, session)
+    if contacts:
+        results["contacts"] = import_cards(
+            config.carddav_url, *auth, iter_contacts(seed, contacts), workers, progress, session)
+    if events:
+        results["events"] = import_events(
+            calendar_url(config), *auth, iter_events(seed, events), workers, progress, session)
+    return results
+
+
+def remove(config, seed=0, files=0, contacts=0, events=0, workers=DEFAULT_WORKERS, progress=print_progress,
+           session=None):
+    """
+    Deletes a dataset uploaded with populate (same seed and counts) from the configured server.
+
+    :return: dictionary of {files, contacts, events} with the statistics of the deletions that were done
+    """
+    auth = (config.username, config.password)
+    results = {}
+    if files:
+        results["files"] = delete_resources([files_root_url(config.webdav_url, seed)], *auth, 1, progress, session)
+    if contacts:
+        urls = (
+            f"{config.carddav_url}/{card_filename(synthetic_contact_uid(seed, index))}" for index in range(contacts))
+        results["contacts"] = delete_resources(urls, *auth, workers, progress, session)
+    if events:
+        url = calendar_url(config).rstrip("/")
+        urls = (f"{url}/{event_filename(synthetic_event_uid(seed, index))}" for index in range(events))
+        results["events"] = delete_resources(urls, *auth, workers, progress, session)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic dataset and uploads it or writes it to files.")
+    parser.add_argument("command", choices=["populate", "remove", "write"],
+                        help="upload to / delete from the configured server, or write to --output")
+    parser.add_argument("--seed", type=int, default=0, help="dataset seed (default: %(default)s)")
+    parser.add_argument("--files", type=int, default=0, help="number of files (default: %(default)s)")
+    parser.add_argument("--contacts", type=int, default=0, help="number of contacts (default: %(default)s)")
+    parser.add_argument("--events", type=int, default=0, help="number of events (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="concurrent requests (default: %(default)s)")
+    parser.add_argument("--output", help="directory for the write command")
+    args = parser.parse_args()
+
+    counts = {"seed": args.seed, "files": args.files, "contacts": args.contacts, "events": args.events}
+    if args.command == "write":
+        if not args.output:
+            parser.error("write needs --output")
+        print(write_dataset(args.output, **counts))
+        return
+
+    from config import config
+
+    session = create_session(config, pool_size=args.workers)
+    function = populate if args.command == "populate" else remove
+    for kind, result in function(config, workers=args.workers, session=session, **counts).items():
+        print(f"{kind}: {result}")
+
+
+if __name__ == "__main__":
+    main()
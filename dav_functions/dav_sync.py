@@ -0,0 +1,174 @@
+"""
+Incremental sync (RFC 6578) of a DAV collection with a local cache, shared by the CardDAV and CalDAV sync clients.
+
+The first sync downloads the whole collection, every following sync only asks the server what changed since the
+last sync-token and downloads the changed resources with a multiget REPORT. Lookups are served from the cache.
+"""
+import json
+import os
+from abc import ABC, abstractmethod
+from urllib.parse import unquote, urlparse
+from xml.sax.saxutils import escape
+
+from dav_functions.multistatus import MultistatusStream
+from dav_functions.session import requester
+
+# number of resources fetched per multiget
+MULTIGET_BATCH_SIZE = 100
+
+
+class InvalidSyncToken(Exception):
+    """ The server does not accept the stored sync-token anymore. """
+
+
+class CollectionSyncClient(ABC):
+    """
+    Keeps a local copy of a collection in sync with the server.
+
+    The cache holds the sync-token and for every resource its href, ETag and text. It can be stored as JSON, so later
+    runs only fetch what changed in between. Subclasses implement _multiget and can keep derived data (parsed
+    objects, indexes) up to date in _store, _forget and _reindex.
+    """
+
+    # key of the resources in the JSON cache
+    resource_key = "resources"
+
+    def __init__(self, collection_url, username, password, cache_path=None, session=None):
+        """
+        :param collection_url: URL of the collection (address book, calendar)
+        :param username: Username for authentication
+        :param password: Password for authentication
+        :param cache_path: optional JSON file the cache is loaded from and saved to
+        :param session: optional DAVSession to reuse pooled connections
+        """
+        self.collection_url = collection_url.rstrip("/") + "/"
+        self.auth = (username, password)
+        self.cache_path = cache_path
+        self.session = session
+        self.sync_token = None
+        self.resources = {}  # href -> {"etag": ..., "data": text}
+        self._reindex()
+        if cache_path and os.path.exists(cache_path):
+            self.load()
+
+    def load(self):
+        with open(self.cache_path) as file:
+            cache = json.load(file)
+        self.sync_token = cache["sync_token"]
+        self.resources = cache[self.resource_key]
+        self._reindex()
+
+    def save(self):
+        with open(self.cache_path, "w") as file:
+            json.dump({"sync_token": self.sync_token, self.resource_key: self.resources}, file)
+
+    def sync(self):
+        """
+        Pulls the changes since the last sync from the server.
+
+        Falls back to a full sync if the server rejects the stored sync-token.
+
+        :return: dictionary of {changed: [hrefs], deleted: [hrefs], full: True if it was a full sync}
+        """
+        full = self.sync_token is None
+        try:
+            changed, deleted = self._sync_collection()
+        except InvalidSyncToken:
+            self.sync_token = None
+            self.resources = {}
+            self._reindex()
+            full = True
+            changed, deleted = self._sync_collection()
+
+        for href in deleted:
+            if href in self.resources:
+                self._forget(href)
+
+        # only download resources whose ETag differs from the cached one
+        outdated = [href for href, etag in changed.items() if self.resources.get(href, {}).get("etag") != etag]
+        for start in range(0, len(outdated), MULTIGET_BATCH_SIZE):
+            for href, etag, data in self._multiget(outdated[start:start + MULTIGET_BATCH_SIZE]):
+                if href in self.resources:
+                    self._forget(href)
+                self._store(href, etag, data)
+
+        if self.cache_path:
+            self.save()
+        return {"changed": sorted(changed), "deleted": sorted(deleted), "full": full}
+
+    def _store(self, href, etag, data):
+        self.resources[href] = {"etag": etag, "data": data}
+
+    def _forget(self, href):
+        del self.resources[href]
+
+    def _reindex(self):
+        """ Called whenever self.resources was replaced as a whole. """
+
+    def _report(self, body):
+        """
+        Sends a REPORT to the collection.
+
+        :return: the streamed response, to be closed by the caller
+        """
+        response = requester(self.session).request(
+            method="REPORT",
+            url=self.collection_url,
+            auth=self.auth,
+            data=body.encode("utf-8"),
+            headers={
+                "content-type": "application/xml; charset=utf-8",
+                "depth": "1"
+            },
+            stream=True
+        )
+        if response.status_code in (403, 409) and b"valid-sync-token" in response.content:
+            response.close()
+            raise InvalidSyncToken(response.text)
+        if not response.ok:
+            response.close()
+        response.raise_for_status()
+        return response
+
+    def _sync_collection(self):
+        """
+        Sends sync-collection REPORTs until the server reports no more truncated results.
+
+        :return: tuple of ({href: etag} of changed resources, [hrefs] of deleted resources)
+        """
+        changed = {}
+        deleted = []
+        collection_path = unquote(urlparse(self.collection_url).path).rstrip("/")
+        while True:
+            response = self._report(f"""
+            <d:sync-collection xmlns:d="DAV:">
+                <d:sync-token>{escape(self.sync_token or "")}</d:sync-token>
+                <d:sync-level>1</d:sync-level>
+                <d:prop>
+                    <d:getetag />
+                </d:prop>
+            </d:sync-collection>
+            """)
+            truncated = False
+            with response:
+                stream = MultistatusStream(response)
+                for entry in stream:
+                    if unquote(entry.href).rstrip("/") == collection_path:
+                        # a response for the collection itself with 507 means there are more changes to fetch
+                        truncated = entry.status == 507
+                    elif entry.status == 404:
+                        deleted.append(entry.href)
+                        changed.pop(entry.href, None)
+                    else:
+                        changed[entry.href] = entry.etag
+            self.sync_token = stream.sync_token
+            if not truncated:
+                return changed, deleted
+
+    @abstractmethod
+    def _multiget(self, hrefs):
+        """
+        Fetches resources by their hrefs.
+
+        :return: list of tuples (href, etag, text)
+        """
@@ -0,0 +1,140 @@
+"""
+Lightweight records of vCards and iCalendar objects, parsed only as far as needed.
+
+A full vobject parse of every card or event is expensive for large collections, while most callers only look at a
+few properties (FN, UID, SUMMARY, EMAIL). A LazyRecord keeps the href, ETag and raw text; properties are read with a
+simple line scanner the first time they are asked for, and vobject only parses the text if the whole object is needed.
+"""
+import re
+
+import vobject
+
+ESCAPED = re.compile(r"\\([\\,;nN])")
+
+
+def unfolded_lines(text):
+    """ The content lines of vCard or iCalendar text, with folded lines joined. """
+    return text.replace("\r\n", "\n").replace("\n ", "").replace("\n\t", "").split("\n")
+
+
+def unescape(value):
+    """ Unescapes a TEXT value (RFC 5545 / RFC 6350) in one pass: an escaped backslash followed by n is no newline. """
+    return ESCAPED.sub(lambda match: "\n" if match.group(1) in "nN" else match.group(1), value)
+
+
+def iter_properties(text):
+    """
+    Scans vCard or iCalendar text for its properties.
+
+    Parameters and vCard groups are ignored (item1.EMAIL;TYPE=work:... is EMAIL). The value starts at the first colon
+    outside of a quoted parameter value (SUMMARY;LANGUAGE="en:US":...).
+
+    :param text: vCard or iCalendar text
+    :return: generator of (upper case property name, raw value)
+    """
+    for line in unfolded_lines(text):
+        index = line.find(":")
+        while index != -1 and line.count('"', 0, index) % 2:
+            index = line.find(":", index + 1)
+        if index != -1:
+            yield line[:index].split(";")[0].rsplit(".", 1)[-1].upper(), line[index + 1:]
+
+
+def property_values(text, name):
+    """
+    The values of a property in vCard or iCalendar text, e.g. all EMAILs, without parsing the whole object.
+
+    :param text: vCard or iCalendar text
+    :param name: the property name, e.g. "UID"
+    :return: list of the unescaped values
+    """
+    name = name.upper()
+    return [unescape(value) for key, value in iter_properties(text) if key == name]
+
+
+class LazyRecord:
+    """
+    A card or event as returned by the server: href, ETag and the raw text.
+
+    values() and value() scan the text for properties, the scan happens once on first use. parsed() returns the
+    vobject object (vCard or VCALENDAR), parsed on first use.
+    """
+
+    __slots__ = ("href", "etag", "data", "_properties", "_parsed")
+
+    def __init__(self, href, etag, data):
+        self.href = href
+        self.etag = etag
+        self.data = data
+        self._properties = None
+        self._parsed = None
+
+    @classmethod
+    def from_entry(cls, entry):
+        """ The record of a MultistatusEntry with data. """
+        return cls(entry.href, entry.etag, entry.data)
+
+    def values(self, name):
+        """ All values of a property, e.g. values("EMAIL"); an empty list if the object has none. """
+        if self._properties is None:
+            properties = {}
+            for key, value in iter_properties(self.data):
+                properties.setdefault(key, []).append(value)
+            self._properties = properties
+        return [unescape(value) for value in self._properties.get(name.upper(), [])]
+
+    def value(self, name, default=None):
+        """ The first value of a property, default if the object has none. """
+        values = self.values(name)
+        return values[0] if values else default
+
+    def parsed(self):
+        """ The whole object parsed by vobject. """
+        if self._parsed is None:
+            self._parsed = vobject.readOne(self.data)
+        return self._parsed
+
+    def __repr__(self):
+        return f"{type(self).__name__}(href={self.href!r}, etag={self.etag!r})"
+
+
+class LazyContact(LazyRecord):
+    """
+    A LazyRecord of a vCard that can also be read like the contact dictionaries of dav_functions.carddav:
+    contact["fn"], contact["href"], contact["etag"] and contact["vcard"] (which parses the card), contact.get(),
+    "fn" in contact, iteration over the keys and dict(contact).
+
+    It is not a collections.abc.Mapping, whose values() would clash with LazyRecord.values(name).
+    """
+
+    __slots__ = ()
+
+    KEYS = ("fn", "href", "etag", "vcard")
+
+    @property
+    def fn(self):
+        return self.value("FN", "Unknown")
+
+    @property
+    def vcard(self):
+        return self.parsed()
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.KEYS else default
+
+    def keys(self):
+        return self.KEYS
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
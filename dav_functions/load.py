@@ -0,0 +1,403 @@
+"""
+Load mode: runs the WebDAV, CardDAV and CalDAV create/read/update/delete flows concurrently.
+
+Every virtual user is a thread that repeats the selected scenarios until the duration is over. All resources a
+virtual user creates carry the run id, the user number and the iteration in their name, so users never touch each
+other's files, contacts or events.
+
+Usage (reads config/config.py):
+
+    python -m dav_functions.load --users 10 --rate 20 --duration 60
+    python -m dav_functions.load --scenarios webdav,carddav --users 50 --json load_report.json
+    python -m dav_functions.load --async --users 1000 --duration 60  # virtual users as asyncio tasks
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import caldav
+import vobject
+
+from dav_functions.baseline import DEFAULT_THRESHOLD, compare_to_baseline, create_baseline, format_comparison, \
+    load_baseline, save_baseline
+from dav_functions.caldav import create_caldav_event, create_event_data, delete_caldav_event, \
+    get_calendar_by_name, get_calendar_event_by_name_range, ical_values
+from dav_functions.caldav_discovery import CalendarDiscoveryCache
+from dav_functions.carddav import create_carddav_contact, delete_carddav_contact, fetch_carddav_contact, \
+    update_carddav_contact
+from dav_functions.metrics import MetricsCollector
+from dav_functions.session import DEFAULT_POOL_SIZE, create_session
+from dav_functions.stats import summarize
+from dav_functions.webdav import delete_webdav_file, get_webdav_file_content, upload_file_to_webdav
+
+# file uploaded by the webdav scenario
+LOAD_FILE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data", "test_upload.txt")
+
+# events of the caldav scenario are created on this day, so the range searches stay small
+LOAD_EVENT_DAY = datetime(2023, 11, 15)
+
+
+class RateLimiter:
+    """ Spaces out operations of all threads so they don't exceed a given rate. """
+
+    def __init__(self, rate):
+        """
+        :param rate: operations per second, None for no limit
+        """
+        self.interval = 1 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """ Takes the next free slot, returns the seconds to wait for it. """
+        if not self.interval:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        return slot - now
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Recorder:
+    """ Thread-safe collection of the latencies and errors of all operations of a load run. """
+
+    def __init__(self, rate_limiter=None):
+        self.rate_limiter = rate_limiter or RateLimiter(None)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def measure(self, operation, function, *args, **kwargs):
+        """
+        Calls a dav_function and records how long it took.
+
+        The dav_functions report errors by returning None or False (or raising), those calls are counted as errors.
+
+        :param operation: name of the operation in the report, e.g. webdav_upload
+        :return: the return value of the function, None if it raised an exception
+        """
+        self.rate_limiter.wait()
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+            failed = result is None or result is False
+        except Exception as e:
+            print(f"Error in {operation}: {e}")
+            result = None
+            failed = True
+        self.record(operation, time.perf_counter() - start, failed)
+        return result
+
+    def record(self, operation, elapsed, failed):
+        """ Records one operation that took elapsed seconds. """
+        with self._lock:
+            self.latencies[operation].append(elapsed)
+            if failed:
+                self.errors[operation] += 1
+
+    def report(self, duration):
+        """
+        :param duration: wall-clock duration of the run in seconds
+        :return: dictionary of {operation: {count, errors, throughput, min, mean, p50, p90, p95, p99, max}}
+        """
+        with self._lock:
+            operations = {}
+            for operation, latencies in sorted(self.latencies.items()):
+                summary = summarize(latencies)
+                summary["errors"] = self.errors[operation]
+                summary["throughput"] = len(latencies) / duration if duration else None
+                operations[operation] = summary
+            return operations
+
+
+class VirtualUser:
+    """
+    State of one virtual user: its number, its CalDAV calendar and the shared session, recorder and calendar
+    discovery cache.
+    """
+
+    def __init__(self, number, run_id, config, session, recorder, discovery=None):
+        self.number = number
+        self.run_id = run_id
+        self.config = config
+        self.session = session
+        self.recorder = recorder
+        self.discovery = discovery
+        self._calendar = None
+
+    def resource_name(self, iteration):
+        """ A name no other virtual user or run will use. """
+        return f"load-{self.run_id}-u{self.number}-i{iteration}"
+
+    def calendar(self):
+        if self._calendar is None:
+            client = caldav.DAVClient(
+                url=self.config.caldav_url,
+                username=self.config.username,
+                password=self.config.password
+            )
+            client.session = self.session
+            if self.discovery is not None:
+                principal = self.discovery.principal(client)
+            else:
+                principal = client.principal()
+            self._calendar = get_calendar_by_name(principal, self.config.calendar_name, self.discovery)
+            if self._calendar is None:
+                raise Exception("Calendar " + self.config.calendar_name + " not found")
+        return self._calendar
+
+
+def _clean_up(resource, function, *args, **kwargs):
+    """
+    Removes a resource that a failed scenario left behind, so repeated runs (e.g. the monitor) don't pile them up.
+    The call is not measured, errors are only printed.
+    """
+    try:
+        if not function(*args, **kwargs):
+            print(f"Could not clean up {resource}")
+    except Exception as e:
+        print(f"Error cleaning up {resource}: {e}")
+
+
+def webdav_scenario(user, iteration):
+    """ Uploads, reads and deletes a file. """
+    config = user.config
+    file_name = user.resource_name(iteration) + ".txt"
+    file_url = config.webdav_url + "/" + file_name
+    measure = user.recorder.measure
+
+    if not measure("webdav_upload", upload_file_to_webdav, config.webdav_url, config.username, config.password,
+                   LOAD_FILE_PATH, file_name, session=user.session):
+        return
+    deleted = False
+    try:
+        measure("webdav_read", get_webdav_file_content, file_url, config.username, config.password,
+                session=user.session)
+        deleted = measure("webdav_delete", delete_webdav_file, file_url, config.username, config.password,
+                          session=user.session)
+    finally:
+        if not deleted:
+            _clean_up(file_name, delete_webdav_file, file_url, config.username, config.password, session=user.session)
+
+
+def carddav_scenario(user, iteration):
+    """ Creates, reads, updates and deletes a contact. """
+    config = user.config
+    name = user.resource_name(iteration)
+    measure = user.recorder.measure
+    credentials = (config.carddav_url, config.username, config.password)
+
+    def delete_by_name():
+        contact = fetch_carddav_contact(*credentials, name, session=user.session)
+        return contact is not None and delete_carddav_contact(*credentials, contact["href"], session=user.session)
+
+    if not measure("carddav_create", create_carddav_contact, *credentials,
+                   {"fullname": name, "email": name + "@example.com"}, session=user.session):
+        return
+    deleted = False
+    try:
+        contact = measure("carddav_read", fetch_carddav_contact, *credentials, name, session=user.session)
+        if contact is None:
+            return
+        vcard = vobject.readOne(contact["vcard"].serialize())
+        vcard.add("note").value = "Updated by the load test."
+        measure("carddav_update", update_carddav_contact, *credentials, vcard, contact["href"], session=user.session)
+        deleted = measure("carddav_delete", delete_carddav_contact, *credentials, contact["href"],
+                          session=user.session)
+    finally:
+        if not deleted:
+            _clean_up(name, delete_by_name)
+
+
+def caldav_scenario(user, iteration):
+    """ Creates, reads, updates and deletes an event. """
+    calendar = user.calendar()
+    summary = user.resource_name(iteration)
+    measure = user.recorder.measure
+    start = LOAD_EVENT_DAY + timedelta(minutes=user.number % 1440)
+    range_start = LOAD_EVENT_DAY - timedelta(days=1)
+    range_end = LOAD_EVENT_DAY + timedelta(days=2)
+
+    event_data = create_event_data(summary, start, start + timedelta(minutes=30), "Created by the load test.")
+    uid = ical_values(event_data, "UID")[0]
+    if not measure("caldav_create", create_caldav_event, calendar, event_data):
+        return
+    deleted = False
+    try:
+        event = measure("caldav_read", get_calendar_event_by_name_range, calendar, summary, range_start, range_end)
+        if event is None:
+            return
+
+        def update_event():
+            ical_event = event.icalendar_instance
+            ical_event.walk('VEVENT')[0]['DESCRIPTION'] = "Updated by the load test."
+            event.data = ical_event.to_ical()
+            event.save()
+            return True
+
+        measure("caldav_update", update_event)
+        deleted = measure("caldav_delete", delete_caldav_event, calendar, uid, range_start, range_end)
+    finally:
+        if not deleted:
+            _clean_up(summary, delete_caldav_event, calendar, uid, range_start, range_end)
+
+
+SCENARIOS = {
+    "webdav": webdav_scenario,
+    "carddav": carddav_scenario,
+    "caldav": caldav_scenario
+}
+
+
+def run_load(
+        config,
+        scenarios=("webdav", "carddav", "caldav"),
+        users=10,
+        duration=60,
+        rate=None,
+        session=None,
+        metrics=None,
+        discovery=None):
+    """
+    Runs the scenarios with concurrent virtual users and measures every operation.
+
+    Every virtual user repeats all selected scenarios until the duration is over. An iteration that already started
+    is finished, so the resources it created are deleted again.
+
+    :param config: the config module (config.config)
+    :param scenarios: names of the scenarios to run, see SCENARIOS
+    :param users: number of concurrent virtual users
+    :param duration: how long new iterations are started, in seconds
+    :param rate: maximum number of DAV operations per second over all users, None for no limit
+    :param session: optional DAVSession, by default one with a connection pool big enough for all users is created
+    :param metrics: optional MetricsCollector for the per-request measurements of the created session
+    :param discovery: optional CalendarDiscoveryCache, by default one shared by all virtual users of this run
+    :return: dictionary of {run_id, users, duration, operations: {operation: {count, errors, throughput, ...}}}
+    """
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    if session is None:
+        # at least one connection per virtual user, otherwise threads wait for each other's connections
+        session = create_session(
+            config,
+            pool_size=max(users, getattr(config, "http_pool_size", DEFAULT_POOL_SIZE)),
+            metrics=metrics
+        )
+
+    if discovery is None:
+        discovery = CalendarDiscoveryCache(getattr(config, "caldav_discovery_cache", None))
+
+    run_id = uuid.uuid4().hex[:8]
+    recorder = Recorder(RateLimiter(rate))
+    deadline = time.monotonic() + duration
+
+    def run_user(number):
+        user = VirtualUser(number, run_id, config, session, recorder, discovery)
+        iteration = 0
+        while time.monotonic() < deadline:
+            for name in scenarios:
+                try:
+                    SCENARIOS[name](user, iteration)
+                except Exception as e:
+                    print(f"Error in scenario {name} of user {number}: {e}")
+            iteration += 1
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        for future in [executor.submit(run_user, number) for number in range(users)]:
+            future.result()
+    elapsed = time.monotonic() - start
+
+    return {
+        "run_id": run_id,
+        "users": users,
+        "duration": elapsed,
+        "operations": recorder.report(elapsed)
+    }
+
+
+def format_report(report):
+    """ Formats a load report as a table with latencies in milliseconds. """
+    lines = [
+        f"Load run {report['run_id']}: {report['users']} users, {report['duration']:.1f}s",
+        f"{'operation':<16}{'count':>8}{'errors':>8}{'ops/s':>9}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    ]
+    for operation, summary in report["operations"].items():
+        lines.append(
+            f"{operation:<16}{summary['count']:>8}{summary['errors']:>8}{summary['throughput']:>9.2f}"
+            + "".join(f"{summary[key] * 1000:>9.1f}" for key in ("p50", "p90", "p95", "p99", "max"))
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the DAV scenarios concurrently against the configured server.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma separated list of scenarios (default: %(default)s)")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=60, help="duration in seconds (default: %(default)s)")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="maximum DAV operations per second over all users (default: no limit)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="run the virtual users as asyncio tasks instead of threads (aiohttp)")
+    parser.add_argument("--json", help="also write the report as JSON to this file")
+    parser.add_argument("--metrics-json", help="write the per-request latency report to this file")
+    parser.add_argument("--save-baseline", help="store the request latencies as performance baseline in this file")
+    parser.add_argument("--compare-baseline",
+                        help="compare the request latencies with this baseline, exit with 1 on regressions")
+    parser.add_argument("--regression-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative increase of the median latency that counts as regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    from config import config
+
+    record_requests = args.metrics_json or args.save_baseline or args.compare_baseline
+    metrics = MetricsCollector() if record_requests else None
+    options = dict(
+        scenarios=[name.strip() for name in args.scenarios.split(",") if name.strip()],
+        users=args.users,
+        duration=args.duration,
+        rate=args.rate,
+        metrics=metrics
+    )
+    if args.use_async:
+        from dav_functions.async_load import run_load_async
+        report = asyncio.run(run_load_async(config, **options))
+    else:
+        report = run_load(config, **options)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.save_baseline or args.compare_baseline:
+        current = create_baseline(metrics, report["duration"])
+        if args.save_baseline:
+            save_baseline(args.save_baseline, current)
+        if args.compare_baseline:
+            comparison = compare_to_baseline(
+                load_baseline(args.compare_baseline), current, threshold=args.regression_threshold)
+            print(format_comparison(comparison))
+            if any(result["regressed"] for result in comparison):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Per-request latency instrumentation for everything sent through a DAVSession.
+
+A DAVSession with a MetricsCollector records one RequestRecord per HTTP request: method, URL template, status, bytes
+and timings. New connections additionally report how long DNS lookup, TCP connect and TLS handshake took; requests
+on a kept-alive connection report 0 for those.
+
+The CalDAV helpers label their requests with the caldav operation (e.g. caldav_date_search), so requests sent by
+the caldav library can be told apart.
+"""
+import contextvars
+import json
+import re
+import socket
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+from dav_functions.stats import summarize
+
+# upper bounds of the histogram buckets in milliseconds, the last bucket takes everything above
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# path layout of Nextcloud's DAV endpoints below remote.php/dav/, used to turn URLs into templates
+URL_TEMPLATES = {
+    "files": ("{user}", "{path}"),
+    "uploads": ("{user}", "{transfer}", "{chunk}"),
+    "addressbooks": ("users", "{user}", "{addressbook}", "{card}"),
+    "calendars": ("{user}", "{calendar}", "{event}"),
+    "principals": ("users", "{user}"),
+}
+
+UUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
+_local = threading.local()
+
+# the label of label_operation; a context variable, so it is separate per thread and per asyncio task
+_operation = contextvars.ContextVar("operation", default=None)
+
+
+def url_template(url):
+    """
+    Turns a URL into a template without the user specific parts, so requests to different resources of the same
+    kind are aggregated together.
+
+    e.g. https://host/remote.php/dav/addressbooks/users/bob/contacts/<uuid>.vcf
+        -> /remote.php/dav/addressbooks/users/{user}/{addressbook}/{card}
+
+    :param url: the requested URL
+    :return: the path of the URL with placeholders
+    """
+    path = urlparse(url).path
+    prefix, separator, dav_path = path.partition("remote.php/dav/")
+    segments = [segment for segment in dav_path.split("/") if segment]
+    if not separator or not segments or segments[0] not in URL_TEMPLATES:
+        # other servers: at least aggregate the files of one collection
+        collection, slash, name = UUID_PATTERN.sub("{uuid}", path).rpartition("/")
+        return collection + slash + ("{name}" if "." in name else name)
+    placeholders = URL_TEMPLATES[segments[0]]
+    templated = [segments[0]]
+    for position, segment in enumerate(segments[1:]):
+        if position >= len(placeholders):
+            # deeper paths (e.g. sub folders of files) are part of the last placeholder
+            break
+        templated.append(placeholders[position] if placeholders[position].startswith("{") else segment)
+    return prefix + separator + "/".join(templated)
+
+
+@contextmanager
+def label_operation(operation):
+    """
+    Labels all requests sent by the current thread (or asyncio task) inside the with block, e.g. with the caldav call
+    that sent them.
+
+    :param operation: name of the operation, e.g. caldav_save_event
+    """
+    token = _operation.set(operation)
+    try:
+        yield
+    finally:
+        _operation.reset(token)
+
+
+def current_operation():
+    """ The label set by label_operation, None outside of it. """
+    return _operation.get()
+
+
+class RequestRecord:
+    """ Measurements of a single HTTP request. Timings are in seconds. """
+
+    __slots__ = ("operation", "method", "url_template", "status", "bytes_sent", "bytes_received",
+                 "dns", "connect", "tls", "ttfb", "total")
+
+    def __init__(self, operation, method, url_template, status, bytes_sent, bytes_received,
+                 dns, connect, tls, ttfb, total):
+        self.operation = operation
+        self.method = method
+        self.url_template = url_template
+        self.status = status
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.dns = dns
+        self.connect = connect
+        self.tls = tls
+        self.ttfb = ttfb
+        self.total = total
+
+    def key(self):
+        """ The records of one operation, method and URL template are aggregated together. """
+        return " ".join(part for part in (self.operation, self.method, self.url_template) if part)
+
+
+def histogram(values):
+    """
+    Counts latencies into HISTOGRAM_BUCKETS_MS.
+
+    :param values: latencies in seconds
+    :return: dictionary of {"<=5ms": count, ..., ">10000ms": count}
+    """
+    counts = defaultdict(int)
+    for value in values:
+        milliseconds = value * 1000
+        for bound in HISTOGRAM_BUCKETS_MS:
+            if milliseconds <= bound:
+                counts[f"<={bound}ms"] += 1
+                break
+        else:
+            counts[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] += 1
+    buckets = [f"<={bound}ms" for bound in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+    return {bucket: counts[bucket] for bucket in buckets}
+
+
+class MetricsCollector:
+    """
+    Thread-safe collection of RequestRecords of one run.
+
+    Besides the requests it keeps the observed propagation delays (dav_functions/readiness.py): the seconds from a
+    write until the server reported the change, by name.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.delays = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def add_delay(self, name, seconds):
+        with self._lock:
+            self.delays[name].append(seconds)
+
+    def merge_delays(self, delays):
+        """ Adds the delays of another collector, e.g. from a pytest-xdist worker. """
+        with self._lock:
+            for name, values in delays.items():
+                self.delays[name].extend(values)
+
+    def delay_report(self):
+        """ :return: dictionary of {name: summary as returned by stats.summarize} of the propagation delays """
+        with self._lock:
+            return {name: summarize(values) for name, values in sorted(self.delays.items())}
+
+    def dump(self):
+        """ The records as lists of plain values, e.g. to send them from a pytest-xdist worker to the controller. """
+        with self._lock:
+            return [[getattr(record, name) for name in RequestRecord.__slots__] for record in self.records]
+
+    def merge(self, rows):
+        """ Adds the records dumped by another collector. """
+        with self._lock:
+            self.records.extend(RequestRecord(*row) for row in rows)
+
+    def report(self):
+        """
+        Aggregates the records per operation, method and URL template.
+
+        :return: dictionary of {key: {count, statuses, bytes_sent, bytes_received, total, ttfb, dns, connect, tls,
+            histogram}}, where total, ttfb, dns, connect and tls are summaries as returned by stats.summarize
+        """
+        with self._lock:
+            records = list(self.records)
+        groups = defaultdict(list)
+        for record in records:
+            groups[record.key()].append(record)
+
+        report = {}
+        for key, group in sorted(groups.items()):
+            statuses = defaultdict(int)
+            for record in group:
+                statuses[str(record.status)] += 1
+            entry = {
+                "operation": group[0].operation,
+                "method": group[0].method,
+                "url_template": group[0].url_template,
+                "count": len(group),
+                "statuses": dict(statuses),
+                "bytes_sent": sum(record.bytes_sent for record in group),
+                "bytes_received": sum(record.bytes_received for record in group),
+                "new_connections": sum(1 for record in group if record.connect),
+            }
+            for timing in ("total", "ttfb", "dns", "connect", "tls"):
+                entry[timing] = summarize([getattr(record, timing) for record in group])
+            entry["histogram"] = histogram([record.total for record in group])
+            report[key] = entry
+        return report
+
+    def write_json(self, path):
+        """ Writes the report to a JSON file. """
+        with open(path, "w") as file:
+            json.dump({"requests": self.report(), "propagation": self.delay_report()}, file, indent=2)
+
+    def format_summary(self):
+        """ Formats the report as a table with latencies in milliseconds. """
+        lines = [f"{'request':<70}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'ttfb50':>9}{'conn':>7}"]
+        for key, entry in self.report().items():
+            lines.append(
+                f"{key[:69]:<70}{entry['count']:>7}"
+                + "".join(f"{entry['total'][p] * 1000:>9.1f}" for p in ("p50", "p95", "p99"))
+                + f"{entry['ttfb']['p50'] * 1000:>9.1f}{entry['new_connections']:>7}"
+            )
+        for name, summary in self.delay_report().items():
+            lines.append(
+                f"{'propagation ' + name:<70}{summary['count']:>7}"
+                + "".join(f"{summary[p] * 1000:>9.1f}" for p in ("p50", "p95", "p99"))
+            )
+        return "\n".join(lines)
+
+
+def start_request():
+    """ Forgets the connection timings of the previous request of this thread. """
+    _local.connection_timings = None
+
+
+def finish_request(collector, response, started, streamed):
+    """
+    Records a response in the collector.
+
+    :param collector: the MetricsCollector
+    :param response: the requests.Response
+    :param started: time.perf_counter() before the request was sent
+    :param streamed: True if the body was not read yet (stream=True), the bytes are then taken from Content-Length
+        and the total time ends when the headers were received
+    """
+    total = time.perf_counter() - started
+    request = response.request
+    if streamed or not isinstance(response.content, bytes):
+        bytes_received = int(response.headers.get("Content-Length") or 0)
+    else:
+        bytes_received = len(response.content)
+    dns, connect, tls = getattr(_local, "connection_timings", None) or (0.0, 0.0, 0.0)
+
+    collector.add(RequestRecord(
+        operation=current_operation(),
+        method=request.method,
+        url_template=url_template(request.url),
+        status=response.status_code,
+        bytes_sent=int(request.headers.get("Content-Length") or 0),
+        bytes_received=bytes_received,
+        dns=dns,
+        connect=connect,
+        tls=tls,
+        ttfb=response.elapsed.total_seconds(),
+        total=total
+    ))
+
+
+class _TimedConnectionMixin:
+    """ Measures DNS lookup, TCP connect and TLS handshake of new connections and stores them for the thread. """
+
+    def _new_conn(self):
+        host = self._dns_host
+        started = time.perf_counter()
+        try:
+            infos = socket.getaddrinfo(host, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+            addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        except socket.gaierror:
+            addresses = [host]  # urllib3 looks it up again and reports the error
+        resolved = time.perf_counter()
+        try:
+            sock = self._connect_any(addresses)
+        finally:
+            self._dns_host = host
+        self._connect_timings = (resolved - started, time.perf_counter() - resolved)
+        return sock
+
+    def _connect_any(self, addresses):
+        """
+        Connects to the first address that accepts the connection, in the order of the lookup (like
+        socket.create_connection does), so the TCP connect is measured without a second lookup.
+        """
+        for index, address in enumerate(addresses):
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except (ConnectTimeoutError, NewConnectionError):
+                if index == len(addresses) - 1:
+                    raise
+
+    def connect(self):
+        self._connect_timings = (0.0, 0.0)
+        started = time.perf_counter()
+        super().connect()
+        dns, connect = self._connect_timings
+        tls = time.perf_counter() - started - dns - connect if isinstance(self, HTTPSConnection) else 0.0
+        _local.connection_timings = (dns, connect, max(0.0, tls))
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """ A HTTPAdapter whose connections measure their DNS lookup, TCP connect and TLS handshake. """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool
+        }
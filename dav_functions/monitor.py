@@ -0,0 +1,266 @@
+"""
+Monitoring mode: runs the WebDAV, CardDAV and CalDAV checks continuously and exports the latencies for Prometheus.
+
+One long-running process repeats the load scenarios (dav_functions/load.py) with a single virtual user at a fixed
+interval. The session, its connections and the calendar discovery are kept between the runs. Per operation it keeps a
+cumulative histogram (fixed buckets) and the latencies of the last few runs for the quantiles, so memory does not grow
+with the uptime. The metrics are served in the Prometheus text format on a local HTTP endpoint.
+
+Usage (reads config/config.py):
+
+    python -m dav_functions.monitor --interval 60 --port 9464
+    curl http://127.0.0.1:9464/metrics
+"""
+import argparse
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dav_functions.caldav_discovery import CalendarDiscoveryCache
+from dav_functions.load import SCENARIOS, Recorder, VirtualUser
+from dav_functions.metrics import HISTOGRAM_BUCKETS_MS
+from dav_functions.session import create_session
+from dav_functions.stats import summarize
+
+DEFAULT_INTERVAL = 60
+DEFAULT_PORT = 9464
+# latencies per operation kept for the quantiles
+DEFAULT_WINDOW = 100
+
+# stats.summarize keys -> quantile label
+QUANTILES = {"p50": "0.5", "p90": "0.9", "p99": "0.99"}
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RollingHistogram:
+    """
+    Latencies of one operation in bounded memory: cumulative bucket counts, count and sum since the start (like a
+    Prometheus histogram) and the last window latencies for the quantiles.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.bounds = [bound / 1000 for bound in HISTOGRAM_BUCKETS_MS]
+        self.buckets = [0] * len(self.bounds)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds, failed):
+        for index, bound in enumerate(self.bounds):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        if failed:
+            self.errors += 1
+        self.recent.append(seconds)
+
+
+class MonitorRecorder(Recorder):
+    """ A Recorder that keeps a RollingHistogram per operation instead of all latencies. """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        super().__init__()
+        self.window = window
+        self.histograms = {}
+
+    def record(self, operation, elapsed, failed):
+        with self._lock:
+            if operation not in self.histograms:
+                self.histograms[operation] = RollingHistogram(self.window)
+            self.histograms[operation].add(elapsed, failed)
+
+    def snapshot(self):
+        """
+        A consistent copy of the histograms, taken while no operation is recorded.
+
+        :return: sorted list of (operation, bucket counts, count, sum, errors, recent latencies)
+        """
+        with self._lock:
+            return [
+                (operation, list(histogram.buckets), histogram.count, histogram.sum, histogram.errors,
+                 list(histogram.recent))
+                for operation, histogram in sorted(self.histograms.items())
+            ]
+
+    def error_count(self):
+        with self._lock:
+            return sum(histogram.errors for histogram in self.histograms.values())
+
+
+class Monitor:
+    """ Runs the scenarios one after the other, again and again, and keeps the results for export. """
+
+    def __init__(self, config, scenarios=tuple(SCENARIOS), window=DEFAULT_WINDOW, session=None):
+        """
+        :param config: the config module (config.config)
+        :param scenarios: names of the scenarios to run, see dav_functions.load.SCENARIOS
+        :param window: number of recent latencies per operation the quantiles are computed from
+        :param session: optional DAVSession, by default one is created and kept for the lifetime of the monitor
+        """
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        self.scenarios = list(scenarios)
+        self.recorder = MonitorRecorder(window)
+        self.user = VirtualUser(
+            0,
+            "mon-" + uuid.uuid4().hex[:8],
+            config,
+            session or create_session(config),
+            self.recorder,
+            CalendarDiscoveryCache(getattr(config, "caldav_discovery_cache", None))
+        )
+        self.iteration = 0
+        self.check_up = {}  # scenario -> 1 if its last run had no errors, else 0
+        self.check_runs = {}  # scenario -> number of runs
+        self.last_run = None
+        self._lock = threading.Lock()
+
+    def run_once(self):
+        """ Runs every scenario once. :return: dictionary of {scenario: True if it ran without errors} """
+        results = {}
+        for name in self.scenarios:
+            errors = self.recorder.error_count()
+            try:
+                SCENARIOS[name](self.user, self.iteration)
+                results[name] = self.recorder.error_count() == errors
+            except Exception as e:
+                print(f"Error in scenario {name}: {e}")
+                results[name] = False
+        with self._lock:
+            for name, success in results.items():
+                self.check_up[name] = 1 if success else 0
+                self.check_runs[name] = self.check_runs.get(name, 0) + 1
+            self.last_run = time.time()
+        self.iteration += 1
+        return results
+
+    def run(self, interval=DEFAULT_INTERVAL, stop=None):
+        """
+        Runs the scenarios every interval seconds until stop is set. A run that takes longer than the interval is
+        followed by the next one right away.
+
+        :param interval: seconds from the start of one run to the start of the next
+        :param stop: optional threading.Event that ends the loop
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            started = time.monotonic()
+            self.run_once()
+            stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+    def prometheus_text(self):
+        """ The metrics in the Prometheus text exposition format. """
+        lines = [
+            "# HELP dav_monitor_operation_duration_seconds Duration of the DAV operations of the checks.",
+            "# TYPE dav_monitor_operation_duration_seconds histogram"
+        ]
+        snapshots = [
+            (operation, buckets, count, total, errors, summarize(recent))
+            for operation, buckets, count, total, errors, recent in self.recorder.snapshot()
+        ]
+        for operation, buckets, count, total, _, _ in snapshots:
+            cumulative = 0
+            for bound, bucket in zip(HISTOGRAM_BUCKETS_MS, buckets):
+                cumulative += bucket
+                lines.append(f'dav_monitor_operation_duration_seconds_bucket{{operation="{operation}",'
+                             f'le="{bound / 1000:g}"}} {cumulative}')
+            lines.append(f'dav_monitor_operation_duration_seconds_bucket{{operation="{operation}",le="+Inf"}} {count}')
+            lines.append(f'dav_monitor_operation_duration_seconds_sum{{operation="{operation}"}} {total:.6f}')
+            lines.append(f'dav_monitor_operation_duration_seconds_count{{operation="{operation}"}} {count}')
+
+        lines.append("# HELP dav_monitor_operation_recent_duration_seconds Quantiles of the recent durations.")
+        lines.append("# TYPE dav_monitor_operation_recent_duration_seconds gauge")
+        for operation, _, _, _, _, summary in snapshots:
+            for key, quantile in QUANTILES.items():
+                lines.append(f'dav_monitor_operation_recent_duration_seconds{{operation="{operation}",'
+                             f'quantile="{quantile}"}} {summary[key]:.6f}')
+
+        lines.append("# HELP dav_monitor_operation_errors_total Failed DAV operations of the checks.")
+        lines.append("# TYPE dav_monitor_operation_errors_total counter")
+        for operation, _, _, _, errors, _ in snapshots:
+            lines.append(f'dav_monitor_operation_errors_total{{operation="{operation}"}} {errors}')
+
+        with self._lock:
+            lines.append("# HELP dav_monitor_check_up 1 if the last run of the check had no errors.")
+            lines.append("# TYPE dav_monitor_check_up gauge")
+            for name, up in sorted(self.check_up.items()):
+                lines.append(f'dav_monitor_check_up{{check="{name}"}} {up}')
+            lines.append("# HELP dav_monitor_check_runs_total Runs of the check.")
+            lines.append("# TYPE dav_monitor_check_runs_total counter")
+            for name, runs in sorted(self.check_runs.items()):
+                lines.append(f'dav_monitor_check_runs_total{{check="{name}"}} {runs}')
+            if self.last_run is not None:
+                lines.append("# HELP dav_monitor_last_run_timestamp_seconds End of the last run of the checks.")
+                lines.append("# TYPE dav_monitor_last_run_timestamp_seconds gauge")
+                lines.append(f"dav_monitor_last_run_timestamp_seconds {self.last_run:.3f}")
+        return "\n".join(lines) + "\n"
+
+
+def metrics_server(monitor, host="127.0.0.1", port=DEFAULT_PORT):
+    """
+    Creates the HTTP server exporting the metrics of a monitor on /metrics. Call serve_forever() to run it.
+
+    :param monitor: the Monitor
+    :param host: address to listen on, by default only local connections
+    :param port: port to listen on, 0 for any free port (see server_address)
+    :return: ThreadingHTTPServer
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = monitor.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes every few seconds would flood the output
+
+    return ThreadingHTTPServer((host, port), MetricsHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs the DAV checks continuously and exports the latencies in the Prometheus format.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma separated list of checks (default: %(default)s)")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help="seconds between the starts of two runs (default: %(default)s)")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                        help="recent latencies per operation used for the quantiles (default: %(default)s)")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the metrics endpoint (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="port of the metrics endpoint (default: %(default)s)")
+    args = parser.parse_args()
+
+    from config import config
+
+    monitor = Monitor(
+        config,
+        scenarios=[name.strip() for name in args.scenarios.split(",") if name.strip()],
+        window=args.window
+    )
+    server = metrics_server(monitor, args.host, args.port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics on http://{args.host}:{server.server_address[1]}/metrics, checks every {args.interval:g}s")
+    try:
+        monitor.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Streaming parser for WebDAV multistatus responses (PROPFIND / REPORT).
+
+The response is parsed while it is downloaded and every <d:response> element is removed from the tree as soon as it
+has been turned into a MultistatusEntry, so memory stays flat no matter how many resources the response lists.
+The request has to be sent with stream=True for this to work (for the async backend: the body must not be read yet).
+"""
+from collections import namedtuple
+from xml.etree import ElementTree as ET
+
+# chunk size in which the response body is read and fed into the parser
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# address-data (CardDAV) and calendar-data (CalDAV) hold the content of the resource
+DATA_TAGS = (
+    "{urn:ietf:params:xml:ns:carddav}address-data",
+    "{urn:ietf:params:xml:ns:caldav}calendar-data"
+)
+
+MultistatusEntry = namedtuple("MultistatusEntry", ["href", "etag", "data", "status"])
+MultistatusEntry.__doc__ = """
+One <d:response> of a multistatus response.
+
+href: the href of the resource
+etag: its ETag or None
+data: the address-data / calendar-data text or None
+status: the status code of the response (e.g. 404 for deleted resources in a sync-collection) or of its first
+    propstat, None if there is none
+"""
+
+
+def _status_code(element):
+    if element is None or not element.text:
+        return None
+    parts = element.text.split()
+    return int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+
+
+class MultistatusParser:
+    """
+    Incremental parser: feed it the body chunk by chunk and it returns the entries completed by each chunk.
+
+    The sync-token of a sync-collection response comes after all entries, it is available in sync_token once the
+    whole body was fed.
+    """
+
+    def __init__(self, entry=None):
+        """
+        :param entry: optional function that turns a <d:response> element into an entry, for other properties than
+            the ones of MultistatusEntry
+        """
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root = None
+        self._make_entry = entry or self._entry
+        self.sync_token = None
+
+    def feed(self, chunk):
+        """
+        :param chunk: the next bytes of the response body
+        :return: list of the MultistatusEntry completed by this chunk
+        """
+        self._parser.feed(chunk)
+        entries = []
+        for event, element in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = element
+            elif element.tag == "{DAV:}response":
+                entries.append(self._make_entry(element))
+                # drop the finished response, so the tree never grows
+                element.clear()
+                if self._root is not None:
+                    try:
+                        self._root.remove(element)
+                    except ValueError:
+                        pass
+            elif element.tag == "{DAV:}sync-token" and self._root is not None and element in list(self._root):
+                self.sync_token = element.text
+        return entries
+
+    def close(self):
+        self._parser.close()
+
+    @staticmethod
+    def _entry(element):
+        href = element.find("{DAV:}href")
+        etag = element.find(".//{DAV:}getetag")
+        data = None
+        for tag in DATA_TAGS:
+            data_element = element.find(".//" + tag)
+            if data_element is not None:
+                data = data_element.text
+                break
+        status = element.find("{DAV:}status")
+        if status is None:
+            status = element.find("{DAV:}propstat/{DAV:}status")
+        return MultistatusEntry(
+            href=href.text if href is not None else None,
+            etag=etag.text if etag is not None else None,
+            data=data,
+            status=_status_code(status)
+        )
+
+
+class MultistatusStream:
+    """
+    Iterates over the entries of a streamed multistatus response.
+
+    The sync-token of a sync-collection response comes after all entries, it is available in sync_token once the
+    iteration is finished.
+    """
+
+    def __init__(self, response, chunk_size=DEFAULT_CHUNK_SIZE, entry=None):
+        """
+        :param response: a requests.Response of a request sent with stream=True
+        :param chunk_size: size of the chunks the body is read in
+        :param entry: optional function that turns a <d:response> element into an entry, see MultistatusParser
+        """
+        self.response = response
+        self.chunk_size = chunk_size
+        self.entry = entry
+        self.sync_token = None
+
+    def __iter__(self):
+        parser = MultistatusParser(self.entry)
+        for chunk in self.response.iter_content(chunk_size=self.chunk_size):
+            yield from parser.feed(chunk)
+            self.sync_token = parser.sync_token
+        parser.close()
+
+
+def iter_multistatus(response, chunk_size=DEFAULT_CHUNK_SIZE, entry=None):
+    """
+    Yields the entries of a streamed multistatus response one by one.
+
+    :param response: a requests.Response of a request sent with stream=True
+    :param chunk_size: size of the chunks the body is read in
+    :param entry: optional function that turns a <d:response> element into an entry, see MultistatusParser
+    :return: generator of MultistatusEntry (href, etag, data, status), or of what entry returns
+    """
+    return iter(MultistatusStream(response, chunk_size, entry))
+
+
+async def aiter_multistatus(response, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the entries of a multistatus response of the async backend (aiohttp) while it is downloaded.
+
+    :param response: an aiohttp.ClientResponse whose body was not read yet
+    :param chunk_size: size of the chunks the body is read in
+    :return: async generator of MultistatusEntry (href, etag, data, status)
+    """
+    parser = MultistatusParser()
+    async for chunk in response.content.iter_chunked(chunk_size):
+        for entry in parser.feed(chunk):
+            yield entry
+    parser.close()
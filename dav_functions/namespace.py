@@ -0,0 +1,46 @@
+"""
+Names for the resources a test run creates, unique per run and per pytest-xdist worker.
+
+Test modules put the namespace into every file name, contact and event they create, so several workers (pytest -n)
+and several runs against the same instance never touch each other's resources.
+"""
+import os
+import re
+import uuid
+
+# unique per process, used if the run is not distributed with pytest-xdist
+_process_run_id = uuid.uuid4().hex[:8]
+
+UID_LINE = re.compile(r"^(UID[;:][^\r\n]*?)(\r?)$", re.MULTILINE | re.IGNORECASE)
+
+
+def worker_id():
+    """ The pytest-xdist worker of this process (gw0, gw1, ...), "main" if the tests are not distributed. """
+    return os.environ.get("PYTEST_XDIST_WORKER", "main")
+
+
+def run_namespace():
+    """
+    A short name unique for this run and worker, e.g. 3f2a9c1e-gw0.
+
+    All workers of a distributed run share the first part (pytest-xdist's test run UID), so the resources of one run
+    can be recognized by it.
+    """
+    run_id = os.environ.get("PYTEST_XDIST_TESTRUNUID", "")[:8] or _process_run_id
+    return f"{run_id}-{worker_id()}"
+
+
+def namespaced_name(name):
+    """ A display name (contact, event summary) with the namespace appended. """
+    return f"{name} {run_namespace()}"
+
+
+def namespaced_filename(filename):
+    """ A file name with the namespace before the extension, e.g. test_upload-3f2a9c1e-gw0.txt """
+    root, extension = os.path.splitext(filename)
+    return f"{root}-{run_namespace()}{extension}"
+
+
+def namespaced_uids(text):
+    """ vCard or iCalendar text with the namespace appended to every UID, so imports of fixed test data don't clash. """
+    return UID_LINE.sub(lambda match: f"{match.group(1)}-{run_namespace()}{match.group(2)}", text)
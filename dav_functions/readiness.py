@@ -0,0 +1,169 @@
+"""
+Waiting until the server shows a change, instead of sleeping a fixed time.
+
+After a write, the tests poll with cheap requests (HEAD of a file, a Depth: 0 PROPFIND for the CTag or sync-token of
+a collection) until the change is visible. The polls start quickly and back off exponentially up to a deadline. The
+time until the change became visible is the server's propagation delay; it is recorded in the MetricsCollector of
+the session, if it has one, and shows up in the latency report.
+"""
+import time
+
+import requests
+
+from dav_functions.metrics import label_operation
+from dav_functions.multistatus import iter_multistatus
+from dav_functions.session import requester
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_INITIAL_DELAY = 0.05
+DEFAULT_MAX_DELAY = 1.0
+
+# tags of a collection that change with its content, in order of preference
+COLLECTION_TAGS = ("{http://calendarserver.org/ns/}getctag", "{DAV:}sync-token", "{DAV:}getetag")
+
+COLLECTION_TAG_BODY = """<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="DAV:" xmlns:cs="http://calendarserver.org/ns/">
+    <d:prop>
+        <cs:getctag />
+        <d:sync-token />
+        <d:getetag />
+    </d:prop>
+</d:propfind>
+"""
+
+
+def wait_until(check, timeout=DEFAULT_TIMEOUT, initial_delay=DEFAULT_INITIAL_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """
+    Calls check until it returns a true value, with exponentially growing pauses.
+
+    :param check: function without arguments, exceptions count as not ready
+    :param timeout: seconds after which waiting is given up
+    :param initial_delay: pause after the first unsuccessful check, doubled after every further one
+    :param max_delay: longest pause between two checks
+    :return: tuple (result of the last check, seconds waited); the result is not true if the deadline passed
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    delay = initial_delay
+    while True:
+        try:
+            result = check()
+        except requests.RequestException as e:
+            print(f"Error while waiting: {e}")
+            result = None
+        now = time.monotonic()
+        if result or now >= deadline:
+            return result, now - started
+        time.sleep(min(delay, deadline - now))
+        delay = min(delay * 2, max_delay)
+
+
+def _record(session, name, seconds):
+    metrics = getattr(session, "metrics", None)
+    if metrics is not None:
+        metrics.add_delay(name, seconds)
+
+
+def wait_for_webdav_file(webdav_url, username, password, etag=None, name="webdav_file", timeout=DEFAULT_TIMEOUT,
+                         session=None):
+    """
+    Waits until a file can be read (HEAD), e.g. after an upload.
+
+    :param webdav_url: URL of the file on the WebDAV server
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param etag: optional ETag the file has to have, e.g. the one returned by the upload
+    :param name: name the propagation delay is recorded under
+    :param timeout: seconds after which waiting is given up
+    :param session: optional DAVSession, its MetricsCollector records the delay
+    :return: True if the file became visible in time, False otherwise
+    """
+    def check():
+        with label_operation("readiness"):
+            response = requester(session).head(webdav_url, auth=(username, password))
+        return response.ok and (etag is None or response.headers.get("ETag") == etag)
+
+    visible, waited = wait_until(check, timeout)
+    if visible:
+        _record(session, name, waited)
+    return bool(visible)
+
+
+def wait_for_webdav_absence(webdav_url, username, password, name="webdav_delete", timeout=DEFAULT_TIMEOUT,
+                            session=None):
+    """
+    Waits until a file or directory is gone (HEAD returns 404), e.g. after a delete.
+
+    :return: True if the resource disappeared in time, False otherwise
+    """
+    def check():
+        with label_operation("readiness"):
+            return requester(session).head(webdav_url, auth=(username, password)).status_code == 404
+
+    gone, waited = wait_until(check, timeout)
+    if gone:
+        _record(session, name, waited)
+    return gone
+
+
+def collection_tag(collection_url, username, password, session=None):
+    """
+    The tag of a calendar, address book or directory that changes whenever its content changes: the CTag, else the
+    sync-token, else the ETag. One Depth: 0 PROPFIND, much cheaper than listing the collection.
+
+    :param collection_url: URL of the collection
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param session: optional DAVSession to reuse pooled connections
+    :return: the tag or None if the server has none or an error occurs
+    """
+    def parse(element):
+        for tag in COLLECTION_TAGS:
+            found = element.find(".//" + tag)
+            if found is not None and found.text:
+                return found.text
+        return None
+
+    try:
+        with label_operation("readiness"):
+            with requester(session).request(
+                    method="PROPFIND",
+                    url=collection_url.rstrip("/") + "/",
+                    auth=(username, password),
+                    data=COLLECTION_TAG_BODY,
+                    headers={
+                        "content-type": "application/xml; charset=utf-8",
+                        "depth": "0"
+                    },
+                    stream=True) as response:
+                response.raise_for_status()
+                # the first response is the collection itself
+                for tag in iter_multistatus(response, entry=parse):
+                    return tag
+    except requests.RequestException as e:
+        print(f"Error reading the collection tag: {e}")
+    return None
+
+
+def wait_for_collection_change(collection_url, username, password, previous_tag, name="collection_change",
+                               timeout=DEFAULT_TIMEOUT, session=None):
+    """
+    Waits until the tag of a collection differs from the one read before a change (see collection_tag).
+
+    :param collection_url: URL of the calendar, address book or directory
+    :param username: Username for authentication
+    :param password: Password for authentication
+    :param previous_tag: the tag read before the change
+    :param name: name the propagation delay is recorded under
+    :param timeout: seconds after which waiting is given up
+    :param session: optional DAVSession, its MetricsCollector records the delay
+    :return: the new tag, or None if it did not change in time
+    """
+    def check():
+        tag = collection_tag(collection_url, username, password, session)
+        return tag if tag is not None and tag != previous_tag else None
+
+    tag, waited = wait_until(check, timeout)
+    if tag:
+        _record(session, name, waited)
+    return tag
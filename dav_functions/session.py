@@ -0,0 +1,101 @@
+import time
+
+import requests
+from urllib3.util.retry import Retry
+
+from dav_functions.metrics import TimedHTTPAdapter, finish_request, start_request
+
+
+# defaults used when the config does not define the http_* settings
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_TIMEOUT = 30
+
+# PROPFIND and REPORT only read data, so they are as safe to retry as GET
+RETRY_METHODS = Retry.DEFAULT_ALLOWED_METHODS | {"PROPFIND", "REPORT"}
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+
+class DAVSession(requests.Session):
+    """
+    A requests session for talking to the DAV endpoints of one server.
+
+    Connections are kept alive and pooled, failed requests are retried with an exponential backoff and every request
+    gets a default timeout unless the caller passes one explicitly.
+    If a MetricsCollector is given, every request is recorded in it (see dav_functions/metrics.py).
+    """
+
+    def __init__(
+            self,
+            username=None,
+            password=None,
+            pool_size=DEFAULT_POOL_SIZE,
+            retries=DEFAULT_RETRIES,
+            backoff_factor=DEFAULT_BACKOFF_FACTOR,
+            timeout=DEFAULT_TIMEOUT,
+            metrics=None):
+        """
+        :param username: Username for authentication, sent with every request if given
+        :param password: Password for authentication
+        :param pool_size: Number of connections kept open per host
+        :param retries: How often a failed request is retried
+        :param backoff_factor: Backoff factor between retries in seconds (0.5 -> 0.5s, 1s, 2s, ...)
+        :param timeout: Default timeout in seconds for connecting and reading
+        :param metrics: optional MetricsCollector that records every request
+        """
+        super().__init__()
+        if username is not None:
+            self.auth = (username, password)
+        self.timeout = timeout
+        self.metrics = metrics
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=RETRY_METHODS,
+            raise_on_status=False  # the dav_functions call raise_for_status() themselves
+        )
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        if self.metrics is None:
+            return super().request(method, url, **kwargs)
+
+        start_request()
+        started = time.perf_counter()
+        response = super().request(method, url, **kwargs)
+        finish_request(self.metrics, response, started, streamed=kwargs.get("stream", False))
+        return response
+
+
+def create_session(config, pool_size=None, metrics=None):
+    """
+    Creates a DAVSession from the config module.
+
+    The http_* settings are optional, the defaults above are used for the ones that are missing.
+
+    :param config: the config module (config.config)
+    :param pool_size: optional pool size that overrides the config, e.g. one connection per thread
+    :param metrics: optional MetricsCollector that records every request
+    :return: a DAVSession
+    """
+    return DAVSession(
+        username=config.username,
+        password=config.password,
+        pool_size=pool_size or getattr(config, "http_pool_size", DEFAULT_POOL_SIZE),
+        retries=getattr(config, "http_retries", DEFAULT_RETRIES),
+        backoff_factor=getattr(config, "http_backoff_factor", DEFAULT_BACKOFF_FACTOR),
+        timeout=getattr(config, "http_timeout", DEFAULT_TIMEOUT),
+        metrics=metrics
+    )
+
+
+def requester(session=None):
+    """ Returns the session to send a request with, or the requests module itself if no session is given. """
+    return session if session is not None else requests
@@ -0,0 +1,80 @@
+import math
+
+
+def percentile(sorted_values, p):
+    """
+    Returns the p-th percentile of already sorted values, interpolating between the closest ranks.
+
+    :param sorted_values: list of numbers in ascending order
+    :param p: percentile between 0 and 100
+    :return: the percentile or None if there are no values
+    """
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * p / 100
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    if lower == upper:
+        return sorted_values[lower]
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def summarize(values):
+    """
+    Summarizes a list of latencies.
+
+    :param values: latencies in seconds
+    :return: dictionary of {count, min, mean, p50, p90, p95, p99, max}, all None except count if there are no values
+    """
+    sorted_values = sorted(values)
+    count = len(sorted_values)
+    return {
+        "count": count,
+        "min": sorted_values[0] if count else None,
+        "mean": sum(sorted_values) / count if count else None,
+        "p50": percentile(sorted_values, 50),
+        "p90": percentile(sorted_values, 90),
+        "p95": percentile(sorted_values, 95),
+        "p99": percentile(sorted_values, 99),
+        "max": sorted_values[-1] if count else None
+    }
+
+
+def mann_whitney_u(baseline, current):
+    """
+    One-sided Mann-Whitney U test whether the current values tend to be larger than the baseline values.
+
+    Uses the normal approximation with tie and continuity correction, which is reasonable from about 8 values per
+    side on. No assumption about the distribution is made, which suits latencies with their long tails.
+
+    :param baseline: list of numbers, e.g. latencies before an upgrade
+    :param current: list of numbers, e.g. latencies after an upgrade
+    :return: the p-value, small values mean current is significantly larger
+    """
+    n1, n2 = len(baseline), len(current)
+    if not n1 or not n2:
+        return 1.0
+    combined = sorted([(value, 0) for value in baseline] + [(value, 1) for value in current])
+    n = n1 + n2
+
+    # average ranks for ties
+    current_rank_sum = 0.0
+    tie_correction = 0.0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        ties = j - i + 1
+        average_rank = (i + j) / 2 + 1
+        current_rank_sum += average_rank * sum(1 for k in range(i, j + 1) if combined[k][1] == 1)
+        tie_correction += ties ** 3 - ties
+        i = j + 1
+
+    u = current_rank_sum - n2 * (n2 + 1) / 2
+    mean = n1 * n2 / 2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_correction / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - mean - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
@@ -1,17 +1,42 @@
+import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+from xml.etree import ElementTree as ET
+
 import requests
 
+from dav_functions.session import requester
+
+# chunk size for streamed downloads
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Nextcloud's chunked upload (v2) wants chunks between 5 MB and 5 GB (only the last one may be smaller)
+# and at most 10000 chunks per upload
+MIN_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+MAX_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024 * 1024
+DEFAULT_UPLOAD_CHUNK_SIZE = 10 * 1024 * 1024
+DEFAULT_UPLOAD_WORKERS = 4
+MAX_UPLOAD_CHUNKS = 10000
+
 
-def get_webdav_file_content(webdav_url, username, password):
+def get_webdav_file_content(webdav_url, username, password, session=None, cache=None):
     """
     Retrieves the content of a file from a WebDAV server.
 
     :param webdav_url: URL of the file on the WebDAV server
     :param username: WebDAV server username
     :param password: WebDAV server password
+    :param session: optional DAVSession to reuse pooled connections
+    :param cache: optional WebDAVCache (dav_functions/webdav_cache.py), repeated reads of an unchanged file are then
+        served from disk after a conditional GET
     :return: Content of the file or None if an error occurs
     """
+    if cache is not None:
+        return cache.get_content(webdav_url, username, password, session=session)
     try:
-        response = requests.get(webdav_url, auth=(username, password))
+        response = requester(session).get(webdav_url, auth=(username, password))
         response.raise_for_status()  # This will raise an HTTPError if the HTTP request returned an unsuccessful status code
         return response.content
     except requests.RequestException as e:
@@ -28,7 +53,77 @@ def get_webdav_file_content(webdav_url, username, password):
 #     print(content)
 
 
-def upload_file_to_webdav(webdav_url, username, password, local_file_path, remote_file_name):
+def iter_webdav_file_content(webdav_url, username, password, chunk_size=DEFAULT_CHUNK_SIZE, session=None):
+    """
+    Streams the content of a file from a WebDAV server in chunks, without loading the whole file into memory.
+
+    :param webdav_url: URL of the file on the WebDAV server
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param chunk_size: Size of the chunks in bytes
+    :param session: optional DAVSession to reuse pooled connections
+    :return: generator of byte chunks, raises requests.RequestException if the download fails
+    """
+    with requester(session).get(webdav_url, auth=(username, password), stream=True) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+
+
+def verify_webdav_file_stream(
+        webdav_url,
+        username,
+        password,
+        expected_content=None,
+        hash_algorithm="sha256",
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        session=None):
+    """
+    Reads a file from a WebDAV server chunk by chunk and verifies it on the fly.
+
+    Memory use only depends on chunk_size, not on the size of the file. The expected content is also found if it
+    is split across two chunks.
+
+    :param webdav_url: URL of the file on the WebDAV server
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param expected_content: optional text (str or bytes) the file is supposed to contain
+    :param hash_algorithm: any algorithm supported by hashlib, e.g. sha256 or md5
+    :param chunk_size: Size of the chunks in bytes
+    :param session: optional DAVSession to reuse pooled connections
+    :return: dictionary of {size, hash, contains} or None if an error occurs;
+        contains is None if no expected_content was given
+    """
+    if isinstance(expected_content, str):
+        expected_content = expected_content.encode("utf-8")
+
+    file_hash = hashlib.new(hash_algorithm)
+    size = 0
+    found = not expected_content
+    # the end of the previous chunk, long enough to hold everything but the last byte of the expected content
+    tail = b""
+
+    try:
+        for chunk in iter_webdav_file_content(webdav_url, username, password, chunk_size, session=session):
+            file_hash.update(chunk)
+            size += len(chunk)
+            if expected_content and not found:
+                window = tail + chunk
+                found = expected_content in window
+                tail = window[-(len(expected_content) - 1):] if len(expected_content) > 1 else b""
+    except requests.RequestException as e:
+        print(f"Error retrieving the file: {e}")
+        return None
+
+    return {
+        "size": size,
+        "hash": file_hash.hexdigest(),
+        "contains": found if expected_content is not None else None
+    }
+
+
+def upload_file_to_webdav(webdav_url, username, password, local_file_path, remote_file_name, session=None):
     """
     Uploads a file to a WebDAV server.
 
@@ -37,6 +132,7 @@ def upload_file_to_webdav(webdav_url, username, password, local_file_path, remot
     :param password: WebDAV server password
     :param local_file_path: Path to the local file to be uploaded
     :param remote_file_name: The name of the file on the server after upload
+    :param session: optional DAVSession to reuse pooled connections
     :return: True if upload was successful, False otherwise
     """
     try:
@@ -46,7 +142,7 @@ def upload_file_to_webdav(webdav_url, username, password, local_file_path, remot
             full_url = f'{webdav_url.rstrip("/")}/{remote_file_name}'
             
             # Perform the PUT request to upload the file
-            response = requests.put(full_url, data=file, auth=(username, password))
+            response = requester(session).put(full_url, data=file, auth=(username, password))
             response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
             
             return True
@@ -68,17 +164,191 @@ def upload_file_to_webdav(webdav_url, username, password, local_file_path, remot
 #     print("Failed to upload the file.")
 
 
-def delete_webdav_file(webdav_url, username, password):
+def upload_file_to_webdav_mapped(
+        webdav_url,
+        username,
+        password,
+        local_file_path,
+        remote_file_name,
+        checksum_algorithm=None,
+        session=None):
+    """
+    Uploads a file to a WebDAV server from a memory map of the local file, e.g. for measuring the upload throughput
+    of the server with big files.
+
+    The mapped file is handed to the socket as one buffer, so the content is never copied through Python buffers and
+    the client does not become the bottleneck. The optional checksum is computed over the same mapping (hashlib reads
+    the buffer directly) and sent as OC-Checksum header, which Nextcloud stores and checks.
+
+    :param webdav_url: URL of the WebDAV server (directory where the file will be stored)
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param local_file_path: Path to the local file to be uploaded
+    :param remote_file_name: The name of the file on the server after upload
+    :param checksum_algorithm: optional hashlib algorithm for the OC-Checksum header, e.g. "sha1" or "md5"
+    :param session: optional DAVSession to reuse pooled connections
+    :return: True if upload was successful, False otherwise
+    """
+    full_url = f'{webdav_url.rstrip("/")}/{remote_file_name}'
+    try:
+        with open(local_file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                # empty files cannot be mapped
+                return _put_buffer(full_url, username, password, b"", checksum_algorithm, session)
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                # the view has to be released before the mapping is closed
+                with memoryview(mapped) as view:
+                    return _put_buffer(full_url, username, password, view, checksum_algorithm, session)
+    except (requests.RequestException, OSError, ValueError) as e:
+        print(f"Error uploading the file: {e}")
+        return False
+
+
+def _put_buffer(url, username, password, buffer, checksum_algorithm, session):
+    headers = {}
+    if checksum_algorithm:
+        checksum = hashlib.new(checksum_algorithm, buffer).hexdigest()
+        headers["OC-Checksum"] = f"{checksum_algorithm.upper()}:{checksum}"
+    # a buffer is sent with a single sendall() and can be sent again if the request is retried
+    response = requester(session).put(url, data=buffer, auth=(username, password), headers=headers)
+    response.raise_for_status()
+    return True
+
+
+def upload_file_to_webdav_chunked(
+        uploads_url,
+        webdav_url,
+        username,
+        password,
+        local_file_path,
+        remote_file_name,
+        chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE,
+        workers=DEFAULT_UPLOAD_WORKERS,
+        transfer_id=None,
+        session=None):
+    """
+    Uploads a file to a WebDAV server in chunks, using Nextcloud's chunked upload (v2).
+
+    The chunks are stored in a transfer folder below the uploads endpoint (MKCOL), uploaded in parallel (PUT) and
+    finally assembled into the target file (MOVE of the .file pseudo file).
+    If the same file was partially uploaded before, only the missing chunks are uploaded again. The transfer id is
+    derived from the local file and the target, so calling this function again after a failure resumes the upload.
+
+    :param uploads_url: URL of the user's upload endpoint, e.g. <base_url>/remote.php/dav/uploads/<username>
+    :param webdav_url: URL of the WebDAV server (directory where the file will be stored)
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param local_file_path: Path to the local file to be uploaded
+    :param remote_file_name: The name of the file on the server after upload
+    :param chunk_size: Size of the chunks in bytes, between MIN_UPLOAD_CHUNK_SIZE and MAX_UPLOAD_CHUNK_SIZE
+    :param workers: Number of chunks uploaded in parallel
+    :param transfer_id: optional name of the transfer folder, pass the same id to resume a transfer
+    :param session: optional DAVSession to reuse pooled connections
+    :return: True if upload was successful, False otherwise
+    """
+    http = requester(session)
+    auth = (username, password)
+    destination = f'{webdav_url.rstrip("/")}/{remote_file_name}'
+
+    if not MIN_UPLOAD_CHUNK_SIZE <= chunk_size <= MAX_UPLOAD_CHUNK_SIZE:
+        print(f"Error uploading the file: chunk size {chunk_size} is outside of the {MIN_UPLOAD_CHUNK_SIZE} to "
+              f"{MAX_UPLOAD_CHUNK_SIZE} bytes the server accepts")
+        return False
+
+    try:
+        stat = os.stat(local_file_path)
+    except OSError as e:
+        print(f"Error uploading the file: {e}")
+        return False
+    total_length = stat.st_size
+    chunk_count = max(1, -(-total_length // chunk_size))
+    if chunk_count > MAX_UPLOAD_CHUNKS:
+        print(f"Error uploading the file: {chunk_count} chunks exceed the limit of {MAX_UPLOAD_CHUNKS}, "
+              f"use a bigger chunk size")
+        return False
+
+    if transfer_id is None:
+        fingerprint = f"{os.path.abspath(local_file_path)}|{total_length}|{stat.st_mtime_ns}|{destination}|{chunk_size}"
+        transfer_id = "upload-" + hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:32]
+    transfer_url = f'{uploads_url.rstrip("/")}/{transfer_id}'
+    headers = {
+        "Destination": destination,
+        "OC-Total-Length": str(total_length)
+    }
+
+    def expected_size(number):
+        return min(chunk_size, total_length - (number - 1) * chunk_size)
+
+    def upload_chunk(number):
+        with open(local_file_path, 'rb') as file:
+            file.seek((number - 1) * chunk_size)
+            data = file.read(chunk_size)
+        response = http.put(f"{transfer_url}/{number}", data=data, auth=auth, headers=headers)
+        response.raise_for_status()
+
+    try:
+        uploaded = _list_uploaded_chunks(transfer_url, auth, http)
+        if uploaded is None:
+            response = http.request("MKCOL", transfer_url, auth=auth, headers={"Destination": destination})
+            response.raise_for_status()
+            uploaded = {}
+
+        missing = [
+            number for number in range(1, chunk_count + 1)
+            if uploaded.get(number) != expected_size(number)
+        ]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(upload_chunk, number) for number in missing]
+        # all chunks are tried even if one fails, so a resumed upload only has to retry the failed ones
+        for future in futures:
+            future.result()
+
+        response = http.request("MOVE", f"{transfer_url}/.file", auth=auth, headers=headers)
+        response.raise_for_status()
+        return True
+    except (requests.RequestException, OSError, ET.ParseError) as e:
+        print(f"Error uploading the file (transfer {transfer_id} can be resumed): {e}")
+        return False
+
+
+def _list_uploaded_chunks(transfer_url, auth, http):
+    """
+    Lists the chunks that are already stored in a transfer folder.
+
+    :return: dictionary of {chunk number: size in bytes}, or None if the transfer folder does not exist
+    """
+    response = http.request(
+        "PROPFIND",
+        transfer_url,
+        auth=auth,
+        headers={"depth": "1", "content-type": "application/xml"},
+        data='<d:propfind xmlns:d="DAV:"><d:prop><d:getcontentlength /></d:prop></d:propfind>'
+    )
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+
+    chunks = {}
+    for response_element in ET.fromstring(response.content).findall('{DAV:}response'):
+        name = unquote(response_element.find('{DAV:}href').text.rstrip("/").split("/")[-1])
+        length = response_element.find('.//{DAV:}getcontentlength')
+        if name.isdigit() and length is not None and length.text:
+            chunks[int(name)] = int(length.text)
+    return chunks
+
+
+def delete_webdav_file(webdav_url, username, password, session=None):
     """
     Deletes a file from a WebDAV server.
 
     :param webdav_url: The full URL to the file on the WebDAV server
     :param username: The username for WebDAV server authentication
     :param password: The password for WebDAV server authentication
+    :param session: optional DAVSession to reuse pooled connections
     :return: True if deletion was successful, False otherwise
     """
     try:
-        response = requests.delete(webdav_url, auth=(username, password))
+        response = requester(session).delete(webdav_url, auth=(username, password))
         response.raise_for_status()  # This will raise an HTTPError if the HTTP request returned an unsuccessful status code
         return True
     except requests.RequestException as e:
@@ -91,3 +361,51 @@ def delete_webdav_file(webdav_url, username, password):
 #     print("File deleted successfully.")
 # else:
 #     print("Failed to delete the file.")
+
+
+def copy_webdav_resource(source_url, destination_url, username, password, overwrite=False, session=None):
+    """
+    Copies a file or directory on the WebDAV server (COPY), without transferring the content.
+
+    :param source_url: The full URL of the file or directory to copy
+    :param destination_url: The full URL of the copy
+    :param username: The username for WebDAV server authentication
+    :param password: The password for WebDAV server authentication
+    :param overwrite: replace an existing destination, otherwise the copy fails if it exists
+    :param session: optional DAVSession to reuse pooled connections
+    :return: True if the copy was successful, False otherwise
+    """
+    return _transfer_webdav_resource("COPY", source_url, destination_url, username, password, overwrite, session)
+
+
+def move_webdav_resource(source_url, destination_url, username, password, overwrite=False, session=None):
+    """
+    Moves or renames a file or directory on the WebDAV server (MOVE), without transferring the content.
+
+    :param source_url: The full URL of the file or directory to move
+    :param destination_url: The full URL it is moved to
+    :param username: The username for WebDAV server authentication
+    :param password: The password for WebDAV server authentication
+    :param overwrite: replace an existing destination, otherwise the move fails if it exists
+    :param session: optional DAVSession to reuse pooled connections
+    :return: True if the move was successful, False otherwise
+    """
+    return _transfer_webdav_resource("MOVE", source_url, destination_url, username, password, overwrite, session)
+
+
+def _transfer_webdav_resource(method, source_url, destination_url, username, password, overwrite, session):
+    try:
+        response = requester(session).request(
+            method,
+            source_url,
+            auth=(username, password),
+            headers={
+                "Destination": destination_url,
+                "Overwrite": "T" if overwrite else "F",
+                "Depth": "infinity"
+            })
+        response.raise_for_status()
+        return True
+    except requests.RequestException as e:
+        print(f"Error during {method}: {e}")
+        return False
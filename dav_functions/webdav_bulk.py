@@ -0,0 +1,281 @@
+"""
+Directory-level WebDAV transfers, e.g. to sync a folder of thousands of small files like the desktop client does.
+
+With many small files the time goes into the request round trips, not into the bytes. The transfers therefore run with
+a bounded number of concurrent requests over the pooled connections of one session. Collections are created with MKCOL
+as needed, each only once. Copies and moves within the server are done with COPY/MOVE (see dav_functions/webdav.py),
+so no content passes through the client.
+
+Usage (reads config/config.py):
+
+    python -m dav_functions.webdav_bulk upload ./photos backup/photos --workers 16
+    python -m dav_functions.webdav_bulk download backup/photos ./restored --workers 16
+    python -m dav_functions.webdav_bulk delete backup/photos
+"""
+import argparse
+import os
+import sys
+import threading
+from urllib.parse import quote
+
+import requests
+
+from dav_functions.bulk import Progress
+from dav_functions.concurrency import bounded_map
+from dav_functions.session import requester
+from dav_functions.webdav import DEFAULT_CHUNK_SIZE, copy_webdav_resource, move_webdav_resource
+from dav_functions.webdav_tree import WebDAVTreeWalker
+
+DEFAULT_WORKERS = 8
+
+
+def print_transfer_progress(stats):
+    """ Default progress reporter of the transfers, with the throughput of the files done so far. """
+    print(f"{stats['action']}: {stats['done']} done, {stats['failed']} failed, {stats['per_second']:.1f} files/s, "
+          f"{stats['bytes_per_second'] / 1024 / 1024:.2f} MB/s")
+
+
+class TransferProgress(Progress):
+    """ Progress of a transfer, also counting the transferred bytes. """
+
+    def __init__(self, action, progress):
+        super().__init__(action, progress)
+        self.stats["bytes"] = 0
+
+    def count_file(self, size):
+        self.stats["bytes"] += size
+        self.count("done")
+
+    def result(self):
+        result = super().result()
+        result["bytes_per_second"] = result["bytes"] / result["duration"] if result["duration"] else 0.0
+        return result
+
+
+def collection_maker(webdav_url, username, password, session=None):
+    """
+    Returns a function creating the parent collections of a path below webdav_url, each only once.
+
+    The function can be called by several threads. A collection that exists already is not an error.
+
+    :param webdav_url: URL of an existing WebDAV directory
+    :return: function taking a relative file path, e.g. "a/b/file.txt" creates a and a/b
+    """
+    http = requester(session)
+    webdav_url = webdav_url.rstrip("/")
+    created = set()
+    lock = threading.Lock()
+
+    def create_parents(path):
+        parts = path.split("/")[:-1]
+        for depth in range(1, len(parts) + 1):
+            directory = "/".join(parts[:depth])
+            with lock:
+                if directory in created:
+                    continue
+            response = http.request("MKCOL", f"{webdav_url}/{quote(directory)}", auth=(username, password))
+            # 405: exists already, e.g. created by another worker in the meantime
+            if response.status_code not in (201, 405):
+                response.raise_for_status()
+            with lock:
+                created.add(directory)
+
+    return create_parents
+
+
+def iter_local_files(local_dir):
+    """
+    Lists the files below a local directory.
+
+    :return: generator of (relative path with "/" separators, size in bytes)
+    """
+    for directory, _, filenames in os.walk(local_dir):
+        for filename in sorted(filenames):
+            local_path = os.path.join(directory, filename)
+            path = os.path.relpath(local_path, local_dir).replace(os.sep, "/")
+            yield path, os.path.getsize(local_path)
+
+
+def upload_directory(
+        local_dir,
+        webdav_url,
+        username,
+        password,
+        workers=DEFAULT_WORKERS,
+        progress=print_transfer_progress,
+        session=None):
+    """
+    Uploads all files below a local directory, creating the subdirectories on the server as needed.
+
+    :param local_dir: the local directory
+    :param webdav_url: URL of the WebDAV directory the files are uploaded to (created if it does not exist)
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param workers: number of concurrent uploads
+    :param progress: function called with the intermediate statistics every PROGRESS_INTERVAL files, None for quiet
+    :param session: optional DAVSession to reuse pooled connections, should have a pool size of at least workers
+    :return: dictionary of {action, done, failed, bytes, duration, per_second, bytes_per_second}; all files count as
+        failed if the directory can't be created
+    """
+    http = requester(session)
+    auth = (username, password)
+    webdav_url = webdav_url.rstrip("/")
+    tracker = TransferProgress("upload", progress)
+    response = http.request("MKCOL", webdav_url, auth=auth)
+    if response.status_code not in (201, 405):
+        print(f"Error creating {webdav_url}: {response.status_code}")
+        for _ in iter_local_files(local_dir):
+            tracker.count("failed")
+        return tracker.result()
+    create_parents = collection_maker(webdav_url, username, password, session)
+
+    def upload(item):
+        path, _ = item
+        create_parents(path)
+        with open(os.path.join(local_dir, *path.split("/")), "rb") as file:
+            http.put(f"{webdav_url}/{quote(path)}", data=file, auth=auth).raise_for_status()
+
+    for (path, size), _, error in bounded_map(upload, iter_local_files(local_dir), workers):
+        if error is not None:
+            print(f"Error uploading {path}: {error}")
+            tracker.count("failed")
+        else:
+            tracker.count_file(size)
+    return tracker.result()
+
+
+def download_directory(
+        webdav_url,
+        local_dir,
+        username,
+        password,
+        workers=DEFAULT_WORKERS,
+        progress=print_transfer_progress,
+        session=None):
+    """
+    Downloads all files below a WebDAV directory into a local directory. The downloads are streamed to the files, so
+    memory does not depend on the file sizes.
+
+    :param webdav_url: URL of the WebDAV directory
+    :param local_dir: the local directory, created if it does not exist
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param workers: number of concurrent listings and downloads
+    :param progress: function called with the intermediate statistics every PROGRESS_INTERVAL files, None for quiet
+    :param session: optional DAVSession to reuse pooled connections, should have a pool size of at least workers
+    :return: dictionary of {action, done, failed, bytes, duration, per_second, bytes_per_second}; directories that
+        could not be listed count as failed
+    """
+    http = requester(session)
+    auth = (username, password)
+    webdav_url = webdav_url.rstrip("/")
+    local_root = os.path.abspath(local_dir)
+    tracker = TransferProgress("download", progress)
+    walker = WebDAVTreeWalker(webdav_url, username, password, workers, session=session)
+
+    def files():
+        for resource in walker:
+            if not resource.is_collection:
+                yield resource
+
+    def download(resource):
+        local_path = os.path.abspath(os.path.join(local_root, *resource.path.split("/")))
+        if not local_path.startswith(local_root + os.sep):
+            raise ValueError("path outside of the target directory")
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        size = 0
+        with http.get(f"{webdav_url}/{quote(resource.path)}", auth=auth, stream=True) as response:
+            response.raise_for_status()
+            with open(local_path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=DEFAULT_CHUNK_SIZE):
+                    file.write(chunk)
+                    size += len(chunk)
+        return size
+
+    for resource, size, error in bounded_map(download, files(), workers):
+        if error is not None:
+            print(f"Error downloading {resource.path}: {error}")
+            tracker.count("failed")
+        else:
+            tracker.count_file(size)
+    for path in walker.failed_directories:
+        tracker.count("failed")
+    return tracker.result()
+
+
+def delete_directory(webdav_url, username, password, session=None):
+    """
+    Deletes a WebDAV directory with all its content. This is a single DELETE, the server removes the tree.
+
+    :param webdav_url: URL of the WebDAV directory
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param session: optional DAVSession to reuse pooled connections
+    :return: True if the deletion was successful, False otherwise
+    """
+    try:
+        response = requester(session).delete(webdav_url.rstrip("/") + "/", auth=(username, password))
+        response.raise_for_status()
+        return True
+    except requests.RequestException as e:
+        print(f"Error deleting the directory: {e}")
+        return False
+
+
+def format_result(result):
+    """ Formats the statistics of a transfer. """
+    return (
+        f"{result['action']}: {result['done']} files, {result['bytes']} bytes, {result['failed']} failed in "
+        f"{result['duration']:.1f}s ({result['per_second']:.1f} files/s, "
+        f"{result['bytes_per_second'] / 1024 / 1024:.2f} MB/s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transfers directory trees to and from the configured user's files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    upload = commands.add_parser("upload", help="upload a local directory")
+    upload.add_argument("local_dir")
+    upload.add_argument("path", help="directory below the user's base directory")
+    download = commands.add_parser("download", help="download a directory")
+    download.add_argument("path", help="directory below the user's base directory")
+    download.add_argument("local_dir")
+    delete = commands.add_parser("delete", help="delete a directory")
+    delete.add_argument("path", help="directory below the user's base directory")
+    for command in ("copy", "move"):
+        server_side = commands.add_parser(command, help=f"{command} a file or directory on the server")
+        server_side.add_argument("source", help="path below the user's base directory")
+        server_side.add_argument("destination", help="path below the user's base directory")
+        server_side.add_argument("--overwrite", action="store_true", help="replace an existing destination")
+    for command in (upload, download):
+        command.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                             help="concurrent transfers (default: %(default)s)")
+    args = parser.parse_args()
+
+    from config import config
+    from dav_functions.session import create_session
+
+    session = create_session(config, pool_size=getattr(args, "workers", None))
+    credentials = (config.username, config.password)
+
+    def url(path):
+        return config.webdav_url + "/" + quote(path.strip("/"))
+
+    if args.command in ("upload", "download"):
+        if args.command == "upload":
+            result = upload_directory(args.local_dir, url(args.path), *credentials, args.workers, session=session)
+        else:
+            result = download_directory(url(args.path), args.local_dir, *credentials, args.workers, session=session)
+        print(format_result(result))
+        success = result["failed"] == 0
+    elif args.command == "delete":
+        success = delete_directory(url(args.path), *credentials, session=session)
+    else:
+        transfer = copy_webdav_resource if args.command == "copy" else move_webdav_resource
+        success = transfer(url(args.source), url(args.destination), *credentials, args.overwrite, session=session)
+    if not success:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Local content cache for repeated WebDAV reads.
+
+The cache keeps the body of every file it read on disk together with its ETag and Last-Modified. A repeated read sends
+If-None-Match / If-Modified-Since, and a 304 Not Modified is served from disk, so it only costs a header round trip.
+The total size of the cached bodies is bounded, the least recently used files are evicted first.
+
+    cache = WebDAVCache("/tmp/dav-cache", max_bytes=512 * 1024 * 1024)
+    content = get_webdav_file_content(url, username, password, session=session, cache=cache)
+    print(cache.stats())
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import requests
+
+from dav_functions.session import requester
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+INDEX_FILE = "index.json"
+
+CacheEntry = namedtuple("CacheEntry", ["url", "size", "etag", "last_modified"])
+
+
+class WebDAVCache:
+    """
+    A size-bounded LRU cache of WebDAV file contents, validated with conditional GETs.
+
+    The cache can be shared by threads. Its index is written to the cache directory by save(), so later runs start
+    with the files of earlier ones.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param directory: directory the bodies and the index are stored in, created if it does not exist
+        :param max_bytes: maximum total size of the cached bodies, bigger files are never cached
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> CacheEntry, least recently used first
+        self.size = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "bytes_saved": 0, "bytes_downloaded": 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, INDEX_FILE)):
+            self.load()
+
+    def load(self):
+        with open(os.path.join(self.directory, INDEX_FILE)) as file:
+            for key, entry in json.load(file):
+                if os.path.exists(self._path(key)):
+                    self.entries[key] = CacheEntry(*entry)
+                    self.size += entry[1]
+        self._evict()
+
+    def save(self):
+        with self._lock:
+            with open(os.path.join(self.directory, INDEX_FILE), "w") as file:
+                json.dump([[key, list(entry)] for key, entry in self.entries.items()], file)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get_content(self, webdav_url, username, password, session=None):
+        """
+        Retrieves the content of a file, from the cache if the server confirms it did not change.
+
+        :param webdav_url: URL of the file on the WebDAV server
+        :param username: WebDAV server username
+        :param password: WebDAV server password
+        :param session: optional DAVSession to reuse pooled connections
+        :return: Content of the file or None if an error occurs
+        """
+        # the same URL can have a different content for another user
+        key = hashlib.sha256(f"{username} {webdav_url}".encode("utf-8")).hexdigest()
+        with self._lock:
+            entry = self.entries.get(key)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        try:
+            response = requester(session).get(webdav_url, auth=(username, password), headers=headers)
+            if response.status_code == 304:
+                content = self._hit(key)
+                if content is not None:
+                    return content
+                # evicted by another thread in the meantime
+                response = requester(session).get(webdav_url, auth=(username, password))
+            if response.status_code == 404:
+                self._remove(key)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Error retrieving the file: {e}")
+            return None
+
+        content = response.content
+        with self._lock:
+            self.counters["misses"] += 1
+            self.counters["bytes_downloaded"] += len(content)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if (etag or last_modified) and len(content) <= self.max_bytes:
+            self._store(key, CacheEntry(webdav_url, len(content), etag, last_modified), content)
+        else:
+            self._remove(key)
+        return content
+
+    def _hit(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            try:
+                with open(self._path(key), "rb") as file:
+                    content = file.read()
+            except OSError:
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            self.counters["bytes_saved"] += entry.size
+            return content
+
+    def _store(self, key, entry, content):
+        # write to a temporary file first, so a crash never leaves a truncated body behind
+        temporary = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary, "wb") as file:
+                file.write(content)
+        except OSError as e:
+            print(f"Error caching the file: {e}")
+            return
+        with self._lock:
+            os.replace(temporary, self._path(key))
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+            self.entries[key] = entry
+            self.size += entry.size
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            key, entry = self.entries.popitem(last=False)
+            self.size -= entry.size
+            self.counters["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _remove(self, key):
+        with self._lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.size
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+
+    def stats(self):
+        """
+        :return: dictionary of {hits, misses, evictions, bytes_saved, bytes_downloaded, hit_ratio, entries, bytes};
+            hits are reads answered with 304 Not Modified, bytes_saved the bodies they did not transfer
+        """
+        with self._lock:
+            reads = self.counters["hits"] + self.counters["misses"]
+            return dict(
+                self.counters,
+                hit_ratio=self.counters["hits"] / reads if reads else 0.0,
+                entries=len(self.entries),
+                bytes=self.size
+            )
@@ -0,0 +1,261 @@
+"""
+Integrity check of a whole WebDAV tree across an upgrade.
+
+snapshot() records path, size, ETag and a content checksum of every file below a directory in a manifest (gzipped
+JSON lines). verify() lists the tree again after the upgrade and reports files that are missing, unreadable or whose
+content changed. Files whose ETag and size are unchanged are skipped. The checksums are taken from Nextcloud's
+oc:checksums property when the server has one, otherwise the file is downloaded and hashed on the fly.
+
+Usage (reads config/config.py):
+
+    python -m dav_functions.webdav_manifest snapshot synthetic-1 --manifest before.jsonl.gz
+    python -m dav_functions.webdav_manifest verify synthetic-1 --manifest before.jsonl.gz
+"""
+import argparse
+import gzip
+import json
+import sys
+import time
+from collections import namedtuple
+from urllib.parse import quote
+
+from dav_functions.bulk import Progress, print_progress
+from dav_functions.concurrency import bounded_map
+from dav_functions.webdav import verify_webdav_file_stream
+from dav_functions.webdav_tree import WebDAVTreeWalker
+
+DEFAULT_WORKERS = 8
+
+# algorithm used for files the server has no checksum for
+DEFAULT_HASH_ALGORITHM = "SHA256"
+
+CHECKSUMS_PROPERTY = "{http://owncloud.org/ns}checksums"
+
+# server checksums in order of preference, others (e.g. ADLER32) are not used
+SERVER_CHECKSUM_ALGORITHMS = ("SHA256", "SHA1", "MD5")
+
+ManifestEntry = namedtuple("ManifestEntry", ["size", "etag", "checksum"])
+
+VERIFY_OUTCOMES = ("unchanged", "ok", "altered", "unreadable", "missing", "added")
+
+
+def print_verify_progress(stats):
+    """ Default progress reporter of verify. """
+    print(f"verify: {stats['unchanged']} unchanged, {stats['ok']} ok, {stats['altered']} altered, "
+          f"{stats['unreadable']} unreadable, {stats['per_second']:.1f}/s")
+
+
+def server_checksums(resource):
+    """
+    The checksums the server reports for a file (oc:checksums, e.g. "SHA1:ab12... MD5:cd34...").
+
+    :param resource: WebDAVResource listed with the CHECKSUMS_PROPERTY
+    :return: dictionary of {algorithm: "ALGORITHM:hex"}
+    """
+    text = resource.properties.get(CHECKSUMS_PROPERTY) or ""
+    checksums = {}
+    for checksum in text.split():
+        algorithm, _, value = checksum.partition(":")
+        if value:
+            checksums[algorithm.upper()] = f"{algorithm.upper()}:{value.lower()}"
+    return checksums
+
+
+def content_checksum(file_url, username, password, algorithm, session=None):
+    """
+    Downloads a file and hashes it on the fly.
+
+    :return: "ALGORITHM:hex" or None if the file could not be read
+    """
+    result = verify_webdav_file_stream(
+        file_url, username, password, hash_algorithm=algorithm.lower(), session=session)
+    if result is None:
+        return None
+    return f"{algorithm.upper()}:{result['hash']}"
+
+
+def _file_url(root_url, path):
+    return f"{root_url.rstrip('/')}/{quote(path)}"
+
+
+def snapshot(
+        root_url,
+        username,
+        password,
+        manifest_path,
+        workers=DEFAULT_WORKERS,
+        progress=print_progress,
+        session=None):
+    """
+    Writes the manifest of all files below a WebDAV directory.
+
+    :param root_url: URL of the directory
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param manifest_path: the manifest file to write (gzipped JSON lines)
+    :param workers: number of concurrent listings and downloads
+    :param progress: function called with the intermediate statistics every PROGRESS_INTERVAL files, None for quiet
+    :param session: optional DAVSession to reuse pooled connections, should have a pool size of at least workers
+    :return: dictionary of {action, done, failed, downloaded, duration, per_second}; files that could not be read and
+        directories that could not be listed count as failed
+    """
+    tracker = Progress("snapshot", progress)
+    tracker.stats["downloaded"] = 0
+    # only the files the server has no checksum for are downloaded
+    walker = WebDAVTreeWalker(
+        root_url, username, password, workers, extra_properties=(CHECKSUMS_PROPERTY,), session=session)
+
+    def files():
+        for resource in walker:
+            if not resource.is_collection:
+                yield resource
+
+    def checksum(resource):
+        checksums = server_checksums(resource)
+        for algorithm in SERVER_CHECKSUM_ALGORITHMS:
+            if algorithm in checksums:
+                return checksums[algorithm], False
+        return content_checksum(
+            _file_url(root_url, resource.path), username, password, DEFAULT_HASH_ALGORITHM, session), True
+
+    with gzip.open(manifest_path, "wt", encoding="utf-8") as file:
+        file.write(json.dumps({"root": root_url, "created": time.time()}) + "\n")
+        for resource, result, error in bounded_map(checksum, files(), workers):
+            value, downloaded = result if error is None else (None, False)
+            tracker.stats["downloaded"] += downloaded
+            if value is None:
+                print(f"Error reading {resource.path}: {error or 'download failed'}")
+                tracker.count("failed")
+                continue
+            file.write(json.dumps([resource.path, resource.size, resource.etag, value]) + "\n")
+            tracker.count("done")
+    for _ in walker.failed_directories:
+        tracker.count("failed")
+    return tracker.result()
+
+
+def load_manifest(manifest_path):
+    """
+    Reads a manifest written by snapshot.
+
+    :return: tuple (header, entries): header is {root, created}, entries is {path: ManifestEntry}
+    """
+    with gzip.open(manifest_path, "rt", encoding="utf-8") as file:
+        header = json.loads(file.readline())
+        entries = {}
+        for line in file:
+            path, size, etag, checksum = json.loads(line)
+            entries[path] = ManifestEntry(size, etag, checksum)
+    return header, entries
+
+
+def verify(
+        root_url,
+        username,
+        password,
+        manifest_path,
+        workers=DEFAULT_WORKERS,
+        full=False,
+        read=False,
+        progress=print_verify_progress,
+        session=None):
+    """
+    Checks the files below a WebDAV directory against a manifest.
+
+    :param root_url: URL of the directory, usually the root of the manifest
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param manifest_path: a manifest written by snapshot
+    :param workers: number of concurrent listings and downloads
+    :param full: also check files whose ETag and size did not change
+    :param read: always download the files that are checked, even if the server has a checksum, to prove they are
+        readable
+    :param progress: function called with the intermediate statistics every PROGRESS_INTERVAL files, None for quiet
+    :param session: optional DAVSession to reuse pooled connections, should have a pool size of at least workers
+    :return: dictionary of {action, unchanged, ok, altered, unreadable, missing, added, duration, per_second, problems};
+        ok are files with a new ETag but the same content, problems is a list of (path, outcome) of the altered,
+        unreadable and missing files; files below directories that could not be listed count as unreadable
+    """
+    _, expected = load_manifest(manifest_path)
+    tracker = Progress("verify", progress, VERIFY_OUTCOMES)
+    problems = []
+    walker = WebDAVTreeWalker(
+        root_url, username, password, workers, extra_properties=(CHECKSUMS_PROPERTY,), session=session)
+
+    def changed_files():
+        for resource in walker:
+            if resource.is_collection:
+                continue
+            entry = expected.pop(resource.path, None)
+            if entry is None:
+                tracker.count("added")
+            elif not full and resource.etag == entry.etag and resource.size == entry.size:
+                tracker.count("unchanged")
+            else:
+                yield resource, entry
+
+    def check(item):
+        resource, entry = item
+        algorithm = entry.checksum.split(":", 1)[0]
+        checksum = None if read else server_checksums(resource).get(algorithm)
+        if checksum is None:
+            checksum = content_checksum(_file_url(root_url, resource.path), username, password, algorithm, session)
+        if checksum is None:
+            return "unreadable"
+        return "ok" if checksum.lower() == entry.checksum.lower() else "altered"
+
+    for (resource, _), outcome, error in bounded_map(check, changed_files(), workers):
+        if error is not None:
+            print(f"Error checking {resource.path}: {error}")
+            outcome = "unreadable"
+        if outcome != "ok":
+            problems.append((resource.path, outcome))
+        tracker.count(outcome)
+    # files below directories that could not be listed may still exist, only the listed ones are really missing
+    for path in sorted(expected):
+        unlisted = any(not directory or path.startswith(directory + "/") for directory in walker.failed_directories)
+        outcome = "unreadable" if unlisted else "missing"
+        problems.append((path, outcome))
+        tracker.count(outcome)
+    return dict(tracker.result(), problems=sorted(problems))
+
+
+def format_result(result):
+    """ Formats the statistics of snapshot or verify and the problems found by verify. """
+    counts = ", ".join(f"{result[key]} {key}" for key in result if isinstance(result[key], int))
+    lines = [f"{result['action']}: {counts} in {result['duration']:.1f}s ({result['per_second']:.1f} files/s)"]
+    for path, outcome in result.get("problems", []):
+        lines.append(f"{outcome:<12}{path}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshots or verifies the files of a WebDAV directory tree.")
+    parser.add_argument("command", choices=["snapshot", "verify"])
+    parser.add_argument("path", nargs="?", default="", help="directory below the user's base directory")
+    parser.add_argument("--manifest", required=True, help="the manifest file (gzipped JSON lines)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="concurrent listings and downloads (default: %(default)s)")
+    parser.add_argument("--full", action="store_true", help="verify: also check files with an unchanged ETag")
+    parser.add_argument("--read", action="store_true",
+                        help="verify: download the checked files even if the server has a checksum")
+    args = parser.parse_args()
+
+    from config import config
+    from dav_functions.session import create_session
+
+    session = create_session(config, pool_size=args.workers)
+    path = args.path.strip("/")
+    root_url = config.webdav_url + ("/" + quote(path) if path else "")
+    if args.command == "snapshot":
+        result = snapshot(root_url, config.username, config.password, args.manifest, args.workers, session=session)
+    else:
+        result = verify(root_url, config.username, config.password, args.manifest, args.workers,
+                        full=args.full, read=args.read, session=session)
+    print(format_result(result))
+    if result["failed" if args.command == "snapshot" else "problems"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
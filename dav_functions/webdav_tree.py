@@ -0,0 +1,325 @@
+"""
+Lists WebDAV directory trees, e.g. to check after an upgrade that a large user tree is still listable.
+
+Every directory is listed with a Depth: 1 PROPFIND for only the needed properties (Depth: infinity is disabled on
+most servers and would return the whole tree in one response). Subdirectories are listed concurrently by a bounded
+number of threads. The entries are yielded while the responses are parsed, and the directories still to be listed are
+capped, so memory does not grow with the tree.
+
+Usage (reads config/config.py):
+
+    python -m dav_functions.webdav_tree synthetic-1 --workers 16 --quiet
+"""
+import argparse
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote, urlparse
+from xml.sax.saxutils import escape
+
+from dav_functions.metrics import label_operation
+from dav_functions.multistatus import iter_multistatus
+from dav_functions.session import requester
+from dav_functions.stats import summarize
+
+DEFAULT_WORKERS = 8
+# directories found but not yet listed; listings finding more wait until some have been listed
+DEFAULT_MAX_WAITING = 10000
+# entries parsed by the workers but not yet yielded
+RESULTS_QUEUE_SIZE = 1000
+# seconds a worker waits for room in the results queue before it checks whether the walk was stopped
+STOP_POLL_INTERVAL = 0.1
+
+# the properties every listing asks for
+PROPERTIES = ("{DAV:}resourcetype", "{DAV:}getcontentlength", "{DAV:}getetag", "{DAV:}getlastmodified")
+
+WebDAVResource = namedtuple(
+    "WebDAVResource", ["path", "href", "is_collection", "size", "etag", "last_modified", "properties"])
+WebDAVResource.__doc__ = """
+One file or directory of a listing.
+
+path: the path relative to the listed directory (or to the root of a walk), without leading or trailing slash
+href: the href as returned by the server
+is_collection: True for directories
+size: the size in bytes, None for directories
+etag: the ETag or None
+last_modified: the getlastmodified text or None
+properties: dictionary of {property: text} of the requested extra properties, e.g. {"{http://owncloud.org/ns}fileid"}
+"""
+
+
+def propfind_body(properties):
+    """ A PROPFIND body asking for the given properties in Clark notation ({namespace}name). """
+    elements = []
+    for index, tag in enumerate(properties):
+        namespace, name = tag[1:].split("}", 1)
+        elements.append(f'<p{index}:{name} xmlns:p{index}="{escape(namespace)}" />')
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        f'<d:propfind xmlns:d="DAV:"><d:prop>{"".join(elements)}</d:prop></d:propfind>'
+    )
+
+
+def _resource_parser(base_path, extra_properties):
+    """ Returns a function turning <d:response> elements into WebDAVResource with paths relative to base_path. """
+    base_path = base_path.rstrip("/")
+
+    def text(element, tag):
+        found = element.find(".//" + tag)
+        if found is None:
+            return None
+        # properties like oc:checksums nest their value in child elements
+        return "".join(found.itertext()).strip() or None
+
+    def parse(element):
+        href = element.find("{DAV:}href").text
+        path = unquote(urlparse(href).path).rstrip("/")
+        size = text(element, "{DAV:}getcontentlength")
+        return WebDAVResource(
+            path=path[len(base_path):].strip("/") if path.startswith(base_path) else path,
+            href=href,
+            is_collection=element.find(".//{DAV:}resourcetype/{DAV:}collection") is not None,
+            size=int(size) if size is not None else None,
+            etag=text(element, "{DAV:}getetag"),
+            last_modified=text(element, "{DAV:}getlastmodified"),
+            properties={tag: text(element, tag) for tag in extra_properties}
+        )
+
+    return parse
+
+
+def iter_webdav_directory(directory_url, username, password, extra_properties=(), session=None):
+    """
+    Lists the files and subdirectories of a WebDAV directory with a streamed Depth: 1 PROPFIND.
+
+    :param directory_url: URL of the directory
+    :param username: WebDAV server username
+    :param password: WebDAV server password
+    :param extra_properties: further properties to request in Clark notation, e.g. "{http://owncloud.org/ns}fileid"
+    :param session: optional DAVSession to reuse pooled connections
+    :return: generator of WebDAVResource with paths relative to the directory, raises an exception if an error occurs
+    """
+    directory_path = unquote(urlparse(directory_url).path).rstrip("/")
+    parse = _resource_parser(directory_path, extra_properties)
+    with requester(session).request(
+            method="PROPFIND",
+            url=directory_url.rstrip("/") + "/",
+            auth=(username, password),
+            data=propfind_body(PROPERTIES + tuple(extra_properties)),
+            headers={
+                "content-type": "application/xml; charset=utf-8",
+                "depth": "1"
+            },
+            stream=True) as response:
+        response.raise_for_status()
+        for resource in iter_multistatus(response, entry=parse):
+            if resource.path:  # not the directory itself
+                yield resource
+
+
+class WebDAVTreeWalker:
+    """
+    Walks a WebDAV directory tree with concurrent Depth: 1 PROPFINDs.
+
+    Iterating the walker yields every file and directory below the root (in no particular order) while the listings
+    are still being parsed. Afterwards report() gives the listing throughput and the latency of the directory
+    listings. Directories that cannot be listed are reported as failed, the walk goes on with the others (entries
+    parsed before the error are yielded).
+
+    At most max_waiting directories wait to be listed: a listing that finds another directory beyond that is held
+    back until some have been listed. One listing always goes on, so the walk cannot stall; the limit can therefore
+    be exceeded by the subdirectories of one directory.
+    """
+
+    def __init__(
+            self,
+            root_url,
+            username,
+            password,
+            workers=DEFAULT_WORKERS,
+            max_depth=None,
+            extra_properties=(),
+            session=None,
+            max_waiting=DEFAULT_MAX_WAITING):
+        """
+        :param root_url: URL of the directory to start at
+        :param username: WebDAV server username
+        :param password: WebDAV server password
+        :param workers: number of directories listed at the same time
+        :param max_depth: optional number of directory levels to list, 1 only lists the root
+        :param extra_properties: further properties to request in Clark notation, see WebDAVResource.properties
+        :param session: optional DAVSession to reuse pooled connections, should have a pool size of at least workers
+        :param max_waiting: number of directories waiting to be listed before the listings are held back
+        """
+        self.root_url = root_url.rstrip("/")
+        self.auth = (username, password)
+        self.workers = workers
+        self.max_depth = max_depth
+        self.extra_properties = tuple(extra_properties)
+        self.session = session
+        self.max_waiting = max_waiting
+        self.latencies = []
+        self.failed_directories = []
+        self.stats = {"directories": 0, "entries": 0, "files": 0, "bytes": 0}
+        self.duration = 0.0
+        # shared with the workers: directories found but not yet listed, running and held back listings
+        self._gate = threading.Condition()
+        self._pending = 0
+        self._active = 0
+        self._held = 0
+
+    def _descend(self, depth):
+        """ Whether the subdirectories of a directory at this depth are listed. """
+        return self.max_depth is None or depth + 1 < self.max_depth
+
+    def _reserve(self, stop):
+        """ Waits until a found directory may join the ones waiting to be listed. :return: False if stopped """
+        with self._gate:
+            self._held += 1
+            while self._pending >= self.max_waiting and self._held < self._active and not stop.is_set():
+                self._gate.wait()
+            self._held -= 1
+            self._pending += 1
+            return not stop.is_set()
+
+    @staticmethod
+    def _put(results, item, stop):
+        """ Puts an item on the results queue, waiting for room. :return: False if stopped """
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=STOP_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _list(self, path, depth, results, stop):
+        """
+        Lists one directory in a worker thread. Puts ("entry", path, depth, resource) on results for every entry as
+        soon as it is parsed, then ("done", path, depth, seconds) or ("error", path, depth, exception).
+        """
+        url = self.root_url + ("/" + quote(path) if path else "")
+        started = time.perf_counter()
+        try:
+            with label_operation("webdav_list"):
+                for resource in iter_webdav_directory(url, *self.auth, self.extra_properties, session=self.session):
+                    resource = resource._replace(path=f"{path}/{resource.path}" if path else resource.path)
+                    if resource.is_collection and self._descend(depth) and not self._reserve(stop):
+                        return
+                    if not self._put(results, ("entry", path, depth, resource), stop):
+                        return
+        except Exception as e:
+            self._put(results, ("error", path, depth, e), stop)
+        else:
+            self._put(results, ("done", path, depth, time.perf_counter() - started), stop)
+
+    def __iter__(self):
+        started = time.perf_counter()
+        # directories waiting to be listed, taken last in first out, so the queue stays small in deep trees
+        waiting = deque([("", 0)])
+        results = queue.Queue(maxsize=RESULTS_QUEUE_SIZE)
+        stop = threading.Event()
+        self._pending, self._active, self._held = 1, 0, 0
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while waiting or self._active:
+                while waiting and self._active < self.workers:
+                    path, depth = waiting.pop()
+                    with self._gate:
+                        self._pending -= 1
+                        self._active += 1
+                        self._gate.notify_all()
+                    executor.submit(self._list, path, depth, results, stop)
+                kind, path, depth, value = results.get()
+                if kind == "entry":
+                    self.stats["entries"] += 1
+                    if value.is_collection:
+                        if self._descend(depth):
+                            waiting.append((value.path, depth + 1))
+                    else:
+                        self.stats["files"] += 1
+                        self.stats["bytes"] += value.size or 0
+                    yield value
+                else:
+                    with self._gate:
+                        self._active -= 1
+                        self._gate.notify_all()
+                    if kind == "error":
+                        print(f"Error listing {path or '/'}: {value}")
+                        self.failed_directories.append(path)
+                    else:
+                        self.stats["directories"] += 1
+                        self.latencies.append(value)
+                self.duration = time.perf_counter() - started
+        finally:
+            # also when the iteration is given up early: the workers end their listings
+            with self._gate:
+                stop.set()
+                self._gate.notify_all()
+            executor.shutdown()
+
+    def report(self):
+        """
+        :return: dictionary of {directories, entries, files, bytes, failed, duration, per_second, latency};
+            directories are the listed directories, per_second counts the entries, latency is a summary of the
+            directory listing times as returned by stats.summarize
+        """
+        return dict(
+            self.stats,
+            failed=len(self.failed_directories),
+            duration=self.duration,
+            per_second=self.stats["entries"] / self.duration if self.duration else 0.0,
+            latency=summarize(self.latencies)
+        )
+
+
+def walk_webdav_tree(root_url, username, password, workers=DEFAULT_WORKERS, max_depth=None, session=None):
+    """
+    Yields every file and directory below a WebDAV directory, see WebDAVTreeWalker.
+
+    :return: generator of WebDAVResource with paths relative to root_url
+    """
+    return iter(WebDAVTreeWalker(root_url, username, password, workers, max_depth, session=session))
+
+
+def format_report(report):
+    """ Formats a walk report, latencies in milliseconds. """
+    lines = [
+        f"{report['directories']} directories listed, {report['files']} files, {report['bytes']} bytes, "
+        f"{report['failed']} failed in {report['duration']:.1f}s ({report['per_second']:.1f} entries/s)"
+    ]
+    latency = report["latency"]
+    if latency["count"]:
+        lines.append(
+            f"directory listing latency: p50 {latency['p50'] * 1000:.1f}ms, p95 {latency['p95'] * 1000:.1f}ms, "
+            f"max {latency['max'] * 1000:.1f}ms"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lists a WebDAV directory tree of the configured user.")
+    parser.add_argument("path", nargs="?", default="", help="directory below the user's base directory")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="directories listed at the same time (default: %(default)s)")
+    parser.add_argument("--max-depth", type=int, default=None, help="directory levels to list (default: all)")
+    parser.add_argument("--quiet", action="store_true", help="only print the report, not every entry")
+    args = parser.parse_args()
+
+    from config import config
+    from dav_functions.session import create_session
+
+    session = create_session(config, pool_size=args.workers)
+    root_url = config.webdav_url + ("/" + quote(args.path.strip("/")) if args.path.strip("/") else "")
+    walker = WebDAVTreeWalker(
+        root_url, config.username, config.password, args.workers, args.max_depth, session=session)
+    for resource in walker:
+        if not args.quiet:
+            print(f"{'d' if resource.is_collection else 'f'} {resource.size or 0:>12} {resource.path}")
+    print(format_report(walker.report()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Runs the create/read/update/delete flows with the asyncio backend. The async def tests run on the event loop of
+conftest.py, no pytest plugin needed.
+"""
+import asyncio
+from datetime import datetime
+
+import vobject
+
+from config import config
+from dav_functions import async_caldav, async_carddav, async_webdav
+from dav_functions.caldav import create_event_data, ical_values
+from dav_functions.namespace import namespaced_filename, namespaced_name, run_namespace
+
+# resources unique per run and worker, so they never collide with other tests or workers
+test_file_name = namespaced_filename("async.txt")
+test_contact_name = namespaced_name("Async Contact")
+test_event_summary = namespaced_name("Async Event")
+test_contact_email = f"async-{run_namespace()}@example.com"
+test_event_start = datetime(2023, 11, 15, 16, 0, 0)
+test_event_end = datetime(2023, 11, 15, 17, 0, 0)
+search_range_start = datetime(2023, 11, 10)
+search_range_end = datetime(2023, 11, 20)
+
+
+async def test_async_webdav_flow(async_dav_session):
+    file_url = config.webdav_url + "/" + test_file_name
+    credentials = (config.username, config.password)
+
+    assert await async_webdav.upload_file_to_webdav(
+        config.webdav_url, *credentials, "test_data/" + config.testfile_name, test_file_name, async_dav_session)
+
+    content = await async_webdav.get_webdav_file_content(file_url, *credentials, async_dav_session)
+    assert content is not None
+    assert config.testfile_contains in content.decode()
+
+    result = await async_webdav.verify_webdav_file_stream(
+        file_url, *credentials, async_dav_session, expected_content=config.testfile_contains, chunk_size=8)
+    assert result["contains"]
+
+    assert await async_webdav.delete_webdav_file(file_url, *credentials, async_dav_session)
+    assert await async_webdav.get_webdav_file_content(file_url, *credentials, async_dav_session) is None
+
+
+async def test_async_carddav_flow(async_dav_session):
+    credentials = (config.carddav_url, config.username, config.password)
+
+    assert await async_carddav.create_carddav_contact(
+        *credentials, {"fullname": test_contact_name, "email": test_contact_email}, async_dav_session)
+    contact = await async_carddav.fetch_carddav_contact(*credentials, test_contact_name, async_dav_session)
+
+    vcard = vobject.readOne(contact["vcard"].serialize())
+    vcard.add("note").value = "Updated by the async test."
+    assert await async_carddav.update_carddav_contact(*credentials, vcard, contact["href"], async_dav_session)
+    contacts = await async_carddav.find_carddav_contacts(*credentials, async_dav_session, fn=test_contact_name)
+    assert [contact["vcard"].note.value for contact in contacts] == ["Updated by the async test."]
+
+    assert await async_carddav.delete_carddav_contact(*credentials, contact["href"], async_dav_session)
+    assert await async_carddav.find_carddav_contacts(*credentials, async_dav_session, fn=test_contact_name) == []
+
+
+async def test_async_caldav_flow(async_dav_session):
+    credentials = (config.username, config.password)
+    calendar_url = await async_caldav.find_calendar_url(
+        config.caldav_url, *credentials, config.calendar_name, async_dav_session)
+    assert calendar_url, "Calendar " + config.calendar_name + " not found"
+
+    event_data = create_event_data(test_event_summary, test_event_start, test_event_end, "Created asynchronously")
+    assert await async_caldav.create_caldav_event(calendar_url, *credentials, event_data, async_dav_session)
+    event = await async_caldav.get_calendar_event_by_name_range(
+        calendar_url, *credentials, test_event_summary, search_range_start, search_range_end, async_dav_session)
+    assert event is not None, "Event was not created successfully."
+
+    # update with the ETag, a second update with the same ETag has to fail
+    updated = event.data.replace("Created asynchronously", "Updated asynchronously")
+    assert await async_caldav.update_caldav_event_by_href(
+        calendar_url, *credentials, event.href, updated, async_dav_session, event.etag)
+    assert not await async_caldav.update_caldav_event_by_href(
+        calendar_url, *credentials, event.href, updated, async_dav_session, event.etag)
+
+    uid = ical_values(event.data, "UID")[0]
+    event = await async_caldav.get_calendar_event_by_uid(calendar_url, *credentials, uid, async_dav_session)
+    assert ical_values(event.data, "DESCRIPTION") == ["Updated asynchronously"]
+
+    assert await async_caldav.delete_caldav_event(calendar_url, *credentials, uid, async_dav_session)
+    assert await async_caldav.get_calendar_event_by_uid(calendar_url, *credentials, uid, async_dav_session) is None
+
+
+async def test_async_concurrent_requests(async_dav_session):
+    # many reads in flight at once on one event loop
+    file_url = config.webdav_url + "/" + config.textfile_name
+    contents = await asyncio.gather(*(
+        async_webdav.get_webdav_file_content(file_url, config.username, config.password, async_dav_session)
+        for _ in range(50)
+    ))
+    assert all(content is not None and config.textfile_contains in content.decode() for content in contents)
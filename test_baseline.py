@@ -0,0 +1,67 @@
+"""
+Tests the comparison of a run against a performance baseline. These tests don't need a Nextcloud instance or a config.
+"""
+from dav_functions.baseline import compare_to_baseline
+
+
+def run(**latencies):
+    """ A baseline with the given latencies per request type, e.g. run(propfind=[0.1, 0.2]). """
+    return {
+        "duration": 10,
+        "operations": {
+            key: {"count": len(values), "throughput": len(values) / 10, "samples": sorted(values)}
+            for key, values in latencies.items()
+        }
+    }
+
+
+def results_by_key(results):
+    return {result["key"]: result for result in results}
+
+
+def test_baseline_regression():
+    before = run(get=[0.10 + i / 1000 for i in range(20)])
+    slower = run(get=[0.15 + i / 1000 for i in range(20)])
+    result = results_by_key(compare_to_baseline(before, slower))["get"]
+    assert abs(result["change"] - 0.05 / 0.1095) < 1e-9
+    assert result["p_value"] < 0.05
+    assert result["regressed"]
+
+    # the same significant slowdown is no regression if it stays below the threshold
+    assert not compare_to_baseline(before, slower, threshold=0.5)[0]["regressed"]
+
+    # faster is never a regression
+    assert not compare_to_baseline(slower, before)[0]["regressed"]
+
+
+def test_baseline_threshold_boundary():
+    before = run(get=[0.5] * 10)
+    # the median grows by exactly the threshold: the change has to be larger to count
+    after = run(get=[0.75] * 10)
+    result = compare_to_baseline(before, after, threshold=0.5)[0]
+    assert result["change"] == 0.5
+    assert result["p_value"] < 0.05
+    assert not result["regressed"]
+    assert compare_to_baseline(before, after, threshold=0.4999)[0]["regressed"]
+    # significance is required as well
+    assert not compare_to_baseline(before, after, threshold=0.4999, alpha=result["p_value"])[0]["regressed"]
+
+
+def test_baseline_missing_operations_and_few_samples():
+    before = run(get=[0.1] * 10, delete=[0.1] * 10, put=[0.1] * 3)
+    after = run(get=[0.1] * 10, report=[0.3] * 10, put=[1.0] * 3)
+    results = results_by_key(compare_to_baseline(before, after))
+    assert sorted(results) == ["delete", "get", "put", "report"]
+
+    # request types of only one run are listed without a verdict
+    assert results["delete"]["current_p50"] is None
+    assert results["report"]["baseline_p50"] is None
+    for key in ("delete", "report"):
+        assert results[key]["change"] is None
+        assert results[key]["p_value"] is None
+        assert not results[key]["regressed"]
+
+    # too few samples: the change is shown, but not tested
+    assert results["put"]["change"] > 1
+    assert results["put"]["p_value"] is None
+    assert not results["put"]["regressed"]
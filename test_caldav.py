@@ -1,17 +1,22 @@
-import caldav
 import pytest
 
 from config import config
 from dav_functions.caldav import *
+from dav_functions.caldav_bulk import event_filename, event_uid, import_events, iter_ics_events, verify_events
+from dav_functions.caldav_discovery import CalendarDiscoveryCache
+from dav_functions.caldav_sync import CalDAVSyncClient
+from dav_functions.namespace import namespaced_name, namespaced_uids
+from dav_functions.readiness import collection_tag, wait_for_collection_change
 
 # defining constants
 
-# Example test event summary (name)
-test_event_summary = "Meeting with Bob (Test Event)"
+# Example test event summary (name), unique per run and worker, so runs can be distributed (pytest -n)
+test_event_summary = namespaced_name("Meeting with Bob (Test Event)")
 test_event_start = datetime(2023, 11, 15, 14, 0, 0)
 test_event_end = datetime(2023, 11, 15, 15, 0, 0)
 test_event_description = "Discuss project updates"
 test_event_description_new = "Updated description"
+test_bulk_events_file = "test_data/test-events.ics"
 
 # we need to give a range when we search for it
 search_range_start = datetime(2023, 11, 10)
@@ -28,14 +33,9 @@ def get_current_state_of_test_event(caldav_calendar):
 
 
 @pytest.fixture(scope="module")
-def caldav_principal():
+def caldav_principal(caldav_client):
     # Connect to the CalDAV server
-    client = caldav.DAVClient(
-        url=config.caldav_url,
-        username=config.username,
-        password=config.password
-    )
-    principal = client.principal()
+    principal = caldav_client.principal()
     
     yield principal
 
@@ -53,10 +53,56 @@ def caldav_calendar(caldav_principal):
     yield calendar
 
 
-def test_caldav_create_and_read(caldav_calendar):
+@pytest.fixture(scope="module")
+def calendar_store(caldav_calendar, dav_session):
+    # keeps a local copy of the calendar, updated incrementally with the sync-token
+    yield CalDAVSyncClient(
+        str(caldav_calendar.url),
+        config.username,
+        config.password,
+        session=dav_session)
+
+
+def test_caldav_discovery_cache(caldav_client, caldav_calendar, tmp_path):
+    cache_path = str(tmp_path / "discovery.json")
+    cache = CalendarDiscoveryCache(cache_path)
+    calendar = get_calendar_by_name(cache.principal(caldav_client), config.calendar_name, cache)
+    assert calendar is not None, "Calendar not found with discovery cache"
+    assert str(calendar.url) == str(caldav_calendar.url)
+
+    # a second run finds the calendar in the stored cache
+    cache = CalendarDiscoveryCache(cache_path)
+    assert config.calendar_name in cache.entries[str(cache.principal(caldav_client).url)]["calendars"]
+    calendar = get_calendar_by_name(cache.principal(caldav_client), config.calendar_name, cache)
+    assert str(calendar.url) == str(caldav_calendar.url)
+    assert not cache.changed(calendar)
+
+
+def test_caldav_discovery_cache_changed(caldav_client, caldav_calendar):
+    # the cached CTag and sync-token tell whether the events changed
+    cache = CalendarDiscoveryCache()
+    calendar = get_calendar_by_name(cache.principal(caldav_client), config.calendar_name, cache)
+    assert not cache.changed(calendar)
+
+    summary = namespaced_name("Discovery cache test event")
+    create_caldav_event(caldav_calendar, create_event_data(summary, test_event_start, test_event_end))
+    try:
+        assert cache.changed(calendar)
+        # the new tags are stored, so the same change is reported only once
+        assert not cache.changed(calendar)
+    finally:
+        event = get_calendar_event_by_name_range(caldav_calendar, summary, search_range_start, search_range_end)
+        if event is not None:
+            event.delete()
+    assert cache.changed(calendar)
+
+
+def test_caldav_create_and_read(caldav_calendar, dav_session):
     # Check that the event does not already exist
     retrieved_event = get_current_state_of_test_event(caldav_calendar)
     assert retrieved_event is None, "Calendar is not clean prior to first test."
+    calendar_url = str(caldav_calendar.url)
+    previous_tag = collection_tag(calendar_url, config.username, config.password, session=dav_session)
     
     # Create an event
     event_data = create_event_data(
@@ -66,12 +112,46 @@ def test_caldav_create_and_read(caldav_calendar):
         test_event_description
     )
     create_caldav_event(caldav_calendar, event_data)
-    
+
+    # wait until the calendar reports the change, the delay is recorded in the latency report
+    assert wait_for_collection_change(
+        calendar_url,
+        config.username,
+        config.password,
+        previous_tag,
+        name="caldav_create",
+        session=dav_session), "Calendar did not change after creation"
+
     # Read events to verify creation
     retrieved_event = get_current_state_of_test_event(caldav_calendar)
     assert retrieved_event is not None, "Event was not created successfully."
 
 
+def test_caldav_sync_after_create(caldav_calendar, calendar_store):
+    # the first sync fetches the whole calendar, later ones only what changed
+    retrieved_event = get_calendar_event_by_name(caldav_calendar, test_event_summary, calendar_store)
+    assert retrieved_event is not None, "Created event not found in the synced calendar"
+    href = calendar_store.find(summary=test_event_summary)[0]["href"]
+    assert calendar_store.find(uid=str(retrieved_event.icalendar_component['UID']))[0]["href"] == href
+
+    # our event didn't change since the last sync (other workers' events may have)
+    result = calendar_store.sync()
+    assert not result["full"]
+    assert href not in result["changed"] + result["deleted"]
+
+
+def test_caldav_get_by_href(caldav_calendar):
+    # one calendar-multiget for the created event and one that does not exist
+    created = get_current_state_of_test_event(caldav_calendar)
+    assert created is not None, "Event does not exist."
+    missing_href = str(created.url).rsplit("/", 1)[0] + "/does-not-exist.ics"
+    events = get_calendar_events_by_href(caldav_calendar, [created.url, missing_href])
+    assert events is not None, "Multiget failed."
+    assert [str(event.url) for event in events] == [str(created.url)]
+    assert events[0].icalendar_component["SUMMARY"] == test_event_summary
+    assert caldav_event_etag(events[0]), "Event was fetched without ETag."
+
+
 def test_caldav_update(caldav_calendar):
     # Get event
     retrieved_event = get_current_state_of_test_event(caldav_calendar)
@@ -80,14 +160,23 @@ def test_caldav_update(caldav_calendar):
     vevent = ical_event.walk('VEVENT')[0]
     assert vevent['DESCRIPTION'] == test_event_description
     
-    # Update the description
+    # Update the description, only if nobody changed the event in between
     vevent['DESCRIPTION'] = test_event_description_new
-    
-    retrieved_event.data = ical_event.to_ical()
-    retrieved_event.save()
-    
-    # Get event
-    retrieved_event = get_current_state_of_test_event(caldav_calendar)
+    etag = caldav_event_etag(retrieved_event)
+    assert etag, "Event was fetched without ETag."
+    assert update_caldav_event_by_href(
+        caldav_calendar,
+        retrieved_event.url,
+        ical_event.to_ical(),
+        etag
+    ), "Event update failed."
+
+    # The old ETag does not match anymore
+    assert not update_caldav_event_by_href(caldav_calendar, retrieved_event.url, ical_event.to_ical(), etag)
+
+    # Get event by its UID
+    retrieved_event = get_calendar_event_by_uid(caldav_calendar, str(vevent['UID']))
+    assert retrieved_event is not None, "Event not found by UID."
     ical_event = retrieved_event.icalendar_instance
     vevent = ical_event.walk('VEVENT')[0]
     assert vevent['DESCRIPTION'] == test_event_description_new
@@ -102,11 +191,64 @@ def test_caldav_delete(caldav_calendar):
     # Delete the test_event
     assert delete_caldav_event(
         caldav_calendar,
-        retrieved_event_uid,
-        search_range_start,
-        search_range_end
+        retrieved_event_uid
     ), "Event deletion failed."
     
     # Getting the event should fail now
     retrieved_event = get_current_state_of_test_event(caldav_calendar)
     assert retrieved_event is None
+    assert get_calendar_event_by_uid(caldav_calendar, retrieved_event_uid) is None
+
+
+def test_caldav_sync_after_delete(caldav_calendar, calendar_store):
+    href = calendar_store.find(summary=test_event_summary)[0]["href"]
+    result = calendar_store.sync()
+
+    assert href in result["deleted"], "Deletion not reported by sync-collection"
+    assert get_calendar_event_by_name(caldav_calendar, test_event_summary, calendar_store) is None
+
+
+def namespaced_bulk_events():
+    # the events of the test file with UIDs unique per run and worker
+    return (namespaced_uids(event) for event in iter_ics_events(test_bulk_events_file))
+
+
+def test_caldav_bulk_import_verify(caldav_calendar, dav_session):
+    calendar_url = str(caldav_calendar.url)
+    uids = [event_uid(event) for event in namespaced_bulk_events()]
+
+    result = import_events(
+        calendar_url,
+        config.username,
+        config.password,
+        namespaced_bulk_events(),
+        workers=2,
+        progress=None,
+        session=dav_session)
+    assert result["failed"] == 0
+    assert result["done"] == len(uids), "Calendar is not clean prior to the bulk import."
+
+    # importing again doesn't overwrite anything
+    result = import_events(
+        calendar_url,
+        config.username,
+        config.password,
+        namespaced_bulk_events(),
+        progress=None,
+        session=dav_session)
+    assert result["existing"] == len(uids)
+
+    # all events can be fetched again
+    result = verify_events(
+        calendar_url,
+        config.username,
+        config.password,
+        namespaced_bulk_events(),
+        batch_size=2,
+        progress=None,
+        session=dav_session)
+    assert result["done"] == len(uids)
+    assert result["missing"] == 0 and result["failed"] == 0
+
+    for uid in uids:
+        assert delete_caldav_event_by_href(caldav_calendar, event_filename(uid)), "Failed to delete imported event"
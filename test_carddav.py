@@ -2,46 +2,100 @@ import pytest
 
 from config import config
 from dav_functions.carddav import *
+from dav_functions.carddav_bulk import card_filename, card_uid, export_address_book, import_cards, iter_vcards
+from dav_functions.carddav_sync import CardDAVSyncClient
+from dav_functions.namespace import namespaced_name, namespaced_uids, run_namespace
+from dav_functions.readiness import collection_tag, wait_for_collection_change
 
 
-# constants
-test_contact_name = "John Doe"
+# constants, the contacts are unique per run and worker, so runs can be distributed (pytest -n)
+test_contact_name = namespaced_name("John Doe")
 test_contact_name_that_does_not_exist = "ASDFASDFSADFASDFASDFASDFASDFASDF"
-test_contact_email = "johndoe@example.com"
+test_contact_email = f"johndoe-{run_namespace()}@example.com"
 test_contact_updated_note = "Updated vcard with .new email."
-test_contact_updated_email = "johndoe@example.net"
+test_contact_updated_email = f"johndoe-{run_namespace()}@example.net"
+test_bulk_contacts_file = "test_data/test-contacts.vcf"
 contact_info = {
     "fullname": test_contact_name,
     "email": test_contact_email
 }
 
 
-def get_test_contact():
+def get_test_contact(session=None):
     return fetch_carddav_contact(
         config.carddav_url,
         config.username,
         config.password,
-        test_contact_name)
+        test_contact_name,
+        session=session)
 
 
-def test_carddav_create_and_read():
+@pytest.fixture(scope="module")
+def address_book_sync(dav_session):
+    # keeps a local copy of the address book, updated incrementally with the sync-token
+    yield CardDAVSyncClient(
+        config.carddav_url,
+        config.username,
+        config.password,
+        session=dav_session)
+
+
+def test_carddav_sync_initial(address_book_sync):
+    # the first sync fetches the whole address book
+    result = address_book_sync.sync()
+    assert result["full"]
+    assert address_book_sync.sync_token
+    assert address_book_sync.find(fn=test_contact_name) == [], "Address book is not clean prior to first test."
+
+
+def test_carddav_create_and_read(dav_session):
+    previous_tag = collection_tag(config.carddav_url, config.username, config.password, session=dav_session)
+
     # Create a contact
     assert create_carddav_contact(
         config.carddav_url,
         config.username,
         config.password,
-        contact_info), "Failed to create contact"
-    
+        contact_info,
+        session=dav_session), "Failed to create contact"
+
+    # wait until the address book reports the change, the delay is recorded in the latency report
+    assert wait_for_collection_change(
+        config.carddav_url,
+        config.username,
+        config.password,
+        previous_tag,
+        name="carddav_create",
+        session=dav_session), "Address book did not change after creation"
+
     # Confirm contact can now be found
-    retrieved_contact = get_test_contact()
+    retrieved_contact = get_test_contact(dav_session)
     
     assert retrieved_contact is not None, "Contact not found after creation"
     assert retrieved_contact != ""
 
 
-def test_carddav_read():
+def test_carddav_sync_after_create(address_book_sync):
+    previous_token = address_book_sync.sync_token
+    result = address_book_sync.sync()
+    assert not result["full"]
+    assert address_book_sync.sync_token != previous_token
+
+    # the new contact is reported as changed (other workers' contacts may be as well)
+    cached = address_book_sync.find(fn=test_contact_name)
+    assert len(cached) == 1, "Created contact not found with sync-collection"
+    href = cached[0]["href"]
+    assert href in result["changed"]
+    assert href not in result["deleted"]
+
+    # our contact didn't change since the last sync
+    result = address_book_sync.sync()
+    assert href not in result["changed"] + result["deleted"]
+
+
+def test_carddav_read(dav_session):
     # Fetch contact
-    retrieved_contact = get_test_contact()
+    retrieved_contact = get_test_contact(dav_session)
     
     assert retrieved_contact is not None, "Contact not found after creation"
     assert retrieved_contact != ""
@@ -55,13 +109,64 @@ def test_carddav_read():
             config.carddav_url,
             config.username,
             config.password,
-            test_contact_name_that_does_not_exist)
+            test_contact_name_that_does_not_exist,
+            session=dav_session)
     assert excinfo.value.args[0] == "Contact not found"
+
+
+def test_carddav_find_by_email(dav_session):
+    # the server filters by email, only the matching card is transferred
+    contacts = find_carddav_contacts(
+        config.carddav_url,
+        config.username,
+        config.password,
+        email=test_contact_email,
+        session=dav_session)
+    assert contacts is not None, "Error fetching contacts"
+    assert [contact["fn"] for contact in contacts] == [test_contact_name]
+
+    # partial matches only with the matching match type
+    assert find_carddav_contacts(
+        config.carddav_url,
+        config.username,
+        config.password,
+        fn=test_contact_name[:4],
+        session=dav_session) == []
+    contacts = find_carddav_contacts(
+        config.carddav_url,
+        config.username,
+        config.password,
+        fn=test_contact_name[:4],
+        match_type="starts-with",
+        session=dav_session)
+    assert test_contact_name in [contact["fn"] for contact in contacts]
+
+
+def test_carddav_find_with_properties(dav_session):
+    # only some properties are requested, the filtered EMAIL is added so the exact match still works
+    assert '<card:prop name="EMAIL" />' in addressbook_query_body({"EMAIL": test_contact_email}, properties=["FN"])
+    contacts = find_carddav_contacts(
+        config.carddav_url,
+        config.username,
+        config.password,
+        email=test_contact_email,
+        properties=["FN"],
+        session=dav_session)
+    assert [contact["fn"] for contact in contacts] == [test_contact_name]
+
+
+def test_carddav_lazy_contact(dav_session):
+    # properties are scanned from the card text, they match what the full parse returns
+    contact = get_test_contact(dav_session)
+    assert contact.values("EMAIL") == [test_contact_email]
+    assert contact.value("NOTE") is None
+    assert dict(contact)["fn"] == test_contact_name
+    assert contact["vcard"].fn.value == contact.fn
     
 
-def test_carddav_update():
+def test_carddav_update(dav_session):
     # Fetch contact
-    to_be_updated = get_test_contact()
+    to_be_updated = get_test_contact(dav_session)
     assert to_be_updated is not None, "Contact not found"
     assert to_be_updated != ""
     
@@ -77,13 +182,25 @@ def test_carddav_update():
         config.username,
         config.password,
         vcard,
-        to_be_updated['href']
+        to_be_updated['href'],
+        session=dav_session
     )
 
 
-def test_carddav_delete():
+def test_carddav_sync_after_update(address_book_sync, dav_session):
+    previous_etag = address_book_sync.find(fn=test_contact_name)[0]["etag"]
+    result = address_book_sync.sync()
+
+    cached = address_book_sync.find(fn=test_contact_name)
+    assert cached[0]["href"] in result["changed"], "Update not reported by sync-collection"
+    assert cached[0]["etag"] != previous_etag
+    assert cached[0]["etag"] == get_test_contact(dav_session)["etag"]
+    assert cached[0]["vcard"].note.value == test_contact_updated_note
+
+
+def test_carddav_delete(dav_session):
     # Fetch contact
-    to_be_deleted = get_test_contact()
+    to_be_deleted = get_test_contact(dav_session)
     
     assert to_be_deleted is not None, "Contact not found"
     assert to_be_deleted != ""
@@ -93,9 +210,87 @@ def test_carddav_delete():
         config.carddav_url,
         config.username,
         config.password,
-        to_be_deleted['href']), "Failed to delete contact"
+        to_be_deleted['href'],
+        session=dav_session), "Failed to delete contact"
 
     # Confirm the contact is not there anymore
     with pytest.raises(Exception) as excinfo:
-        get_test_contact()
+        get_test_contact(dav_session)
     assert excinfo.value.args[0] == "Contact not found"
+
+
+def test_carddav_sync_after_delete(address_book_sync):
+    href = address_book_sync.find(fn=test_contact_name)[0]["href"]
+    result = address_book_sync.sync()
+
+    assert href in result["deleted"], "Deletion not reported by sync-collection"
+    assert address_book_sync.find(fn=test_contact_name) == []
+
+
+def test_carddav_bulk_import_adds_uid(dav_session):
+    # a card without UID, with LF line endings and a lower case end line gets a UID matching its file name
+    name = namespaced_name("Bulk import without UID")
+    card = f"BEGIN:VCARD\nVERSION:3.0\nFN:{name}\nN:;{name};;;\nend:vcard\n"
+    assert card_uid(card) is None
+    result = import_cards(config.carddav_url, config.username, config.password, [card], progress=None,
+                          session=dav_session)
+    assert result["done"] == 1
+
+    contact = fetch_carddav_contact(config.carddav_url, config.username, config.password, name, session=dav_session)
+    assert contact is not None, "Imported card not found"
+    uid = contact.value("UID")
+    assert uid and contact["href"].endswith("/" + card_filename(uid))
+    assert delete_carddav_contact(config.carddav_url, config.username, config.password, contact["href"],
+                                  session=dav_session)
+
+
+def namespaced_bulk_contacts():
+    # the cards of the test file with UIDs unique per run and worker
+    return (namespaced_uids(card) for card in iter_vcards(test_bulk_contacts_file))
+
+
+def test_carddav_bulk_import_export(dav_session, tmp_path):
+    uids = [card_uid(card) for card in namespaced_bulk_contacts()]
+
+    result = import_cards(
+        config.carddav_url,
+        config.username,
+        config.password,
+        namespaced_bulk_contacts(),
+        workers=2,
+        progress=None,
+        session=dav_session)
+    assert result["failed"] == 0
+    assert result["done"] == len(uids), "Address book is not clean prior to the bulk import."
+
+    # importing again doesn't overwrite anything
+    result = import_cards(
+        config.carddav_url,
+        config.username,
+        config.password,
+        namespaced_bulk_contacts(),
+        progress=None,
+        session=dav_session)
+    assert result["existing"] == len(uids)
+
+    # the export contains the imported cards
+    export_path = tmp_path / "export.vcf"
+    result = export_address_book(
+        config.carddav_url,
+        config.username,
+        config.password,
+        str(export_path),
+        batch_size=2,
+        progress=None,
+        session=dav_session)
+    assert result["failed"] == 0
+    exported_uids = [card_uid(card) for card in iter_vcards(str(export_path))]
+    assert set(uids) <= set(exported_uids)
+
+    for uid in uids:
+        assert delete_carddav_contact(
+            config.carddav_url,
+            config.username,
+            config.password,
+            card_filename(uid),
+            session=dav_session), "Failed to delete imported contact"
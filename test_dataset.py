@@ -0,0 +1,70 @@
+"""
+Tests the synthetic dataset generator. These tests don't need a Nextcloud instance or a config.
+"""
+import hashlib
+import itertools
+
+import icalendar
+import vobject
+
+from dav_functions.caldav_bulk import iter_ics_events
+from dav_functions.carddav_bulk import iter_vcards
+from dav_functions.dataset import FileContentReader, iter_contacts, iter_events, iter_file_content, iter_files, \
+    write_dataset
+
+
+def test_dataset_is_deterministic():
+    assert list(iter_contacts(seed=1, count=20)) == list(iter_contacts(seed=1, count=20))
+    assert list(iter_events(seed=1, count=20)) == list(iter_events(seed=1, count=20))
+    assert list(iter_files(seed=1, count=20)) == list(iter_files(seed=1, count=20))
+    assert list(iter_contacts(seed=1, count=20)) != list(iter_contacts(seed=2, count=20))
+
+    # an item does not depend on how many items are generated
+    assert list(iter_events(seed=1, count=5)) == list(iter_events(seed=1, count=20))[:5]
+
+
+def test_dataset_is_generated_lazily():
+    # taking the first items of a huge dataset is immediate
+    contacts = list(itertools.islice(iter_contacts(seed=1, count=10 ** 9), 3))
+    assert len(contacts) == 3
+
+
+def test_dataset_contacts_and_events_parse():
+    for card in iter_contacts(seed=1, count=200, photo_ratio=0.5):
+        vcard = vobject.readOne(card)
+        assert vcard.uid.value and vcard.fn.value and vcard.email.value
+
+    events = list(iter_events(seed=1, count=500, recurring_ratio=0.5, exception_ratio=0.5))
+    for event in events:
+        assert icalendar.Calendar.from_ical(event).walk("VEVENT")
+    assert any("RECURRENCE-ID" in event for event in events)
+    assert any("TZID=" in event for event in events)
+    assert any("VALUE=DATE" in event for event in events)
+
+
+def test_dataset_file_content():
+    files = list(iter_files(seed=1, count=100))
+    sizes = sorted(file.size for file in files)
+    assert sizes[0] < sizes[50] < sizes[-1], "File sizes are not spread"
+
+    file = files[0]
+    content = b"".join(iter_file_content(file, chunk_size=1000))
+    assert len(content) == file.size
+    assert content == b"".join(iter_file_content(file))
+
+    # the reader gives the same content in small reads and can be rewound
+    reader = FileContentReader(file, chunk_size=1000)
+    assert len(reader) == file.size
+    assert b"".join(iter(lambda: reader.read(333), b"")) == content
+    reader.seek(0)
+    assert hashlib.sha256(reader.read()).digest() == hashlib.sha256(content).digest()
+
+
+def test_dataset_write(tmp_path):
+    result = write_dataset(str(tmp_path), seed=1, files=10, contacts=10, events=10)
+    assert result["bytes"] > 0
+    assert len([path for path in (tmp_path / "files").rglob("*") if path.is_file()]) == 10
+
+    # the written files can be read by the bulk importers
+    assert len(list(iter_vcards(str(tmp_path / "contacts.vcf")))) == 10
+    assert len(list(iter_ics_events(str(tmp_path / "events.ics")))) == 10
@@ -0,0 +1,65 @@
+"""
+Tests the property scanner of the lazy records. These tests don't need a Nextcloud instance or a config.
+"""
+from dav_functions.lazy_record import LazyContact, LazyRecord, iter_properties, property_values, unescape
+
+EVENT = (
+    "BEGIN:VCALENDAR\r\n"
+    "BEGIN:VEVENT\r\n"
+    "UID:event-1\r\n"
+    'SUMMARY;LANGUAGE="en:US":Meeting\\, room 2\r\n'
+    "DESCRIPTION:A long descrip\r\n"
+    " tion\\nsecond line\r\n"
+    "LOCATION:C:\\\\new\r\n"
+    "END:VEVENT\r\n"
+    "END:VCALENDAR\r\n"
+)
+
+CARD = (
+    "BEGIN:VCARD\n"
+    "VERSION:3.0\n"
+    "FN:Jane Doe\n"
+    "item1.EMAIL;TYPE=work:jane@example.com\n"
+    "email;TYPE=home:jane@example.org\n"
+    "END:VCARD\n"
+)
+
+
+def test_lazy_record_unescape():
+    assert unescape("a\\, b\\; c\\nd\\Ne") == "a, b; c\nd\ne"
+    # an escaped backslash is decoded once, the following n is no newline
+    assert unescape("C:\\\\new") == "C:\\new"
+    assert unescape("\\\\\\n") == "\\\n"
+    # unknown escapes are kept
+    assert unescape("a\\tb") == "a\\tb"
+
+
+def test_lazy_record_scanner():
+    properties = dict(iter_properties(EVENT))
+    # the colon in the quoted parameter does not end the name
+    assert properties["SUMMARY"] == "Meeting\\, room 2"
+    assert properties["DESCRIPTION"] == "A long description\\nsecond line"
+    assert property_values(EVENT, "summary") == ["Meeting, room 2"]
+    assert property_values(EVENT, "LOCATION") == ["C:\\new"]
+    assert property_values(EVENT, "ATTENDEE") == []
+
+    # groups, parameters and the case of the name are ignored
+    assert property_values(CARD, "EMAIL") == ["jane@example.com", "jane@example.org"]
+
+
+def test_lazy_record_values():
+    record = LazyRecord("/calendars/event-1.ics", '"1"', EVENT)
+    assert record.values("SUMMARY") == property_values(EVENT, "SUMMARY")
+    assert record.value("DESCRIPTION") == "A long description\nsecond line"
+    assert record.value("ATTENDEE", "nobody") == "nobody"
+    assert record.parsed().vevent.location.value == record.value("LOCATION")
+
+
+def test_lazy_contact_mapping():
+    contact = LazyContact("/addressbooks/jane.vcf", '"2"', CARD)
+    assert "fn" in contact and "email" not in contact
+    assert list(contact) == ["fn", "href", "etag", "vcard"]
+    assert len(contact) == 4
+    assert contact.get("fn") == contact["fn"] == "Jane Doe"
+    assert contact.get("email", "none") == "none"
+    assert dict(contact)["href"] == "/addressbooks/jane.vcf"
@@ -0,0 +1,39 @@
+"""
+Tests the rate limiting and the recording of the load mode. These tests don't need a Nextcloud instance or a config.
+"""
+import time
+
+from dav_functions.load import RateLimiter, Recorder
+
+
+def test_load_rate_limiter():
+    limiter = RateLimiter(10)
+    delays = [limiter.reserve() for _ in range(5)]
+    # the slots are 0.1s apart, the first one is now
+    assert delays[0] == 0
+    for previous, delay in zip(delays, delays[1:]):
+        assert abs(delay - previous - 0.1) < 0.01
+
+    assert RateLimiter(None).reserve() == 0
+
+
+def test_load_recorder():
+    recorder = Recorder()
+
+    def fail():
+        raise ValueError("failed")
+
+    assert recorder.measure("ok", lambda: "result") == "result"
+    assert recorder.measure("ok", lambda: time.sleep(0.01) or True) is True
+    # None, False and exceptions count as errors
+    assert recorder.measure("error", lambda: None) is None
+    assert recorder.measure("error", lambda: False) is False
+    assert recorder.measure("error", fail) is None
+
+    report = recorder.report(duration=2)
+    assert report["ok"]["count"] == 2
+    assert report["ok"]["errors"] == 0
+    assert report["ok"]["throughput"] == 1
+    assert report["ok"]["max"] >= 0.01
+    assert report["error"]["count"] == 3
+    assert report["error"]["errors"] == 3
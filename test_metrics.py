@@ -0,0 +1,25 @@
+"""
+Tests the connection timings of the request metrics. These tests don't need a Nextcloud instance or a config.
+"""
+import socket
+
+from dav_functions.metrics import TimedHTTPConnection
+
+
+def test_metrics_connection_tries_all_addresses():
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        port = server.getsockname()[1]
+
+        # nothing listens on the first address, the connection falls back to the next one like urllib3 does
+        connection = TimedHTTPConnection("localhost", port, timeout=2)
+        sock = connection._connect_any(["127.0.0.2", "127.0.0.1"])
+        assert sock.getpeername() == ("127.0.0.1", port)
+        sock.close()
+
+        connection = TimedHTTPConnection("localhost", port, timeout=2)
+        connection.connect()
+        assert connection._dns_host == "localhost"
+        assert all(timing >= 0 for timing in connection._connect_timings)
+        connection.close()
@@ -0,0 +1,51 @@
+"""
+Tests the histograms and the Prometheus export of the monitoring mode. These tests don't need a Nextcloud instance or
+a config, no scenario is run.
+"""
+from types import SimpleNamespace
+
+from dav_functions.monitor import Monitor, RollingHistogram
+
+CONFIG = SimpleNamespace(username="monitor", password="secret")
+
+
+def test_monitor_rolling_histogram():
+    histogram = RollingHistogram(window=3)
+    for seconds in (0.001, 0.005, 0.007, 0.2, 20):
+        histogram.add(seconds, failed=seconds > 10)
+    # each latency is counted in the first bucket it fits in (5ms, 10ms, ... 10s), the last one in none
+    assert histogram.buckets[:2] == [2, 1]
+    assert histogram.buckets[5] == 1  # 250ms
+    assert sum(histogram.buckets) == 4
+    assert histogram.count == 5
+    assert histogram.errors == 1
+    assert abs(histogram.sum - 20.213) < 1e-9
+    # only the last window latencies are kept
+    assert list(histogram.recent) == [0.007, 0.2, 20]
+
+
+def test_monitor_prometheus_text():
+    monitor = Monitor(CONFIG, scenarios=[])
+    monitor.recorder.record("webdav_read", 0.004, False)
+    monitor.recorder.record("webdav_read", 0.02, True)
+    monitor.run_once()
+    lines = monitor.prometheus_text().splitlines()
+
+    # the buckets are cumulative and end with +Inf
+    assert 'dav_monitor_operation_duration_seconds_bucket{operation="webdav_read",le="0.005"} 1' in lines
+    assert 'dav_monitor_operation_duration_seconds_bucket{operation="webdav_read",le="0.01"} 1' in lines
+    assert 'dav_monitor_operation_duration_seconds_bucket{operation="webdav_read",le="0.025"} 2' in lines
+    assert 'dav_monitor_operation_duration_seconds_bucket{operation="webdav_read",le="10"} 2' in lines
+    assert 'dav_monitor_operation_duration_seconds_bucket{operation="webdav_read",le="+Inf"} 2' in lines
+    assert 'dav_monitor_operation_duration_seconds_sum{operation="webdav_read"} 0.024000' in lines
+    assert 'dav_monitor_operation_duration_seconds_count{operation="webdav_read"} 2' in lines
+    assert 'dav_monitor_operation_errors_total{operation="webdav_read"} 1' in lines
+    assert any(line.startswith('dav_monitor_operation_recent_duration_seconds{operation="webdav_read",quantile="0.5"}')
+               for line in lines)
+    assert any(line.startswith("dav_monitor_last_run_timestamp_seconds ") for line in lines)
+    # every sample line belongs to a declared metric
+    declared = {line.split()[2] for line in lines if line.startswith("# TYPE")}
+    for line in lines:
+        if not line.startswith("#"):
+            name = line.split("{")[0].split()[0]
+            assert name in declared or name.rsplit("_", 1)[0] in declared
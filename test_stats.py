@@ -0,0 +1,48 @@
+"""
+Tests the statistics of the latency reports. These tests don't need a Nextcloud instance or a config.
+"""
+import math
+
+from dav_functions.stats import mann_whitney_u, percentile, summarize
+
+
+def test_stats_percentile():
+    values = [1.0, 2.0, 3.0, 4.0]
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 100) == 4.0
+    # rank (4 - 1) * 0.5 = 1.5: halfway between 2 and 3
+    assert percentile(values, 50) == 2.5
+    # rank 2.7: 3 + 0.7 * (4 - 3)
+    assert abs(percentile(values, 90) - 3.7) < 1e-9
+    assert percentile([5.0], 99) == 5.0
+    assert percentile([], 50) is None
+
+
+def test_stats_summarize():
+    summary = summarize([0.3, 0.1, 0.2])
+    assert summary["count"] == 3
+    assert (summary["min"], summary["p50"], summary["max"]) == (0.1, 0.2, 0.3)
+    assert abs(summary["mean"] - 0.2) < 1e-9
+
+    empty = summarize([])
+    assert empty["count"] == 0
+    assert all(value is None for key, value in empty.items() if key != "count")
+
+
+def test_stats_mann_whitney_u():
+    baseline = [1, 2, 3, 4, 5, 6, 7, 8]
+    current = [9, 10, 11, 12, 13, 14, 15, 16]
+    # U = 64, mean 32, variance 64 / 12 * 17, z = 31.5 / sqrt(90.67) = 3.308
+    assert math.isclose(mann_whitney_u(baseline, current), 0.00046955, rel_tol=1e-4)
+    # one-sided: faster current values are never significant
+    assert math.isclose(mann_whitney_u(current, baseline), 0.99968, rel_tol=1e-4)
+
+
+def test_stats_mann_whitney_u_ties():
+    baseline = [1, 2, 2, 3, 3, 3, 4, 5]
+    current = [2, 3, 3, 4, 4, 5, 5, 6]
+    # average ranks: rank sum of current 83, U = 47, tie correction 192, variance 64 / 12 * (17 - 192 / 240) = 86.4
+    assert math.isclose(mann_whitney_u(baseline, current), 0.059386, rel_tol=1e-4)
+    # all values tied: no variance, nothing is significant
+    assert mann_whitney_u([1.0] * 8, [1.0] * 8) == 1.0
+    assert mann_whitney_u([], [1.0]) == 1.0
@@ -1,20 +1,46 @@
-import time
+import hashlib
+import os
 
 from config import config
+from dav_functions.dataset import iter_files, upload_files
+from dav_functions.namespace import namespaced_filename
+from dav_functions.readiness import wait_for_webdav_absence, wait_for_webdav_file
 from dav_functions.webdav import *
+from dav_functions.webdav_bulk import delete_directory, download_directory, upload_directory
+from dav_functions.webdav_cache import WebDAVCache
+from dav_functions.webdav_manifest import snapshot, verify
+from dav_functions.webdav_tree import WebDAVTreeWalker, walk_webdav_tree
 
+# the uploaded file is unique per run and worker, so runs can be distributed (pytest -n)
+remote_testfile_name = namespaced_filename(config.testfile_name)
 
-def test_webdav_get_static_file():
+
+def test_webdav_get_static_file(dav_session):
     """Tests if a static file (that exists already) is present and can be read."""
     content = get_webdav_file_content(
         config.webdav_url + "/" + config.textfile_name,
         config.username,
-        config.password)
+        config.password,
+        session=dav_session)
     assert content is not None
     assert str(content).__contains__(config.textfile_contains)
 
 
-def test_webdav_write_test_file():
+def test_webdav_stream_static_file(dav_session):
+    """Tests if the static file can be read as a stream and verified chunk by chunk."""
+    result = verify_webdav_file_stream(
+        config.webdav_url + "/" + config.textfile_name,
+        config.username,
+        config.password,
+        expected_content=config.textfile_contains,
+        chunk_size=8,  # tiny chunks, so the expected content is split across chunks
+        session=dav_session)
+    assert result is not None
+    assert result["contains"]
+    assert result["size"] > 0
+
+
+def test_webdav_write_test_file(dav_session):
     """Uploads a file via webdav"""
     # Write
     assert upload_file_to_webdav(
@@ -22,34 +48,197 @@ def test_webdav_write_test_file():
         config.username,
         config.password,
         "test_data/" + config.testfile_name,
-        config.testfile_name)
-    
-    time.sleep(1)  # wait 1 second so Nextcloud can process the upload
+        remote_testfile_name,
+        session=dav_session)
+
+    # wait until Nextcloud has processed the upload, the delay is recorded in the latency report
+    assert wait_for_webdav_file(
+        config.webdav_url + "/" + remote_testfile_name,
+        config.username,
+        config.password,
+        name="webdav_upload",
+        session=dav_session)
     
     
-def test_webdav_read_test_file():
+def test_webdav_upload_mapped_file(dav_session, tmp_path):
+    """Uploads files from a memory map with an OC-Checksum header and reads them back"""
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    for local_path in ("test_data/" + config.testfile_name, str(empty)):
+        remote_name = namespaced_filename("mapped-" + os.path.basename(local_path))
+        assert upload_file_to_webdav_mapped(
+            config.webdav_url,
+            config.username,
+            config.password,
+            local_path,
+            remote_name,
+            checksum_algorithm="sha1",
+            session=dav_session)
+        content = get_webdav_file_content(
+            config.webdav_url + "/" + remote_name, config.username, config.password, session=dav_session)
+        with open(local_path, "rb") as file:
+            assert content == file.read()
+        assert delete_webdav_file(
+            config.webdav_url + "/" + remote_name, config.username, config.password, session=dav_session)
+
+
+def test_webdav_read_test_file(dav_session):
     """Reads previously uploaded file via webdav"""
     # Read
     content = get_webdav_file_content(
-        config.webdav_url + "/" + config.testfile_name,
+        config.webdav_url + "/" + remote_testfile_name,
         config.username,
-        config.password)
+        config.password,
+        session=dav_session)
     assert content is not None
     assert str(content).__contains__(config.testfile_contains)
+
+    # the streamed content must be identical to the local file
+    with open("test_data/" + config.testfile_name, "rb") as file:
+        local_hash = hashlib.sha256(file.read()).hexdigest()
+    result = verify_webdav_file_stream(
+        config.webdav_url + "/" + remote_testfile_name,
+        config.username,
+        config.password,
+        session=dav_session)
+    assert result is not None
+    assert result["hash"] == local_hash
     
 
-def test_webdav_delete_test_file():
+def test_webdav_delete_test_file(dav_session):
     """Deletes previously uploaded file via webdav"""
     # Delete
     assert delete_webdav_file(
-        config.webdav_url + "/" + config.testfile_name,
+        config.webdav_url + "/" + remote_testfile_name,
         config.username,
-        config.password)
+        config.password,
+        session=dav_session)
+    assert wait_for_webdav_absence(
+        config.webdav_url + "/" + remote_testfile_name,
+        config.username,
+        config.password,
+        session=dav_session)
 
     content = get_webdav_file_content(
-        config.webdav_url + "/" + config.testfile_name,
+        config.webdav_url + "/" + remote_testfile_name,
         config.username,
-        config.password)
+        config.password,
+        session=dav_session)
     
     print(content)
 
+
+def test_webdav_cached_reads(dav_session, tmp_path):
+    """Repeated reads through the cache are answered with 304 Not Modified and served from disk"""
+    file_url = config.webdav_url + "/" + config.textfile_name
+    cache = WebDAVCache(str(tmp_path), max_bytes=1024 * 1024)
+    first = get_webdav_file_content(file_url, config.username, config.password, session=dav_session, cache=cache)
+    second = get_webdav_file_content(file_url, config.username, config.password, session=dav_session, cache=cache)
+    assert first is not None and second == first
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["hits"] == 1 and stats["bytes_saved"] == len(first)
+
+    # a new cache on the same directory starts with the saved index, one too small for the file evicts it
+    cache.save()
+    assert WebDAVCache(str(tmp_path)).stats()["entries"] == 1
+    small = WebDAVCache(str(tmp_path), max_bytes=len(first) - 1)
+    assert small.stats()["entries"] == 0 and small.stats()["evictions"] == 1
+
+
+def test_webdav_walk_tree(dav_session):
+    """Lists a generated directory tree with the concurrent tree walker"""
+    root_url = config.webdav_url + "/" + namespaced_filename("walk-test")
+    files = list(iter_files(seed=1, count=30, depth=3, fanout=3, median_size=100))
+    assert dav_session.request("MKCOL", root_url, auth=(config.username, config.password)).status_code == 201
+    try:
+        result = upload_files(root_url, config.username, config.password, files, progress=None, session=dav_session)
+        assert result["failed"] == 0
+
+        walker = WebDAVTreeWalker(root_url, config.username, config.password, workers=4, session=dav_session)
+        listed = {resource.path: resource.size for resource in walker if not resource.is_collection}
+        assert listed == {file.path: file.size for file in files}
+        report = walker.report()
+        assert report["failed"] == 0 and report["files"] == len(files)
+        assert report["latency"]["count"] == report["directories"]
+
+        # only the top level
+        top_level = {resource.path for resource in walk_webdav_tree(
+            root_url, config.username, config.password, max_depth=1, session=dav_session)}
+        assert top_level == {file.path.split("/")[0] for file in files}
+
+        # with at most one directory waiting, the listings are held back but the walk still completes
+        walker = WebDAVTreeWalker(
+            root_url, config.username, config.password, workers=2, session=dav_session, max_waiting=1)
+        assert {resource.path for resource in walker if not resource.is_collection} == set(listed)
+
+        # stopping early ends the running listings
+        walker = iter(WebDAVTreeWalker(root_url, config.username, config.password, workers=4, session=dav_session))
+        next(walker)
+        walker.close()
+    finally:
+        delete_webdav_file(root_url, config.username, config.password, session=dav_session)
+
+
+def test_webdav_manifest_verify(dav_session, tmp_path):
+    """Snapshots a generated tree, changes it and checks that verify reports exactly the changes"""
+    root_url = config.webdav_url + "/" + namespaced_filename("manifest-test")
+    credentials = (config.username, config.password)
+    manifest = str(tmp_path / "manifest.jsonl.gz")
+    files = list(iter_files(seed=2, count=12, depth=2, fanout=2, median_size=100))
+    assert dav_session.request("MKCOL", root_url, auth=credentials).status_code == 201
+    try:
+        assert upload_files(root_url, *credentials, files, progress=None, session=dav_session)["failed"] == 0
+        result = snapshot(root_url, *credentials, manifest, workers=4, progress=None, session=dav_session)
+        assert result["done"] == len(files) and result["failed"] == 0
+
+        altered, removed = files[0].path, files[1].path
+        assert dav_session.put(root_url + "/" + altered, data=b"changed", auth=credentials).ok
+        assert delete_webdav_file(root_url + "/" + removed, *credentials, session=dav_session)
+
+        result = verify(root_url, *credentials, manifest, workers=4, progress=None, session=dav_session)
+        assert result["problems"] == sorted([(altered, "altered"), (removed, "missing")])
+        assert result["unchanged"] == len(files) - 2 and result["added"] == 0
+
+        # a directory that can't be listed doesn't prove its files are gone
+        result = verify(root_url + "/not-listable", *credentials, manifest, workers=4, progress=None,
+                        session=dav_session)
+        assert result["unreadable"] == len(files) and result["missing"] == 0
+    finally:
+        delete_webdav_file(root_url, *credentials, session=dav_session)
+
+
+def test_webdav_directory_transfers(dav_session, tmp_path):
+    """Uploads a local tree, copies and moves it on the server, downloads it again and deletes it"""
+    local_dir = tmp_path / "source"
+    files = {"a.txt": b"first", "sub/b.txt": b"second", "sub/deeper/c.bin": bytes(range(256)) * 4}
+    for path, content in files.items():
+        (local_dir / path).parent.mkdir(parents=True, exist_ok=True)
+        (local_dir / path).write_bytes(content)
+    credentials = (config.username, config.password)
+    root_url = config.webdav_url + "/" + namespaced_filename("transfer-test")
+    copy_url = config.webdav_url + "/" + namespaced_filename("transfer-copy")
+    moved_url = config.webdav_url + "/" + namespaced_filename("transfer-moved")
+    try:
+        result = upload_directory(str(local_dir), root_url, *credentials, workers=4, progress=None, session=dav_session)
+        assert result["done"] == len(files) and result["failed"] == 0
+        assert result["bytes"] == sum(len(content) for content in files.values())
+
+        # the target directory can't be created below a missing parent: nothing is uploaded
+        result = upload_directory(str(local_dir), copy_url + "/missing/target", *credentials, progress=None,
+                                  session=dav_session)
+        assert result["done"] == 0 and result["failed"] == len(files)
+
+        # server side: the copy is complete, the moved source is gone
+        assert copy_webdav_resource(root_url, copy_url, *credentials, session=dav_session)
+        assert not copy_webdav_resource(root_url, copy_url, *credentials, session=dav_session)
+        assert move_webdav_resource(copy_url, moved_url, *credentials, session=dav_session)
+        assert get_webdav_file_content(copy_url + "/a.txt", *credentials, session=dav_session) is None
+
+        target = tmp_path / "target"
+        result = download_directory(moved_url, str(target), *credentials, workers=4, progress=None,
+                                    session=dav_session)
+        assert result["done"] == len(files) and result["failed"] == 0
+        assert {path: (target / path).read_bytes() for path in files} == files
+    finally:
+        delete_directory(root_url, *credentials, session=dav_session)
+        delete_directory(moved_url, *credentials, session=dav_session)
@@ -0,0 +1,185 @@
+"""
+Tests the chunked upload against a local stand-in for Nextcloud's chunked upload (v2) endpoint.
+
+These tests don't need a Nextcloud instance or a config.
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+import pytest
+
+from dav_functions import webdav
+from dav_functions.webdav import upload_file_to_webdav_chunked
+
+
+class ChunkedUploadServer(ThreadingHTTPServer):
+    """ Keeps uploaded chunks and assembled files in memory. """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ChunkedUploadHandler)
+        self.transfers = {}  # transfer path -> {chunk name: bytes}
+        self.files = {}  # file path -> bytes
+        self.requests = []  # (method, path)
+        self.fail_chunk_puts = set()  # chunk names that fail on their next PUT
+        self.broken_propfind = False  # answer PROPFIND with an HTML error page instead of a multistatus
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class ChunkedUploadHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _path(self):
+        return unquote(urlparse(self.path).path).rstrip("/")
+
+    def _reply(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _record(self):
+        with self.server.lock:
+            self.server.requests.append((self.command, self._path()))
+
+    def do_MKCOL(self):
+        self._record()
+        assert self.headers["Destination"]
+        with self.server.lock:
+            self.server.transfers.setdefault(self._path(), {})
+        self._reply(201)
+
+    def do_PROPFIND(self):
+        self._record()
+        self._body()
+        if self.server.broken_propfind:
+            return self._reply(207, b"<html><body>Internal error<br></body></html>")
+        chunks = self.server.transfers.get(self._path())
+        if chunks is None:
+            return self._reply(404)
+        responses = "".join(
+            f"<d:response><d:href>{self._path()}/{name}</d:href><d:propstat><d:prop>"
+            f"<d:getcontentlength>{len(data)}</d:getcontentlength></d:prop></d:propstat></d:response>"
+            for name, data in chunks.items()
+        )
+        body = f'<?xml version="1.0"?><d:multistatus xmlns:d="DAV:">' \
+               f'<d:response><d:href>{self._path()}/</d:href></d:response>{responses}</d:multistatus>'
+        self._reply(207, body.encode("utf-8"))
+
+    def do_PUT(self):
+        self._record()
+        transfer, name = self._path().rsplit("/", 1)
+        data = self._body()
+        with self.server.lock:
+            if name in self.server.fail_chunk_puts:
+                self.server.fail_chunk_puts.discard(name)
+                return self._reply(500)
+            if transfer not in self.server.transfers:
+                return self._reply(404)
+            assert self.headers["OC-Total-Length"]
+            self.server.transfers[transfer][name] = data
+        self._reply(201)
+
+    def do_MOVE(self):
+        self._record()
+        transfer = self._path()[:-len("/.file")]
+        total_length = int(self.headers["OC-Total-Length"])
+        with self.server.lock:
+            chunks = self.server.transfers.pop(transfer)
+            data = b"".join(chunks[name] for name in sorted(chunks, key=int))
+            if len(data) != total_length:
+                return self._reply(400)
+            self.server.files[urlparse(self.headers["Destination"]).path] = data
+        self._reply(201)
+
+
+@pytest.fixture
+def server():
+    server = ChunkedUploadServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # the stand-in server accepts chunks of any size, tiny ones keep the test files small
+    monkeypatch.setattr(webdav, "MIN_UPLOAD_CHUNK_SIZE", 1)
+
+
+@pytest.fixture
+def local_file(tmp_path):
+    path = tmp_path / "big_file.bin"
+    path.write_bytes(os.urandom(10 * 1000 + 123))
+    return path
+
+
+def upload(server, local_file, **kwargs):
+    return upload_file_to_webdav_chunked(
+        server.url + "/uploads/user",
+        server.url + "/files/user",
+        "user",
+        "password",
+        str(local_file),
+        "big_file.bin",
+        chunk_size=1000,
+        workers=4,
+        **kwargs)
+
+
+def chunk_puts(server):
+    return [path for method, path in server.requests if method == "PUT"]
+
+
+def test_chunked_upload(server, local_file):
+    assert upload(server, local_file)
+
+    assert server.files["/files/user/big_file.bin"] == local_file.read_bytes()
+    assert len(chunk_puts(server)) == 11
+    assert server.requests[-1][0] == "MOVE"
+    assert server.transfers == {}
+
+
+def test_chunked_upload_resumes_after_failure(server, local_file):
+    server.fail_chunk_puts = {"3", "7"}
+    assert not upload(server, local_file)
+    assert "/files/user/big_file.bin" not in server.files
+
+    server.requests.clear()
+    assert upload(server, local_file)
+
+    # only the chunks that failed before are uploaded again
+    assert sorted(path.rsplit("/", 1)[-1] for path in chunk_puts(server)) == ["3", "7"]
+    assert not any(method == "MKCOL" for method, path in server.requests)
+    assert server.files["/files/user/big_file.bin"] == local_file.read_bytes()
+
+
+def test_chunked_upload_with_explicit_transfer_id(server, local_file):
+    assert upload(server, local_file, transfer_id="my-transfer")
+
+    assert ("MKCOL", "/uploads/user/my-transfer") in server.requests
+    assert ("MOVE", "/uploads/user/my-transfer/.file") in server.requests
+    assert server.files["/files/user/big_file.bin"] == local_file.read_bytes()
+
+
+def test_chunked_upload_rejects_chunk_sizes_the_server_does_not_accept(server, local_file, monkeypatch):
+    monkeypatch.setattr(webdav, "MIN_UPLOAD_CHUNK_SIZE", 5 * 1024 * 1024)
+    assert not upload(server, local_file)
+    assert server.requests == []
+
+
+def test_chunked_upload_with_malformed_listing(server, local_file):
+    server.broken_propfind = True
+    assert upload(server, local_file) is False